@@ -1,5 +1,5 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from apscheduler.schedulers.background import BackgroundScheduler
 
@@ -13,72 +13,17 @@ from app.routes import prediction
 from app.routes import libreview
 from app.routes import health
 from app.routes import notifications
+from app.middleware.dependencies import require_metrics_token
 from app.services.reminder_service import (
     send_glucose_reminders,
     REMINDER_INTERVAL_HOURS,
 )
-
-AUTO_PREDICTION_INTERVAL_MINUTES = 30
-
-
-def run_auto_predictions():
-    """
-    Background job: run glucose prediction for every patient who has
-    recent readings (<6 h old). Sends push + saves notification if the
-    predicted or current value is out of range (high/low/patch_error).
-    Rate-limiting inside PredictionService prevents notification spam.
-    """
-    import threading
-    from app.config.firebase import db as _db
-    from app.services.prediction_service import prediction_service
-    from datetime import datetime, timezone, timedelta
-
-    cutoff = datetime.now(timezone.utc) - timedelta(hours=6)
-
-    try:
-        users = _db.collection("users").where("role", "==", "patient").stream()
-    except Exception as exc:
-        print(f"[AutoPredict] Failed to fetch users: {exc}")
-        return
-
-    for user_doc in users:
-        user_id = user_doc.id
-        data = user_doc.to_dict()
-
-        # Check for a recent reading before launching a heavy LSTM job
-        try:
-            recent = (
-                _db.collection("glucose_readings")
-                .where("userId", "==", user_id)
-                .order_by("measuredAt", direction="DESCENDING")
-                .limit(1)
-                .stream()
-            )
-            latest = next((d.to_dict() for d in recent), None)
-            if not latest:
-                continue
-            ts = latest.get("measuredAt")
-            if ts and hasattr(ts, "tzinfo"):
-                if ts.tzinfo is None:
-                    ts = ts.replace(tzinfo=timezone.utc)
-                if ts < cutoff:
-                    continue   # data too stale — skip to avoid pattern-only runs
-        except Exception:
-            continue
-
-        first = data.get("firstName", "")
-        last = data.get("lastName", "")
-        patient_name = f"{first} {last}".strip() or "Patient"
-        lang = data.get("language", "ar")
-
-        def _predict(uid=user_id, name=patient_name, lng=lang):
-            try:
-                prediction_service.predict(user_id=uid, patient_name=name, hours=1, lang=lng)
-                print(f"[AutoPredict] ✅ {uid}")
-            except Exception as e:
-                print(f"[AutoPredict] ⚠️ {uid}: {e}")
-
-        threading.Thread(target=_predict, daemon=True).start()
+from app.services.auto_prediction_service import auto_prediction_scheduler
+from app.services.leader_service import LeaderElector
+from app.services.shard_service import BATCH_SCHEDULING, shard_membership
+from app.services.input_watermark_service import watch_watermarks
+from app.services.push_service import push_client
+from app.services.notification_outbox import notification_outbox
 
 # ==========================================
 # Scheduler
@@ -87,6 +32,27 @@ def run_auto_predictions():
 _scheduler = BackgroundScheduler()
 
 
+def _start_batch_jobs() -> None:
+    _scheduler.resume()
+    auto_prediction_scheduler.start()
+    print(
+        f"[Scheduler] Glucose reminder job started "
+        f"(every {REMINDER_INTERVAL_HOURS}h)"
+    )
+    print("[Scheduler] Auto-prediction loop started (risk-adaptive cadence)")
+
+
+def _stop_batch_jobs() -> None:
+    _scheduler.pause()
+    auto_prediction_scheduler.stop()
+    print("[Scheduler] Batch jobs paused")
+
+
+# sharded: every worker runs the batch jobs for the patients it owns
+# leader:  only the worker holding the lease runs them, for all patients
+_leader = LeaderElector("batch_jobs", on_elected=_start_batch_jobs, on_demoted=_stop_batch_jobs)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     _scheduler.add_job(
@@ -96,25 +62,30 @@ async def lifespan(app: FastAPI):
         id="glucose_reminder",
         replace_existing=True,
     )
-    _scheduler.add_job(
-        run_auto_predictions,
-        "interval",
-        minutes=AUTO_PREDICTION_INTERVAL_MINUTES,
-        id="auto_prediction",
-        replace_existing=True,
-    )
-    _scheduler.start()
-    print(
-        f"[Scheduler] Glucose reminder job started "
-        f"(every {REMINDER_INTERVAL_HOURS}h)"
-    )
-    print(
-        f"[Scheduler] Auto-prediction job started "
-        f"(every {AUTO_PREDICTION_INTERVAL_MINUTES} min)"
-    )
+    _scheduler.start(paused=True)
+    watermark_watch = watch_watermarks()   # keeps the result cache in sync across workers
+    push_client.start()                    # receipt checks for this process's push tickets
+    notification_outbox.start()            # delivers queued alerts
+    if BATCH_SCHEDULING == "sharded":
+        shard_membership.start()
+        _start_batch_jobs()
+    else:
+        _leader.start()
     yield
+    if BATCH_SCHEDULING == "sharded":
+        _stop_batch_jobs()
+        shard_membership.stop()
+    else:
+        _leader.stop()
     _scheduler.shutdown(wait=False)
     print("[Scheduler] Shutdown")
+    if watermark_watch is not None:
+        watermark_watch.unsubscribe()
+    notification_outbox.stop()
+    push_client.stop()
+
+    from app.services.prediction_executor import prediction_executor
+    prediction_executor.shutdown()
 
 # ==========================================
 # FastAPI Application
@@ -172,3 +143,17 @@ def health_check():
         "status": "healthy",
         "service": "DiaConnect Family Backend",
     }
+
+
+@app.get("/metrics/prediction", dependencies=[Depends(require_metrics_token)])
+def prediction_metrics():
+    """Prediction queue depth and wait times per lane (interactive / batch)."""
+    from app.services.prediction_executor import prediction_executor
+    return prediction_executor.metrics()
+
+
+@app.get("/metrics/admission", dependencies=[Depends(require_metrics_token)])
+def admission_metrics():
+    """In-flight requests and rejections per admission-controlled route group."""
+    from app.middleware.admission import gates
+    return {group: gate.metrics() for group, gate in gates.items()}
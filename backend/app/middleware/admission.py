@@ -0,0 +1,147 @@
+"""
+Admission control for the expensive endpoints.
+
+/glucose/predict*, /libreview/sync and /glucose/import-csv can each take
+seconds of CPU or upstream I/O.  Every route group has an AdmissionGate:
+
+  - a per-user token bucket (RATE_PER_MINUTE, BURST) → 429 when empty
+  - a cap on requests in flight in the group (MAX_IN_FLIGHT) → 503 when full
+
+Both answers carry Retry-After, so a burst is shed right away instead of
+piling up in the threadpool and stalling the cheap endpoints.
+
+Usage:  @router.get(..., dependencies=[Depends(admit("predict"))])
+Limits: ADMISSION_<GROUP>_MAX_IN_FLIGHT / _RATE_PER_MINUTE / _BURST
+"""
+
+import math
+import os
+import threading
+import time
+
+from fastapi import Depends, HTTPException, status
+from app.middleware.dependencies import get_current_user
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+
+# group → (max in flight, requests per minute per user, burst)
+ADMISSION_DEFAULTS = {
+    "predict":        (16, 30, 10),
+    "libreview_sync": (4,  2,  3),
+    "csv_import":     (2,  2,  3),
+}
+BUCKET_GC_SIZE = 10_000   # prune full buckets when this many users are tracked
+
+
+def _limit(group: str, name: str, default: float) -> float:
+    return float(os.getenv(f"ADMISSION_{group.upper()}_{name}", default))
+
+
+# ==========================================
+# Gate
+# ==========================================
+
+class AdmissionGate:
+    """Token buckets per user plus an in-flight cap for one route group."""
+
+    def __init__(self, name: str, max_in_flight: int, rate_per_minute: float, burst: float):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.rate = rate_per_minute / 60.0   # tokens per second
+        self.burst = burst
+        self.in_flight = 0
+        self.rejected = {"rate_limited": 0, "overloaded": 0}
+        self._buckets: dict[str, tuple[float, float]] = {}   # user → (tokens, at)
+        self._avg_seconds = 1.0   # EWMA of request duration, for Retry-After
+        self._lock = threading.Lock()
+
+    def _take_token(self, user_id: str, now: float) -> float:
+        """0 when a token was taken, else seconds until the next one (caller holds the lock)."""
+        tokens, at = self._buckets.get(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - at) * self.rate)
+        if tokens < 1:
+            self._buckets[user_id] = (tokens, now)
+            return (1 - tokens) / self.rate if self.rate > 0 else 60.0
+        self._buckets[user_id] = (tokens - 1, now)
+        if len(self._buckets) > BUCKET_GC_SIZE:
+            refill = self.burst / self.rate if self.rate > 0 else 0
+            self._buckets = {
+                uid: (t, a) for uid, (t, a) in self._buckets.items() if now - a < refill
+            }
+        return 0.0
+
+    def enter(self, user_id: str) -> None:
+        """Admit one request or raise 429 / 503 with Retry-After."""
+        now = time.monotonic()
+        with self._lock:
+            wait = self._take_token(user_id, now)
+            if wait > 0:
+                self.rejected["rate_limited"] += 1
+                raise self._reject(status.HTTP_429_TOO_MANY_REQUESTS, wait,
+                                   "Too many requests, please try again later")
+            if self.in_flight >= self.max_in_flight:
+                self.rejected["overloaded"] += 1
+                # Give the token back: the request was not served
+                tokens, at = self._buckets[user_id]
+                self._buckets[user_id] = (min(self.burst, tokens + 1), at)
+                raise self._reject(status.HTTP_503_SERVICE_UNAVAILABLE, self._avg_seconds,
+                                   "Server is busy, please try again shortly")
+            self.in_flight += 1
+
+    def leave(self, seconds: float) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * seconds
+
+    def _reject(self, code: int, retry_after: float, detail: str) -> HTTPException:
+        print(f"⚠️ [Admission] {self.name}: {code} (in flight {self.in_flight})")
+        return HTTPException(
+            status_code=code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight":     self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "rejected":      dict(self.rejected),
+                "avg_seconds":   round(self._avg_seconds, 2),
+            }
+
+
+gates = {
+    group: AdmissionGate(
+        group,
+        max_in_flight=int(_limit(group, "MAX_IN_FLIGHT", max_in_flight)),
+        rate_per_minute=_limit(group, "RATE_PER_MINUTE", rate),
+        burst=_limit(group, "BURST", burst),
+    )
+    for group, (max_in_flight, rate, burst) in ADMISSION_DEFAULTS.items()
+}
+
+
+# ==========================================
+# Dependency
+# ==========================================
+
+def admit(group: str):
+    """
+    Returns a dependency that holds a slot of the group's gate for the
+    whole request.  Usage: dependencies=[Depends(admit("predict"))]
+    """
+    gate = gates[group]
+
+    async def admission(current_user: dict = Depends(get_current_user)):
+        if not ADMISSION_ENABLED:
+            yield
+            return
+        gate.enter(current_user["sub"])
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            gate.leave(time.monotonic() - started)
+
+    return admission
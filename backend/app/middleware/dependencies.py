@@ -1,10 +1,15 @@
-from fastapi import Depends, HTTPException, status
+import os
+import secrets
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.utils.security import verify_token
 
 # Tells FastAPI to expect a Bearer token in the request header
 security = HTTPBearer()
 
+# Shared secret for internal endpoints (metrics); unset → those endpoints are off
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security)
@@ -41,3 +46,15 @@ def require_role(role: str):
             )
         return current_user
     return role_checker
+
+
+def require_metrics_token(x_metrics_token: str = Header(default="")) -> None:
+    """
+    Restricts operational endpoints (/metrics/*) to internal callers that
+    send the X-Metrics-Token header.  Answers 404 when METRICS_TOKEN is not
+    configured, so the endpoints are not exposed by default.
+    """
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not secrets.compare_digest(x_metrics_token, METRICS_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid metrics token")
@@ -38,6 +38,29 @@ class PatternPrediction(BaseModel):
     variability:  Optional[str]  = None   # stable / unstable
 
 
+# ==========================================
+# Fine-tuning Metadata
+# ==========================================
+
+class TrainingInfo(BaseModel):
+    """
+    How the patient model behind an LSTM prediction was obtained.
+
+    source        : 'full_refit' / 'incremental' (trained for this request),
+                    'stored' (fine-tuned model reused) or 'cache' (trajectory reused).
+    epochs        : epochs actually run by the last fine-tune (early stopping /
+                    time budget may end it before the configured maximum).
+    batch_size    : batch size chosen for the dataset size.
+    seconds       : wall-clock time of the last fine-tune.
+    """
+    source:        str
+    mode:          Optional[str]   = None   # head / full
+    epochs:        Optional[int]   = None
+    batch_size:    Optional[int]   = None
+    seconds:       Optional[float] = None
+    stopped_early: Optional[bool]  = None
+
+
 # ==========================================
 # Prediction Response Model
 # ==========================================
@@ -59,6 +82,13 @@ class PredictionResponse(BaseModel):
         How today's LSTM prediction compares to the historical average.
         'above_normal' / 'below_normal' / 'within_normal'.
         Included in real_time / hybrid modes (used by Groq for richer advice).
+
+    training:
+        Fine-tuning metadata of the model used (real_time / hybrid only).
+
+    cached:
+        True when served from the result cache (no new readings, meals,
+        activity or insulin since the result was computed).
     """
     predicted_value:           Optional[float] = None
     hours:                     int             = 1
@@ -75,3 +105,34 @@ class PredictionResponse(BaseModel):
     prediction_mode:           str             = "none"
     pattern_prediction:        Optional[PatternPrediction] = None
     comparison_to_pattern:     Optional[str]   = None
+    training:                  Optional[TrainingInfo] = None
+    cached:                    bool            = False
+
+
+# ==========================================
+# Trajectory Response Model
+# ==========================================
+
+class TrajectoryPoint(BaseModel):
+    """Predicted glucose `hours` ahead (ensemble + insulin adjusted)."""
+    hours:           int
+    predicted_value: float
+    trend:           str   # rising / falling / stable
+
+
+class TrajectoryResponse(BaseModel):
+    """
+    Response shape for GET /glucose/predict/trajectory.
+
+    points: one entry per hour (1–24), all taken from a single LSTM rollout.
+    Empty when prediction_mode is 'pattern' or 'none'.
+    sigma:  validation RMSE of the patient's fine-tuned model (mg/dL).
+    """
+    prediction_mode:           str             = "none"
+    current_value:             Optional[float] = None
+    sigma:                     Optional[float] = None
+    readings_used:             int             = 0
+    data_stale:                bool            = False
+    hours_since_last_reading:  Optional[float] = None
+    points:                    list[TrajectoryPoint] = []
+    training:                  Optional[TrainingInfo] = None
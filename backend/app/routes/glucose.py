@@ -5,6 +5,7 @@ from datetime import datetime, timezone, timedelta
 from fastapi import (
     APIRouter, Depends, File, HTTPException, UploadFile, status, Response
 )
+from app.middleware.admission import admit
 from app.middleware.dependencies import get_current_user, require_role
 from app.models.glucose_reading import (
     GlucoseCreate, GlucoseResponse, GlucoseStatsResponse
@@ -187,7 +188,7 @@ def delete_glucose_reading(
 # POST /glucose/import-csv
 # ==========================================
 
-@router.post("/import-csv")
+@router.post("/import-csv", dependencies=[Depends(admit("csv_import"))])
 async def import_glucose_csv(
     file: UploadFile = File(...),
     current_user: dict = Depends(require_role("patient")),
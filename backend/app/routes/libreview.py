@@ -1,11 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from app.middleware.admission import admit
 from app.middleware.dependencies import require_role
 from app.models.libreview import SyncRequest, SyncResponse
 from app.services import libreview_service
 from app.services.glucose_service import glucose_service
 from app.services.alert_service import alert_service
-from app.services.family_service import send_emergency_notification
-from app.config.firebase import db as _db
+from app.services.notification_outbox import notification_outbox
 
 
 router = APIRouter(prefix="/libreview", tags=["LibreView Sync"])
@@ -15,7 +15,8 @@ router = APIRouter(prefix="/libreview", tags=["LibreView Sync"])
 # POST /libreview/sync
 # ==========================================
 
-@router.post("/sync", response_model=SyncResponse)
+@router.post("/sync", response_model=SyncResponse,
+             dependencies=[Depends(admit("libreview_sync"))])
 def sync_libreview(
     body: SyncRequest,
     current_user: dict = Depends(require_role("patient"))
@@ -30,6 +31,8 @@ def sync_libreview(
       4. Save new readings to Firestore as source='libreview'.
       5. Skip any reading whose timestamp already exists (deduplication).
       6. Trigger alert evaluation for every new reading saved.
+      7. Queue one emergency notification for all dangerous readings
+         of the sync, not one per reading.
 
     Credentials are used only during this request and are never stored.
 
@@ -68,8 +71,7 @@ def sync_libreview(
     # ── Step 4 & 5: save to Firestore, skip duplicates ───────────
     imported = 0
     skipped = 0
-
-    patient_name = None
+    dangerous: list[tuple] = []   # (measuredAt, value) of readings that raised an alert
 
     for r in readings:
         saved = glucose_service.create_reading_from_import(
@@ -85,29 +87,30 @@ def sync_libreview(
                 reading_id=saved["id"],
                 value=saved["value"],
             )
-            # ── Step 7: push notification if alert was created ───
             if alert:
-                try:
-                    if patient_name is None:
-                        pdoc = _db.collection("users").document(user_id).get()
-                        if pdoc.exists:
-                            pdata = pdoc.to_dict()
-                            patient_name = (
-                                f"{pdata.get('firstName', '')} {pdata.get('lastName', '')}".strip()
-                                or pdata.get("email", "Patient")
-                            )
-                        else:
-                            patient_name = "Patient"
-                    send_emergency_notification(
-                        patient_id=user_id,
-                        patient_name=patient_name,
-                        glucose_value=saved["value"],
-                    )
-                except Exception as e:
-                    print(f"⚠️ LibreView notification error: {e}")
+                dangerous.append((r["measuredAt"], saved["value"]))
         else:
             skipped += 1
 
+    # ── Step 7: one notification per recipient for the whole sync ─
+    if dangerous:
+        values = [value for _, value in sorted(dangerous, key=lambda d: d[0])]
+        try:
+            if len(values) == 1:
+                notification_outbox.enqueue(
+                    "emergency", user_id,
+                    patient_name=None,   # looked up by the dispatcher
+                    glucose_value=values[0],
+                )
+            else:
+                notification_outbox.enqueue(
+                    "emergency_digest", user_id,
+                    patient_name=None,
+                    glucose_values=values,
+                )
+        except Exception as e:
+            print(f"⚠️ LibreView notification error: {e}")
+
     return SyncResponse(
         imported_count=imported,
         skipped_count=skipped,
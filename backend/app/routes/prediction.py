@@ -1,7 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from starlette.concurrency import run_in_threadpool
+from app.middleware.admission import admit
 from app.middleware.dependencies import get_current_user, require_role
-from app.models.prediction import PredictionResponse
-from app.services.prediction_service import prediction_service
+from app.models.prediction import PredictionResponse, TrajectoryResponse
+from app.services.input_watermark_service import current_watermark
+from app.services.prediction_cache import prediction_result_cache
+from app.services.prediction_executor import prediction_executor
 from app.config.firebase import db
 
 
@@ -28,12 +32,33 @@ def _get_patient_name(user_id: str) -> str:
     return "المريض"
 
 
+async def _predict(user_id: str, hours: int, lang: str) -> dict:
+    """
+    predict() through the result cache.  On a miss the job runs on the
+    patient's worker; the patient name is only looked up then.
+    """
+    cached = prediction_result_cache.get(user_id, hours, lang)
+    if cached is not None:
+        return cached
+    watermark = current_watermark(user_id)
+    result = await prediction_executor.run(
+        "predict",
+        user_id=user_id,
+        patient_name=await run_in_threadpool(_get_patient_name, user_id),
+        hours=hours,
+        lang=lang,
+    )
+    prediction_result_cache.put(user_id, hours, lang, watermark, result)
+    return {**result, "cached": False}
+
+
 # ==========================================
 # GET /glucose/predict  (patient)
 # ==========================================
 
-@router.get("/predict", response_model=PredictionResponse)
-def predict_glucose(
+@router.get("/predict", response_model=PredictionResponse,
+            dependencies=[Depends(admit("predict"))])
+async def predict_glucose(
     hours: int = 1,
     lang: str = "ar",
     current_user: dict = Depends(require_role("patient")),
@@ -41,15 +66,11 @@ def predict_glucose(
     """
     Predict the patient's own glucose using a multi-variate LSTM model.
     Returns predicted value, trend, alert type, and AI advice for patient + family.
+    Served from the result cache until new data arrives; otherwise runs on
+    the patient's prediction worker process.
     """
     lang = _validate_params(hours, lang)
-    user_id = current_user["sub"]
-    result = prediction_service.predict(
-        user_id=user_id,
-        patient_name=_get_patient_name(user_id),
-        hours=hours,
-        lang=lang,
-    )
+    result = await _predict(current_user["sub"], hours, lang)
     return PredictionResponse(**result)
 
 
@@ -57,8 +78,9 @@ def predict_glucose(
 # GET /glucose/predict/family  (family member)
 # ==========================================
 
-@router.get("/predict/family", response_model=PredictionResponse)
-def predict_glucose_for_family(
+@router.get("/predict/family", response_model=PredictionResponse,
+            dependencies=[Depends(admit("predict"))])
+async def predict_glucose_for_family(
     patient_id: str,
     hours: int = 1,
     lang: str = "ar",
@@ -72,14 +94,18 @@ def predict_glucose_for_family(
 
     # Verify the family member is actually linked to this patient
     family_member_id = current_user["sub"]
-    try:
+
+    def _is_linked() -> bool:
         links = (
             db.collection("family_patient_links")
             .where("family_member_id", "==", family_member_id)
             .where("patient_id", "==", patient_id)
             .stream()
         )
-        if not any(True for _ in links):
+        return any(True for _ in links)
+
+    try:
+        if not await run_in_threadpool(_is_linked):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Not linked to this patient",
@@ -92,10 +118,24 @@ def predict_glucose_for_family(
             detail="Could not verify family link",
         )
 
-    result = prediction_service.predict(
-        user_id=patient_id,
-        patient_name=_get_patient_name(patient_id),
-        hours=hours,
-        lang=lang,
-    )
+    result = await _predict(patient_id, hours, lang)
     return PredictionResponse(**result)
+
+
+# ==========================================
+# GET /glucose/predict/trajectory  (patient)
+# ==========================================
+
+@router.get("/predict/trajectory", response_model=TrajectoryResponse,
+            dependencies=[Depends(admit("predict"))])
+async def predict_glucose_trajectory(
+    current_user: dict = Depends(require_role("patient")),
+):
+    """
+    Return the patient's full 1–24 hour prediction curve.
+    Computed by the same LSTM rollout that serves /predict, so it costs
+    nothing extra once any horizon has been requested.
+    """
+    result = await prediction_executor.run(
+        "predict_trajectory", user_id=current_user["sub"])
+    return TrajectoryResponse(**result)
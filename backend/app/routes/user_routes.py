@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from firebase_admin import firestore
 from app.middleware.dependencies import get_current_user, require_role
+from app.services.input_watermark_service import bump_input_watermark
+from app.services.recipient_cache import recipient_cache
 
 router = APIRouter(prefix="/users", tags=["User Profile"])
 db = firestore.client()
@@ -74,6 +76,7 @@ async def update_my_profile(
 
     update_data["updatedAt"] = firestore.SERVER_TIMESTAMP
     db.collection("users").document(user_id).update(update_data)
+    recipient_cache.invalidate_user(user_id)   # name / language shown in alerts
     return get_user_doc(user_id)
 
 
@@ -121,6 +124,7 @@ async def update_lifestyle_info(
         "lifestyle": request,
         "updatedAt": firestore.SERVER_TIMESTAMP
     })
+    bump_input_watermark(user_id)   # sleep / activity baselines are prediction inputs
     return get_user_doc(user_id)
 
 
@@ -277,4 +281,5 @@ async def update_push_token(
         "pushToken": token,
         "updatedAt": firestore.SERVER_TIMESTAMP,
     })
+    recipient_cache.invalidate_user(user_id)
     return {"message": "Push token saved"}
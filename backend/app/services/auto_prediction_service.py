@@ -0,0 +1,416 @@
+"""
+Auto-prediction scheduler.
+
+Runs a 1 h prediction for patients with a recent reading, so out-of-range
+forecasts reach the family even when nobody opens the app.
+
+Cadence is per patient and risk-adaptive: one loop thread keeps a
+priority queue of (next due time, patient).  The next due time comes from
+the risk tier of the patient's last prediction — an alert means the
+patient is looked at again within minutes, a stable patient in range
+only every few hours (AUTO_PREDICTION_CADENCE_MINUTES).
+
+Runs are change-driven: when a patient comes due, the LSTM pipeline only
+runs if new inputs arrived since the last prediction (the input watermark
+moved on) or the last result is older than
+AUTO_PREDICTION_RESULT_TTL_MINUTES; otherwise the patient is just
+rescheduled.  Watermarks are re-scanned every
+AUTO_PREDICTION_REFRESH_MINUTES to pick up new patients and inputs.
+
+The patients due together run as one batch on the prediction worker
+processes: at most AUTO_PREDICTION_CONCURRENCY jobs in flight,
+AUTO_PREDICTION_PATIENT_TIMEOUT_SECONDS per patient and a batch deadline
+of AUTO_PREDICTION_RUN_DEADLINE_MINUTES.  Jobs go to the executor's
+batch lane and only use the capacity interactive requests leave free;
+while there is none the batch backs off.  The loop starts the next batch
+only after the previous one finished.
+
+With BATCH_SCHEDULING=sharded every node runs this loop for the patients
+it owns (see shard_service) and re-scans ownership when members change.
+"""
+
+import heapq
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime, timezone
+
+from app.config.firebase import db
+from app.services.input_watermark_service import (
+    current_watermark, load_watermarks, record_prediction,
+)
+from app.services.prediction_cache import prediction_result_cache
+from app.services.prediction_executor import PREDICTION_WORKERS, prediction_executor
+from app.services.shard_service import shard_membership
+
+USERS_COLLECTION = "users"
+
+AUTO_PREDICTION_RECENT_HOURS = 6
+AUTO_PREDICTION_REFRESH_MINUTES = float(os.getenv("AUTO_PREDICTION_REFRESH_MINUTES", 5))
+AUTO_PREDICTION_RESULT_TTL_MINUTES = float(os.getenv("AUTO_PREDICTION_RESULT_TTL_MINUTES", 60))
+AUTO_PREDICTION_CONCURRENCY = int(os.getenv("AUTO_PREDICTION_CONCURRENCY", PREDICTION_WORKERS))
+AUTO_PREDICTION_PATIENT_TIMEOUT_SECONDS = float(os.getenv("AUTO_PREDICTION_PATIENT_TIMEOUT_SECONDS", 120))
+AUTO_PREDICTION_RUN_DEADLINE_MINUTES = float(os.getenv("AUTO_PREDICTION_RUN_DEADLINE_MINUTES", 10))
+AUTO_PREDICTION_BACKOFF_SECONDS = float(os.getenv("AUTO_PREDICTION_BACKOFF_SECONDS", 1))
+
+# Minutes until a patient is looked at again, by risk tier of the last prediction
+AUTO_PREDICTION_CADENCE_MINUTES = {
+    "urgent":   5,     # alert raised (low / high / patch_error)
+    "elevated": 15,    # ±sigma band crosses 70 / 180, or a fast trend
+    "moderate": 60,    # in range, but poor time in range
+    "stable":   180,   # in range, steady, good time in range
+}
+FAST_TREND_MG_PER_HOUR = 30
+LOW_TIME_IN_RANGE = 0.7
+
+
+# ==========================================
+# Risk Tier
+# ==========================================
+
+def risk_tier(result: dict | None) -> str:
+    """Cadence tier from a predict() result (its alert_type and `risk` block)."""
+    if not result or result.get("predicted_value") is None:
+        return "stable"   # no LSTM prediction: too few or too old readings
+    if result.get("alert_type"):
+        return "urgent"
+
+    risk = result.get("risk") or {}
+    predicted = result["predicted_value"]
+    sigma = risk.get("sigma") or 0.0
+    if predicted - sigma < 70 or predicted + sigma > 180:
+        return "elevated"
+    if abs(risk.get("slope_per_hour") or 0.0) >= FAST_TREND_MG_PER_HOUR:
+        return "elevated"
+
+    tir = risk.get("time_in_range")
+    if tir is not None and tir < LOW_TIME_IN_RANGE:
+        return "moderate"
+    return "stable"
+
+
+# ==========================================
+# Candidate Patients
+# ==========================================
+
+def _needs_prediction(mark: dict, now_epoch: float) -> str | None:
+    """
+    Why this patient should be re-predicted ("changed" / "expired"),
+    or None.  Patients whose newest reading is older than
+    AUTO_PREDICTION_RECENT_HOURS are never picked (pattern-only runs).
+    """
+    last_reading = mark.get("lastReadingEpoch")
+    if last_reading is None or last_reading < now_epoch - AUTO_PREDICTION_RECENT_HOURS * 3600:
+        return None
+    if mark.get("version") != mark.get("predictedVersion"):
+        return "changed"
+    if mark.get("predictedEpoch", 0) <= now_epoch - AUTO_PREDICTION_RESULT_TTL_MINUTES * 60:
+        return "expired"
+    return None
+
+
+def _patient_job(user_id: str, data: dict, mark: dict) -> dict:
+    first = data.get("firstName", "")
+    last = data.get("lastName", "")
+    return {
+        "user_id":      user_id,
+        "patient_name": f"{first} {last}".strip() or "Patient",
+        "lang":         data.get("language", "ar"),
+        "version":      mark.get("version"),
+    }
+
+
+def _patient_jobs(selected: dict[str, dict]) -> list[dict]:
+    """Jobs for the selected patients (one get_all for their user docs)."""
+    if not selected:
+        return []
+    refs = [db.collection(USERS_COLLECTION).document(uid) for uid in selected]
+    jobs = []
+    for user_doc in db.get_all(refs):
+        data = user_doc.to_dict() if user_doc.exists else None
+        if not data or data.get("role") != "patient":
+            continue
+        jobs.append(_patient_job(user_doc.id, data, selected[user_doc.id]))
+    return jobs
+
+
+# ==========================================
+# Batch Run
+# ==========================================
+
+def _new_summary() -> dict:
+    return {
+        "due":               0,   # patients that came due this tick
+        "submitted":         0,
+        "succeeded":         0,
+        "failed":            0,
+        "timed_out":         0,
+        "changed":           0,   # new readings / meals / activity / insulin since last run
+        "expired":           0,   # unchanged, but the last result is older than the TTL
+        "skipped_unchanged": 0,   # up to date, or no reading in AUTO_PREDICTION_RECENT_HOURS
+        "skipped_deadline":  0,   # not started / abandoned when the batch deadline hit
+        "backoffs":          0,   # waits for capacity held by interactive requests
+        "duration_s":        0.0,
+        "patient_avg_s":     None,
+        "patient_max_s":     None,
+    }
+
+
+def _run_batch(jobs: list[dict], summary: dict) -> dict[str, dict | None]:
+    """
+    Run the jobs on the prediction executor with bounded concurrency, a
+    per-patient timeout and a batch deadline.  Returns user id → predict()
+    result (None when failed or timed out); patients abandoned at the
+    deadline are missing.
+    """
+    started = time.monotonic()
+    deadline = started + AUTO_PREDICTION_RUN_DEADLINE_MINUTES * 60
+    durations: list[float] = []
+    results: dict[str, dict | None] = {}
+
+    pending = iter(jobs)
+    in_flight: dict = {}   # Future → job
+
+    exhausted = False
+    while True:
+        now = time.monotonic()
+
+        # ── Fill the capacity interactive requests leave free ──────────
+        capacity = prediction_executor.batch_capacity(AUTO_PREDICTION_CONCURRENCY)
+        while not exhausted and now < deadline and len(in_flight) < capacity:
+            job = next(pending, None)
+            if job is None:
+                exhausted = True
+                break
+            future = prediction_executor.submit(
+                "predict", job["user_id"], lane="batch",
+                patient_name=job["patient_name"], hours=1, lang=job["lang"],
+            )
+            job["submitted_at"] = time.monotonic()
+            job["watermark"] = current_watermark(job["user_id"])
+            in_flight[future] = job
+            summary["submitted"] += 1
+
+        if not in_flight:
+            if exhausted:
+                break
+            if now >= deadline:
+                summary["skipped_deadline"] += sum(1 for _ in pending)
+                break
+            # ── Back off: every worker is serving interactive requests ─
+            summary["backoffs"] += 1
+            time.sleep(min(AUTO_PREDICTION_BACKOFF_SECONDS, deadline - now))
+            continue
+
+        # ── Batch deadline: abandon everything still queued or running ─
+        if now >= deadline:
+            for future in in_flight:
+                future.cancel()
+            summary["skipped_deadline"] += len(in_flight) + sum(1 for _ in pending)
+            print(f"[AutoPredict] ⏱️ batch deadline reached, "
+                  f"{len(in_flight)} job(s) abandoned")
+            break
+
+        next_expiry = (min(job["submitted_at"] for job in in_flight.values())
+                       + AUTO_PREDICTION_PATIENT_TIMEOUT_SECONDS)
+        done, _ = wait(
+            list(in_flight), timeout=max(0.0, min(next_expiry, deadline) - now),
+            return_when=FIRST_COMPLETED,
+        )
+
+        now = time.monotonic()
+        for future in done:
+            job = in_flight.pop(future)
+            user_id, t0 = job["user_id"], job["submitted_at"]
+            durations.append(now - t0)
+            exc = future.exception()
+            if exc is None:
+                summary["succeeded"] += 1
+                results[user_id] = future.result()
+                # Served to the app too, until the patient's data changes
+                prediction_result_cache.put(
+                    user_id, 1, job["lang"], job["watermark"], results[user_id])
+                print(f"[AutoPredict] ✅ {user_id} ({now - t0:.1f}s)")
+                try:
+                    record_prediction(user_id, job["version"], datetime.now(timezone.utc))
+                except Exception as e:
+                    print(f"[AutoPredict] ⚠️ {user_id}: could not record watermark: {e}")
+            else:
+                summary["failed"] += 1
+                results[user_id] = None
+                print(f"[AutoPredict] ⚠️ {user_id}: {exc}")
+
+        # ── Per-patient timeout: stop waiting, free the slot ───────────
+        for future, job in list(in_flight.items()):
+            user_id, t0 = job["user_id"], job["submitted_at"]
+            if now - t0 >= AUTO_PREDICTION_PATIENT_TIMEOUT_SECONDS:
+                future.cancel()   # only effective while still queued
+                del in_flight[future]
+                summary["timed_out"] += 1
+                results[user_id] = None
+                print(f"[AutoPredict] ⏱️ {user_id} timed out after {now - t0:.0f}s")
+
+    summary["duration_s"] = round(time.monotonic() - started, 1)
+    if durations:
+        summary["patient_avg_s"] = round(sum(durations) / len(durations), 2)
+        summary["patient_max_s"] = round(max(durations), 2)
+    return results
+
+
+# ==========================================
+# Scheduler
+# ==========================================
+
+class AutoPredictionScheduler:
+    """
+    Priority-queue loop over the patients with an input watermark that
+    this node owns (shard_membership).  tick() does one scheduling step;
+    start() runs it on a daemon thread until stop().
+    """
+
+    def __init__(self):
+        self._queue: list[tuple[float, str]] = []   # heap of (due epoch, user id)
+        self._due: dict[str, float] = {}            # live entry per patient
+        self._tier: dict[str, str] = {}
+        self._marks: dict[str, dict] = {}
+        self._marks_epoch = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _schedule(self, user_id: str, due: float) -> None:
+        # Re-scheduling leaves the old heap entry behind; _pop_due skips it
+        self._due[user_id] = due
+        heapq.heappush(self._queue, (due, user_id))
+
+    def _cadence_seconds(self, user_id: str) -> float:
+        return AUTO_PREDICTION_CADENCE_MINUTES[self._tier.get(user_id, "moderate")] * 60
+
+    def _refresh(self, now: float) -> None:
+        """
+        Re-scan the watermarks of the patients this node owns.  Patients
+        seen for the first time are due now; patients handed to another
+        node are dropped (their heap entries are skipped by _pop_due).
+        """
+        self._marks_epoch = now   # a failed scan is retried at the next refresh
+        self._marks = {
+            uid: mark for uid, mark in load_watermarks().items()
+            if shard_membership.owns(uid)
+        }
+        for user_id in list(self._due):
+            if user_id not in self._marks:
+                del self._due[user_id]
+                self._tier.pop(user_id, None)
+        for user_id in self._marks:
+            if user_id not in self._due:
+                self._schedule(user_id, now)
+
+    def rebalance(self) -> None:
+        """Shard membership changed: re-scan ownership on the next tick, now."""
+        self._marks_epoch = 0.0
+        self._wake.set()
+
+    def _pop_due(self, now: float) -> list[str]:
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            at, user_id = heapq.heappop(self._queue)
+            if self._due.get(user_id) == at:
+                del self._due[user_id]
+                due.append(user_id)
+        return due
+
+    def next_wakeup(self) -> float:
+        """Epoch of the next queued patient or watermark refresh, whichever is first."""
+        refresh_at = self._marks_epoch + AUTO_PREDICTION_REFRESH_MINUTES * 60
+        return min(self._queue[0][0], refresh_at) if self._queue else refresh_at
+
+    def tick(self, now: float | None = None) -> dict | None:
+        """
+        One scheduling step: refresh the watermarks when due, run the
+        patients whose time has come and reschedule them by risk tier.
+        Returns the batch summary, or None when nobody was due or a tick
+        is already running.
+        """
+        if not self._lock.acquire(blocking=False):
+            print("[AutoPredict] previous batch still in progress — skipping")
+            return None
+        try:
+            now = now if now is not None else time.time()
+            if now >= self._marks_epoch + AUTO_PREDICTION_REFRESH_MINUTES * 60:
+                self._refresh(now)
+            due = self._pop_due(now)
+            if not due:
+                return None
+
+            summary = _new_summary()
+            summary["due"] = len(due)
+            selected = {}
+            for user_id in due:
+                mark = self._marks.get(user_id)
+                if mark is None:
+                    continue   # watermark gone (account deleted)
+                reason = _needs_prediction(mark, now)
+                if reason is None:
+                    summary["skipped_unchanged"] += 1
+                    self._schedule(user_id, now + self._cadence_seconds(user_id))
+                else:
+                    summary[reason] += 1
+                    selected[user_id] = mark
+
+            jobs = _patient_jobs(selected)
+            for user_id in set(selected) - {job["user_id"] for job in jobs}:
+                self._tier[user_id] = "stable"   # not a patient (any more)
+                self._schedule(user_id, now + self._cadence_seconds(user_id))
+
+            results = _run_batch(jobs, summary)
+            finished = time.time()
+            for job in jobs:
+                user_id = job["user_id"]
+                if user_id not in results:
+                    self._schedule(user_id, finished)   # abandoned at the deadline
+                    continue
+                if results[user_id] is not None:
+                    self._tier[user_id] = risk_tier(results[user_id])
+                    self._marks[user_id].update(
+                        predictedVersion=job["version"], predictedEpoch=finished)
+                self._schedule(user_id, finished + self._cadence_seconds(user_id))
+
+            summary["tiers"] = dict(Counter(self._tier.get(uid, "moderate") for uid in self._due))
+            print(f"[AutoPredict] batch summary: {summary}")
+            return summary
+        finally:
+            self._lock.release()
+
+    # ==========================================
+    # Loop Thread
+    # ==========================================
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as exc:
+                print(f"[AutoPredict] ⚠️ tick failed: {exc}")
+            self._wake.wait(max(1.0, self.next_wakeup() - time.time()))
+            self._wake.clear()
+
+    def start(self) -> None:
+        self._stop.clear()
+        if self._thread and self._thread.is_alive():
+            return   # stopped, but still finishing its batch: keep looping
+        self._thread = threading.Thread(
+            target=self._loop, name="auto-prediction", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+auto_prediction_scheduler = AutoPredictionScheduler()
+shard_membership.on_rebalance(auto_prediction_scheduler.rebalance)
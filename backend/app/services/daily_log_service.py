@@ -1,6 +1,7 @@
 from datetime import datetime, timezone, timedelta
 from firebase_admin import firestore
 from app.models.daily_log import MealCreate, ActivityCreate, SleepCreate
+from app.services.input_watermark_service import bump_input_watermark
 
 
 # ==========================================
@@ -38,6 +39,7 @@ class DailyLogService:
         }
 
         doc_ref.set(meal)
+        bump_input_watermark(user_id)
         meal["id"] = doc_ref.id
         return meal
 
@@ -62,6 +64,7 @@ class DailyLogService:
         }
 
         doc_ref.set(activity)
+        bump_input_watermark(user_id)
         activity["id"] = doc_ref.id
         return activity
 
@@ -86,6 +89,7 @@ class DailyLogService:
         }
 
         doc_ref.set(sleep)
+        bump_input_watermark(user_id)
         sleep["id"] = doc_ref.id
         return sleep
 
@@ -110,6 +114,7 @@ class DailyLogService:
             return False
 
         doc_ref.delete()
+        bump_input_watermark(user_id)
         return True
 
     def delete_meal(self, user_id: str, meal_id: str) -> bool:
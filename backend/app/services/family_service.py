@@ -1,9 +1,9 @@
-import json as json_lib
 import random
 import string
-import urllib.request
 from datetime import datetime, timezone, timedelta
-from app.services.notification_service import save_notification
+from app.services.notification_service import notification_doc, save_notifications
+from app.services.push_service import push_client
+from app.services.recipient_cache import recipient_cache
 from app.config.firebase import db
 
 
@@ -15,24 +15,13 @@ GLUCOSE_COLLECTION = "glucose_readings"
 CODE_EXPIRY_MINUTES = 30
 
 
-def _send_expo_push(messages: list[dict], label: str = "") -> None:
-    payload = json_lib.dumps(messages).encode("utf-8")
-    req = urllib.request.Request(
-        "https://exp.host/--/api/v2/push/send",
-        data=payload,
-        headers={
-            "Content-Type":    "application/json",
-            "Accept":          "application/json",
-            "Accept-Encoding": "gzip, deflate",
-        },
-        method="POST",
-    )
-    try:
-        urllib.request.urlopen(req, timeout=5)
-        if label:
-            print(f"✅ Push sent: {label}")
-    except Exception as e:
-        print(f"⚠️ Push failed: {e}")
+def _get_users(user_ids: list[str]) -> dict[str, dict]:
+    """User profiles by id, in one get_all round-trip (missing users left out)."""
+    ids = list(dict.fromkeys(uid for uid in user_ids if uid))
+    if not ids:
+        return {}
+    refs = [db.collection(USERS_COLLECTION).document(uid) for uid in ids]
+    return {doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists}
 
 
 def _generate_unique_code() -> str:
@@ -136,6 +125,7 @@ def join_with_code(family_member_id: str, code: str) -> dict:
 
     # Mark code as used — one code per family member
     db.collection(PAIRING_CODES_COLLECTION).document(doc.id).update({"used": True})
+    recipient_cache.invalidate(patient_id)
 
     return {
         "message": "Linked successfully",
@@ -150,24 +140,27 @@ def get_family_members(patient_id: str) -> list:
         .where("patient_id", "==", patient_id)\
         .stream()
 
+    links = [(doc.id, doc.to_dict()) for doc in results]
+
+    # Fetch the missing family member names from users collection, in one get_all
+    users = _get_users([
+        d.get("family_member_id") for _, d in links if not d.get("family_member_name")
+    ])
+
     members = []
-    for doc in results:
-        d = doc.to_dict()
+    for link_id, d in links:
         family_member_id = d.get("family_member_id")
         linked_at = d.get("linked_at")
 
-        # Fetch family member name from users collection
         name = d.get("family_member_name", "")
-        if not name and family_member_id:
-            user_doc = db.collection(USERS_COLLECTION).document(family_member_id).get()
-            if user_doc.exists:
-                udata = user_doc.to_dict()
-                first = udata.get("firstName", "")
-                last = udata.get("lastName", "")
-                name = f"{first} {last}".strip() or udata.get("email", "Unknown")
+        udata = users.get(family_member_id) if not name else None
+        if udata is not None:
+            first = udata.get("firstName", "")
+            last = udata.get("lastName", "")
+            name = f"{first} {last}".strip() or udata.get("email", "Unknown")
 
         members.append({
-            "link_id": doc.id,
+            "link_id": link_id,
             "family_member_id": family_member_id,
             "family_member_name": name,
             "linked_at": linked_at.isoformat() if linked_at else None,
@@ -192,6 +185,7 @@ def remove_family_member(patient_id: str, link_id: str) -> bool:
         return False
 
     doc_ref.delete()
+    recipient_cache.invalidate(patient_id)
     return True
 
 
@@ -230,6 +224,7 @@ def remove_patient_link(family_member_id: str, link_id: str) -> bool:
         return False
 
     doc_ref.delete()
+    recipient_cache.invalidate(doc.to_dict().get("patient_id"))
     return True
 
 
@@ -335,14 +330,15 @@ def get_patient_daily_logs(family_member_id: str, patient_id: str, days: int = 7
 
 
 
-def send_emergency_notification(
+def emergency_deliveries(
     patient_id: str,
-    patient_name: str,
+    patient_name: str | None,
     glucose_value: int,
-) -> None:
+) -> tuple[list[dict], list[dict]]:
     """
-    Send Expo push notifications to the patient themselves and all linked
-    family members when a dangerous glucose level is recorded.
+    Notification docs and Expo push messages for the patient themselves and
+    all linked family members when a dangerous glucose level is recorded.
+    patient_name=None → taken from the patient's profile.
     """
     alert_data = {
         "patient_id": patient_id,
@@ -383,73 +379,85 @@ def send_emergency_notification(
             f"مستوى السكر مرتفع جداً: {glucose_value} mg/dL. يرجى اتخاذ الإجراء اللازم فوراً.",
         )
 
+    notifications: list[dict] = []
+    messages: list[dict] = []
+
+    # Patient + linked family members (push tokens, languages), cached
+    recipients = recipient_cache.get(patient_id)
+
     # Notify the patient themselves
-    patient_doc = db.collection(USERS_COLLECTION).document(patient_id).get()
-    if patient_doc.exists:
-        pdata = patient_doc.to_dict()
+    pdata = recipients["patient"]
+    if pdata is not None:
+        if patient_name is None:
+            patient_name = (
+                f"{pdata.get('firstName', '')} {pdata.get('lastName', '')}".strip()
+                or pdata.get("email", "Patient")
+            )
         pt = pdata.get("pushToken", "")
         if pt and pt.startswith("ExponentPushToken["):
             lang = pdata.get("language", "ar")
             first = pdata.get("firstName", patient_name)
             ptitle, pbody = _build_alert_text(lang, first)
-            _send_expo_push([{
+            messages.append({
                 "to": pt,
                 "title": ptitle,
                 "body": pbody,
                 "data": alert_data,
                 "sound": "default",
                 "priority": "high",
-            }])
+            })
             alert_key = "glucose_low" if is_low else "glucose_high"
-            save_notification(
+            notifications.append(notification_doc(
                 patient_id, "emergency_alert", ptitle, pbody, glucose_value,
                 notif_key=alert_key,
                 notif_params={"name": first, "value": glucose_value},
-            )
+            ))
+    patient_name = patient_name or "Patient"
 
     # Notify all linked family members
     alert_key = "glucose_low" if is_low else "glucose_high"
-    links = db.collection(FAMILY_LINKS_COLLECTION)\
-        .where("patient_id", "==", patient_id)\
-        .stream()
+    for fid, fdata in recipients["family"]:
+        token = fdata.get("pushToken", "")
+        if token and token.startswith("ExponentPushToken["):
+            lang = fdata.get("language", "ar")
+            ftitle, fbody = _build_alert_text(lang, patient_name)
+            messages.append({
+                "to": token,
+                "title": ftitle,
+                "body": fbody,
+                "data": alert_data,
+                "sound": "default",
+                "priority": "high",
+            })
+            notifications.append(notification_doc(
+                fid, "emergency_alert", ftitle, fbody, glucose_value,
+                patient_name=patient_name,
+                notif_key=alert_key,
+                notif_params={"name": patient_name, "value": glucose_value},
+            ))
 
-    family_messages = []
-    for doc in links:
-        fid = doc.to_dict().get("family_member_id")
-        if not fid:
-            continue
-        fdoc = db.collection(USERS_COLLECTION).document(fid).get()
-        if fdoc.exists:
-            fdata = fdoc.to_dict()
-            token = fdata.get("pushToken", "")
-            if token and token.startswith("ExponentPushToken["):
-                lang = fdata.get("language", "ar")
-                ftitle, fbody = _build_alert_text(lang, patient_name)
-                family_messages.append({
-                    "to": token,
-                    "title": ftitle,
-                    "body": fbody,
-                    "data": alert_data,
-                    "sound": "default",
-                    "priority": "high",
-                })
-                save_notification(
-                    fid, "emergency_alert", ftitle, fbody, glucose_value,
-                    patient_name=patient_name,
-                    notif_key=alert_key,
-                    notif_params={"name": patient_name, "value": glucose_value},
-                )
+    return notifications, messages
 
-    if family_messages:
-        _send_expo_push(family_messages, f"Emergency notifications for patient {patient_id}: {glucose_value} mg/dL")
 
+def send_emergency_notification(
+    patient_id: str,
+    patient_name: str | None,
+    glucose_value: int,
+) -> None:
+    """
+    Deliver an emergency alert right away (stored notifications + pushes).
+    Request paths enqueue it on the notification outbox instead.
+    """
+    notifications, messages = emergency_deliveries(patient_id, patient_name, glucose_value)
+    save_notifications(notifications)
+    push_client.send(messages, f"Emergency notifications for patient {patient_id}: {glucose_value} mg/dL")
     print(
         f"✅ Emergency notifications sent for "
         f"patient {patient_id}: {glucose_value} mg/dL"
     )
 
 
-def send_prediction_alert(
+def prediction_alert_deliveries(
     patient_id: str,
     patient_name: str,
     alert_type: str,
@@ -457,9 +465,9 @@ def send_prediction_alert(
     predicted: float,
     hours: int,
     family_advice: str | None = None,
-) -> None:
+) -> tuple[list[dict], list[dict]]:
     """
-    Send push notification + save to Firestore for the patient themselves
+    Notification docs and Expo push messages for the patient themselves
     and all linked family members when the prediction detects an upcoming
     low, high, or patch error alert.
     """
@@ -645,49 +653,42 @@ def send_prediction_alert(
     _patient_params = {"current": int(current), "predicted": int(predicted), "hours": hours}
     _family_params  = {"name": patient_name, "current": int(current), "predicted": int(predicted), "hours": hours}
 
+    notifications: list[dict] = []
+    messages: list[dict] = []
+
+    # Patient + linked family members (push tokens, languages), cached
+    recipients = recipient_cache.get(patient_id)
+
     # ── 1. Notify the patient themselves ──────────────────────────────────────
-    patient_doc = db.collection(USERS_COLLECTION).document(patient_id).get()
-    if patient_doc.exists:
-        pdata = patient_doc.to_dict()
+    pdata = recipients["patient"]
+    if pdata is not None:
         lang = pdata.get("language", "ar")
         ptitle, pbody = _patient_text(lang)
         pt = pdata.get("pushToken", "")
         if pt and pt.startswith("ExponentPushToken["):
-            _send_expo_push([{
+            messages.append({
                 "to": pt,
                 "title": ptitle,
                 "body": pbody,
                 "data": alert_data,
                 "sound": "default",
                 "priority": "high",
-            }], f"Prediction push → patient {patient_id}")
-        save_notification(
+            })
+        notifications.append(notification_doc(
             patient_id, "prediction_alert", ptitle, pbody, int(current),
             notif_key=f"prediction_{_key_suffix}_patient",
             notif_params=_patient_params,
-        )
+        ))
 
     # ── 2. Notify all linked family members ───────────────────────────────────
-    links = db.collection(FAMILY_LINKS_COLLECTION)\
-        .where("patient_id", "==", patient_id)\
-        .stream()
-
-    family_messages = []
-    for doc in links:
-        fid = doc.to_dict().get("family_member_id")
-        if not fid:
-            continue
-        fdoc = db.collection(USERS_COLLECTION).document(fid).get()
-        if not fdoc.exists:
-            continue
-        fdata = fdoc.to_dict()
+    for fid, fdata in recipients["family"]:
         lang = fdata.get("language", "ar")
         ftitle, fbody = _family_text(lang)
         if family_advice:
             fbody = f"{patient_name}: {family_advice}"
         token = fdata.get("pushToken", "")
         if token and token.startswith("ExponentPushToken["):
-            family_messages.append({
+            messages.append({
                 "to": token,
                 "title": ftitle,
                 "body": fbody,
@@ -695,43 +696,202 @@ def send_prediction_alert(
                 "sound": "default",
                 "priority": "high",
             })
-        save_notification(
+        notifications.append(notification_doc(
             fid, "prediction_alert", ftitle, fbody, int(current),
             patient_name=patient_name,
             notif_key=f"prediction_{_key_suffix}_family",
             notif_params=_family_params,
+        ))
+
+    return notifications, messages
+
+
+def send_prediction_alert(
+    patient_id: str,
+    patient_name: str,
+    alert_type: str,
+    current: float,
+    predicted: float,
+    hours: int,
+    family_advice: str | None = None,
+) -> None:
+    """Deliver a prediction alert right away (stored notifications + pushes)."""
+    notifications, messages = prediction_alert_deliveries(
+        patient_id, patient_name, alert_type, current, predicted, hours, family_advice)
+    save_notifications(notifications)
+    push_client.send(messages, f"Prediction alert for {patient_name}: {alert_type}")
+
+
+# ==========================================
+# Alert Digest (coalesced bursts)
+# ==========================================
+
+# Only advisory alerts are held and merged: emergency readings and
+# low-glucose predictions are always delivered immediately.  Emergency
+# readings imported together (one LibreView sync) go out as one digest.
+# alert class → lang → (title, body); {name}, {count}, {value} filled in
+DIGEST_TEXTS = {
+    "prediction_high": {
+        "en": ("⬆️ {count} High Glucose Predictions",
+               "{count} high glucose predictions for {name}, latest {value} mg/dL."),
+        "he": ("⬆️ {count} תחזיות סוכר גבוה",
+               "{count} תחזיות סוכר גבוה עבור {name}, האחרונה {value} mg/dL."),
+        "ar": ("⬆️ {count} توقعات ارتفاع السكر",
+               "{count} توقعات ارتفاع السكر للمريض {name}، آخرها {value} mg/dL."),
+    },
+    "prediction_sensor": {
+        "en": ("⚠️ {count} Sensor Warnings",
+               "{count} suspicious readings were detected for {name}."),
+        "he": ("⚠️ {count} אזהרות חיישן",
+               "זוהו {count} קריאות חשודות עבור {name}."),
+        "ar": ("⚠️ {count} تحذيرات المستشعر",
+               "تم رصد {count} قراءات مشبوهة للمريض {name}."),
+    },
+    "emergency_high": {
+        "en": ("⚠️ {count} High Glucose Readings",
+               "{count} high glucose readings for {name}, latest {value} mg/dL. Please check immediately."),
+        "he": ("⚠️ {count} קריאות סוכר גבוה",
+               "{count} קריאות סוכר גבוה עבור {name}, האחרונה {value} mg/dL. אנא בדוק מיד."),
+        "ar": ("⚠️ {count} قراءات سكر مرتفع",
+               "{count} قراءات سكر مرتفع للمريض {name}، آخرها {value} mg/dL. يرجى اتخاذ الإجراء اللازم فوراً."),
+    },
+    "emergency_low": {
+        "en": ("⚠️ {count} Dangerous Glucose Readings",
+               "{count} dangerous glucose readings for {name}, lowest {value} mg/dL. Please check immediately."),
+        "he": ("⚠️ {count} קריאות סוכר מסוכנות",
+               "{count} קריאות סוכר מסוכנות עבור {name}, הנמוכה {value} mg/dL. אנא בדוק מיד."),
+        "ar": ("⚠️ {count} قراءات سكر خطيرة",
+               "{count} قراءات سكر خطيرة للمريض {name}، أدناها {value} mg/dL. يرجى اتخاذ الإجراء اللازم فوراً."),
+    },
+}
+
+
+def digest_class(kind: str, params: dict) -> str | None:
+    """Digest class of an outbox alert; None for alerts that are never held or merged."""
+    if kind != "prediction_alert":
+        return None
+    alert_type = params.get("alert_type")
+    if alert_type == "high":
+        return "prediction_high"
+    if alert_type == "patch_error":
+        return "prediction_sensor"
+    return None
+
+
+def digest_deliveries(
+    patient_id: str,
+    patient_name: str | None,
+    alert_class: str,
+    count: int,
+    latest_value: int,
+) -> tuple[list[dict], list[dict]]:
+    """
+    One notification doc and one push message per recipient for a burst of
+    `count` alerts of the same class, e.g. "3 high glucose predictions for
+    Ahmad, latest 260 mg/dL".
+    patient_name=None → taken from the patient's profile.
+    """
+    texts = DIGEST_TEXTS[alert_class]
+    is_emergency = alert_class.startswith("emergency_")
+    notif_type = "emergency_alert" if is_emergency else "prediction_alert"
+    alert_data = {
+        "patient_id": patient_id,
+        "alert_class": alert_class,
+        "count": count,
+        "type": "glucose_alert" if is_emergency else "prediction_alert",
+    }
+
+    recipients = recipient_cache.get(patient_id)
+    pdata = recipients["patient"]
+    if patient_name is None and pdata is not None:
+        patient_name = (
+            f"{pdata.get('firstName', '')} {pdata.get('lastName', '')}".strip()
+            or pdata.get("email", "Patient")
         )
+    patient_name = patient_name or "Patient"
+
+    targets = []
+    if pdata is not None:
+        targets.append((patient_id, pdata, pdata.get("firstName", patient_name)))
+    targets.extend((fid, fdata, patient_name) for fid, fdata in recipients["family"])
+
+    notifications: list[dict] = []
+    messages: list[dict] = []
+    for user_id, data, name in targets:
+        params = {"name": name, "count": count, "value": latest_value}
+        title, body = texts.get(data.get("language", "ar"), texts["ar"])
+        title, body = title.format(**params), body.format(**params)
+        token = data.get("pushToken", "")
+        if token and token.startswith("ExponentPushToken["):
+            messages.append({
+                "to": token,
+                "title": title,
+                "body": body,
+                "data": alert_data,
+                "sound": "default",
+                "priority": "high",
+            })
+        notifications.append(notification_doc(
+            user_id, notif_type, title, body, latest_value,
+            patient_name=None if user_id == patient_id else patient_name,
+            notif_key=f"{alert_class}_digest",
+            notif_params=params,
+        ))
+
+    return notifications, messages
+
 
-    if family_messages:
-        _send_expo_push(family_messages, f"Prediction alert for {patient_name}: {alert_type}")
+def emergency_digest_deliveries(
+    patient_id: str,
+    patient_name: str | None,
+    glucose_values: list[int],
+) -> tuple[list[dict], list[dict]]:
+    """
+    One emergency alert per recipient for the dangerous readings of one
+    import, oldest first: the lowest value when any is low, else the latest.
+    """
+    if len(glucose_values) == 1:
+        return emergency_deliveries(patient_id, patient_name, glucose_values[0])
+    lows = [v for v in glucose_values if v < 70]
+    if lows:
+        return digest_deliveries(
+            patient_id, patient_name, "emergency_low",
+            count=len(glucose_values), latest_value=min(lows))
+    return digest_deliveries(
+        patient_id, patient_name, "emergency_high",
+        count=len(glucose_values), latest_value=glucose_values[-1])
+
+
+def send_emergency_digest(
+    patient_id: str,
+    patient_name: str | None,
+    glucose_values: list[int],
+) -> None:
+    """Deliver an import's emergency digest right away (outbox fallback)."""
+    notifications, messages = emergency_digest_deliveries(patient_id, patient_name, glucose_values)
+    save_notifications(notifications)
+    push_client.send(messages, f"Emergency digest for patient {patient_id}: {len(glucose_values)} readings")
 
 
 # ==========================================
 # Stale + Pattern Risk Alert
 # ==========================================
 
-def send_stale_pattern_alert(
+def stale_pattern_deliveries(
     patient_id: str,
     patient_name: str,
     risk_level: str,
     hours_elapsed: float,
     typical_avg: int | None = None,
-) -> None:
+) -> tuple[list[dict], list[dict]]:
     """
-    Notify family members when the patient has no recent readings AND
-    the historical pattern shows a risk (high / low / variable).
+    Push messages for the family members when the patient has no recent
+    readings AND the historical pattern shows a risk (high / low /
+    variable).  Nothing is stored for this alert.
     """
-    links = db.collection(FAMILY_LINKS_COLLECTION)\
-        .where("patient_id", "==", patient_id)\
-        .stream()
-
-    family_ids = [
-        doc.to_dict().get("family_member_id")
-        for doc in links
-        if doc.to_dict().get("family_member_id")
-    ]
-    if not family_ids:
-        return
+    family = recipient_cache.get(patient_id)["family"]
+    if not family:
+        return [], []
 
     days = round(hours_elapsed / 24, 1)
     elapsed_str = f"{days} day(s)" if hours_elapsed >= 24 else f"{round(hours_elapsed)}h"
@@ -749,15 +909,13 @@ def send_stale_pattern_alert(
     body  = risk_bodies.get(risk_level, f"No recent reading from {patient_name} ({elapsed_str} ago).")
 
     tokens = []
-    for fid in family_ids:
-        doc = db.collection(USERS_COLLECTION).document(fid).get()
-        if doc.exists:
-            token = doc.to_dict().get("pushToken", "")
-            if token and token.startswith("ExponentPushToken["):
-                tokens.append(token)
+    for _, fdata in family:
+        token = fdata.get("pushToken", "")
+        if token and token.startswith("ExponentPushToken["):
+            tokens.append(token)
 
     if not tokens:
-        return
+        return [], []
 
     messages = [
         {
@@ -775,7 +933,20 @@ def send_stale_pattern_alert(
         for token in tokens
     ]
 
-    _send_expo_push(messages, f"Stale pattern alert for {patient_name}: {risk_level}")
+    return [], messages
+
+
+def send_stale_pattern_alert(
+    patient_id: str,
+    patient_name: str,
+    risk_level: str,
+    hours_elapsed: float,
+    typical_avg: int | None = None,
+) -> None:
+    """Deliver a stale pattern alert right away."""
+    _, messages = stale_pattern_deliveries(
+        patient_id, patient_name, risk_level, hours_elapsed, typical_avg)
+    push_client.send(messages, f"Stale pattern alert for {patient_name}: {risk_level}")
 
 
 def get_patient_glucose(family_member_id: str, patient_id: str, limit: int = 50) -> list:
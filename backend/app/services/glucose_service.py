@@ -1,6 +1,7 @@
 from datetime import datetime, timezone, timedelta
 from firebase_admin import firestore
 from app.models.glucose_reading import GlucoseCreate, GlucoseDocument
+from app.services.input_watermark_service import bump_input_watermark
 
 
 # ==========================================
@@ -32,7 +33,7 @@ class GlucoseService:
         Source is always set to 'manual' for patient-submitted readings.
         Uses GlucoseDocument model to ensure data consistency.
         Returns the saved document including its generated ID.
-        Triggers emergency push notifications for family members if value is dangerous.
+        Queues emergency notifications for family members if value is dangerous.
         """
         doc_ref = self.db.collection(self.collection).document()
 
@@ -45,24 +46,18 @@ class GlucoseService:
         )
 
         doc_ref.set(document.dict())
+        bump_input_watermark(user_id, data.measuredAt)
         result = document.dict()
         result["id"] = doc_ref.id
 
-        # Send emergency notifications for dangerous glucose values
+        # Emergency notifications for dangerous glucose values — queued,
+        # the outbox dispatcher does the family fan-out and the pushes
         if data.value < self.DANGEROUS_LOW or data.value > self.DANGEROUS_HIGH:
             try:
-                from app.services.family_service import send_emergency_notification
-                patient_doc = self.db.collection("users").document(user_id).get()
-                patient_name = "Patient"
-                if patient_doc.exists:
-                    pdata = patient_doc.to_dict()
-                    patient_name = (
-                        f"{pdata.get('firstName', '')} {pdata.get('lastName', '')}".strip()
-                        or pdata.get("email", "Patient")
-                    )
-                send_emergency_notification(
-                    patient_id=user_id,
-                    patient_name=patient_name,
+                from app.services.notification_outbox import notification_outbox
+                notification_outbox.enqueue(
+                    "emergency", user_id,
+                    patient_name=None,   # looked up by the dispatcher
                     glucose_value=data.value,
                 )
             except Exception as e:
@@ -108,6 +103,7 @@ class GlucoseService:
             createdAt=datetime.now(timezone.utc),
         )
         doc_ref.set(document.dict())
+        bump_input_watermark(user_id, measured_at)
         result = document.dict()
         result["id"] = doc_ref.id
         return result
@@ -197,6 +193,9 @@ class GlucoseService:
                 imported += 1
             batch.commit()
 
+        if new_readings:
+            bump_input_watermark(user_id, max(r["measuredAt"] for r in new_readings))
+
         return imported, skipped
 
     # ==========================================
@@ -265,6 +264,7 @@ class GlucoseService:
             return None
 
         doc_ref.update({"value": new_value})
+        bump_input_watermark(user_id)
         data["value"] = new_value
         data["id"] = reading_id
         return data
@@ -4,6 +4,7 @@ from app.models.health import (
     HealthInfoUpdate, HealthInfoResponse,
     InsulinDoseCreate, InsulinDoseResponse,
 )
+from app.services.input_watermark_service import bump_input_watermark
 
 DEFAULT_ISF = 30.0  # mg/dL per unit (conservative default)
 
@@ -39,6 +40,7 @@ class HealthService:
             payload["health.basal_insulin"] = None
 
         self.db.collection("users").document(user_id).update(payload)
+        bump_input_watermark(user_id)   # ISF / conditions feed the insulin adjustment
 
         return HealthInfoResponse(
             conditions=data.conditions,
@@ -63,6 +65,7 @@ class HealthService:
         }
         ref = self.db.collection("insulin_logs").document()
         ref.set(doc)
+        bump_input_watermark(user_id)
         return InsulinDoseResponse(id=ref.id, **doc)
 
     def _dose_from_doc(self, doc) -> InsulinDoseResponse:
@@ -111,6 +114,7 @@ class HealthService:
         if not doc.exists or doc.to_dict().get("userId") != user_id:
             return False
         ref.delete()
+        bump_input_watermark(user_id)
         return True
 
     # ==========================================
@@ -0,0 +1,99 @@
+"""
+Per-patient prediction input watermark.
+
+Every write that changes what the prediction pipeline sees (glucose
+readings, meals, activities, sleep logs, insulin doses) bumps the
+patient's watermark document:
+
+    version          — counter, +1 per change (the input fingerprint)
+    lastReadingEpoch — newest glucose measuredAt, epoch seconds
+    predictedVersion — version the last auto-prediction ran on
+    predictedEpoch   — when that prediction ran, epoch seconds
+
+The auto-prediction job reads the whole collection in one scan and only
+re-runs patients whose version moved on or whose result has expired.
+
+For in-process lookups (the prediction result cache) current_watermark()
+answers from memory: writes made by this process count immediately, and
+writes made by other processes arrive through a Firestore listener on the
+collection (watch_watermarks, started in the app lifespan).
+"""
+
+import threading
+from datetime import datetime, timezone
+from firebase_admin import firestore
+from app.config.firebase import db
+
+WATERMARKS_COLLECTION = "prediction_watermarks"
+
+_local_bumps: dict[str, int] = {}      # writes made by this process
+_remote_versions: dict[str, int] = {}  # Firestore `version`, via the listener
+_bump_lock = threading.Lock()
+
+
+# ==========================================
+# Write Side
+# ==========================================
+
+def bump_input_watermark(user_id: str, reading_at: datetime | None = None) -> None:
+    """
+    Mark the patient's prediction inputs as changed.
+    reading_at: measuredAt of the newest glucose reading written, if any.
+    Best-effort — a failed bump only delays the next auto-prediction.
+    """
+    with _bump_lock:
+        _local_bumps[user_id] = _local_bumps.get(user_id, 0) + 1
+    update = {
+        "version":   firestore.Increment(1),
+        "updatedAt": firestore.SERVER_TIMESTAMP,
+    }
+    if reading_at is not None:
+        if reading_at.tzinfo is None:
+            reading_at = reading_at.replace(tzinfo=timezone.utc)
+        update["lastReadingEpoch"] = firestore.Maximum(reading_at.timestamp())
+    try:
+        db.collection(WATERMARKS_COLLECTION).document(user_id).set(update, merge=True)
+    except Exception as e:
+        print(f"⚠️ [Watermark] {user_id}: {e}")
+
+
+def record_prediction(user_id: str, version: int, predicted_at: datetime) -> None:
+    """Store the input version an auto-prediction was computed from."""
+    db.collection(WATERMARKS_COLLECTION).document(user_id).set({
+        "predictedVersion": version,
+        "predictedEpoch":   predicted_at.timestamp(),
+    }, merge=True)
+
+
+# ==========================================
+# Read Side
+# ==========================================
+
+def load_watermarks() -> dict[str, dict]:
+    """All patients' watermarks, keyed by user id (one collection scan)."""
+    return {
+        doc.id: doc.to_dict()
+        for doc in db.collection(WATERMARKS_COLLECTION).stream()
+    }
+
+
+def current_watermark(user_id: str) -> tuple[int, int]:
+    """In-memory watermark: (last Firestore version seen, local writes)."""
+    return _remote_versions.get(user_id, 0), _local_bumps.get(user_id, 0)
+
+
+def _on_snapshot(docs, changes, read_time) -> None:
+    for change in changes:
+        if change.type.name == "REMOVED":
+            _remote_versions.pop(change.document.id, None)
+        else:
+            _remote_versions[change.document.id] = change.document.to_dict().get("version", 0)
+
+
+def watch_watermarks():
+    """Follow watermark changes made by other processes; returns the watch (or None)."""
+    try:
+        return db.collection(WATERMARKS_COLLECTION).on_snapshot(_on_snapshot)
+    except Exception as e:
+        print(f"⚠️ [Watermark] listener not started: {e}")
+        return None
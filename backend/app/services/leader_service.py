@@ -0,0 +1,166 @@
+"""
+Leader election for the batch jobs (reminders, auto-prediction).
+
+Every uvicorn worker runs the FastAPI lifespan, so without coordination
+each of them would run every batch job.  One LeaderElector per process
+competes for a lease; only the holder runs the jobs.  This is the
+default (BATCH_SCHEDULING=leader); BATCH_SCHEDULING=sharded splits the
+jobs over all workers instead (see shard_service).
+
+LEADER_ELECTION modes:
+    firestore — lease document (holder + expiry) claimed in a transaction
+                and renewed by a heartbeat every LEADER_LEASE_SECONDS / 3.
+                A leader that dies stops renewing, the lease lapses and
+                another process takes over (multi-host deployments).
+    file      — exclusive flock on LEADER_LOCK_FILE (single host).  The OS
+                drops the lock when the holder exits.
+    off       — always leader (single-process / development).
+"""
+
+import fcntl
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable
+
+from firebase_admin import firestore
+from app.config.firebase import db
+
+LEASES_COLLECTION = "scheduler_leases"
+
+LEADER_ELECTION = os.getenv("LEADER_ELECTION", "firestore")   # firestore / file / off
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", 30))
+LEADER_LOCK_FILE = os.getenv("LEADER_LOCK_FILE", "/tmp/diaconnect-scheduler.lock")
+
+
+def lease_available(lease: dict | None, holder: str, now_epoch: float) -> bool:
+    """A lease can be taken when it is free, ours, or expired."""
+    if not lease or lease.get("holder") in (None, holder):
+        return True
+    return lease.get("expiresEpoch", 0) <= now_epoch
+
+
+@firestore.transactional
+def _claim_lease(transaction, ref, holder: str, ttl: float) -> bool:
+    snap = ref.get(transaction=transaction)
+    now = time.time()
+    if not lease_available(snap.to_dict() if snap.exists else None, holder, now):
+        return False
+    transaction.set(ref, {
+        "holder":       holder,
+        "expiresEpoch": now + ttl,
+        "renewedAt":    firestore.SERVER_TIMESTAMP,
+    })
+    return True
+
+
+# ==========================================
+# Elector
+# ==========================================
+
+class LeaderElector:
+    """
+    Heartbeat thread that keeps trying to hold the `name` lease.
+    on_elected / on_demoted run on that thread when leadership changes.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        on_elected: Callable[[], None],
+        on_demoted: Callable[[], None],
+        mode: str = LEADER_ELECTION,
+        lease_seconds: float = LEADER_LEASE_SECONDS,
+        lock_file: str = LEADER_LOCK_FILE,
+    ):
+        self.name = name
+        self.mode = mode
+        self.lease_seconds = lease_seconds
+        self.lock_file = lock_file
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        self._lock_fd: int | None = None
+        self._valid_until = 0.0   # monotonic end of the lease we last renewed
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # ── Lease backends ──────────────────────────────────────────────
+
+    def _try_acquire(self) -> bool:
+        if self.mode == "off":
+            return True
+        if self.mode == "file":
+            if self._lock_fd is not None:
+                return True
+            fd = os.open(self.lock_file, os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._lock_fd = fd
+            return True
+        ref = db.collection(LEASES_COLLECTION).document(self.name)
+        return _claim_lease(db.transaction(), ref, self.holder, self.lease_seconds)
+
+    def _release(self) -> None:
+        if self.mode == "file" and self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        elif self.mode == "firestore":
+            ref = db.collection(LEASES_COLLECTION).document(self.name)
+            snap = ref.get()
+            if snap.exists and snap.to_dict().get("holder") == self.holder:
+                ref.delete()   # hand over immediately instead of waiting for expiry
+
+    # ── Heartbeat ───────────────────────────────────────────────────
+
+    def _set_leader(self, leader: bool) -> None:
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        print(f"[Leader] {self.holder} {'elected' if leader else 'demoted'} ({self.name})")
+        try:
+            (self._on_elected if leader else self._on_demoted)()
+        except Exception as e:
+            print(f"⚠️ [Leader] {self.name} callback failed: {e}")
+
+    def heartbeat(self) -> bool:
+        """One acquire / renew attempt; returns whether we hold the lease."""
+        try:
+            leader = self._try_acquire()
+            if leader:
+                self._valid_until = time.monotonic() + self.lease_seconds
+        except Exception as e:
+            # Lease store unreachable: keep leading only while our last renewal
+            # is safely unexpired, so two leaders never overlap
+            print(f"⚠️ [Leader] heartbeat failed: {e}")
+            leader = time.monotonic() < self._valid_until - self.lease_seconds / 3
+        self._set_leader(leader)
+        return leader
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self.heartbeat()
+            self._stop.wait(self.lease_seconds / 3)
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._loop, name=f"leader-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.lease_seconds)
+        self._set_leader(False)
+        try:
+            self._release()
+        except Exception as e:
+            print(f"⚠️ [Leader] release failed: {e}")
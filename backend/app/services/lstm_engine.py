@@ -0,0 +1,480 @@
+"""
+LSTM engine — NumPy inference and head fine-tuning for the glucose model.
+TensorFlow is only imported lazily, by the Keras backend.
+
+Head-only fine-tuning
+---------------------
+The LSTM layer of the base model is frozen during per-patient fine-tuning,
+so its 64-dim output for a given input window never changes.  Instead of
+pushing every window through the LSTM on every epoch, the caller computes
+the embeddings once (and caches them per patient), and only the two Dense
+layers are fitted here:
+
+  1. Dense(16, relu) → Dense(1) trained with mini-batch Adam on the
+     cached embeddings (weighted MSE, same loss as Keras `fit`).
+  2. The last layer is then refitted in closed form (weighted ridge),
+     shrunk towards the Adam solution so small datasets stay close to
+     the pretrained head.
+
+Inference backends
+------------------
+NumpyLSTM : evaluates LSTM(64) → Dense(16, relu) → Dense(1) in vectorised
+            NumPy.  Base weights are read straight from base_model.keras
+            (zip + HDF5), so a worker that only serves cached models never
+            imports TensorFlow.
+KerasLSTM : the same network as a tf.keras model (lazy TF import).
+
+Both expose the same small interface (embed / predict / rollout /
+get_weights / set_weights / head_weights / set_head / keras_model), with
+weights kept in Keras order: [kernel, recurrent_kernel, bias, w1, b1, w2, b2].
+
+Rollout
+-------
+`rollout` produces the whole autoregressive trajectory (one step per hour,
+up to 24 h) in a single call: each predicted value is fed back as the next
+row with the hour advanced and the last lifestyle context carried forward.
+"""
+
+import io
+import time
+import zipfile
+import numpy as np
+
+SEQUENCE_LENGTH = 12
+N_FEATURES = 6
+LSTM_UNITS = 64
+DENSE_UNITS = 16
+
+
+# ==========================================
+# Dense Head
+# ==========================================
+
+def head_hidden(emb: np.ndarray, w1: np.ndarray, b1: np.ndarray) -> np.ndarray:
+    """Dense(16, relu) activations for a batch of LSTM embeddings."""
+    return np.maximum(emb @ w1 + b1, 0.0)
+
+
+def head_forward(
+    emb: np.ndarray, w1: np.ndarray, b1: np.ndarray,
+    w2: np.ndarray, b2: np.ndarray,
+) -> np.ndarray:
+    """Normalised glucose prediction (N,) for a batch of LSTM embeddings."""
+    return (head_hidden(emb, w1, b1) @ w2 + b2)[:, 0]
+
+
+# ==========================================
+# Head Fine-tuning
+# ==========================================
+
+def _ridge_last_layer(
+    hidden: np.ndarray,
+    y: np.ndarray,
+    sample_weight: np.ndarray,
+    w2_prior: np.ndarray,
+    b2_prior: np.ndarray,
+    alpha: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Closed-form weighted ridge for Dense(1), shrunk towards the prior weights.
+    The bias is not penalised.
+    """
+    n_hidden = hidden.shape[1]
+    design = np.hstack([hidden, np.ones((hidden.shape[0], 1))]).astype(np.float64)
+    prior = np.concatenate([w2_prior[:, 0], b2_prior]).astype(np.float64)
+    sw = sample_weight.astype(np.float64)
+
+    lam = alpha * sw.sum()
+    penalty = np.full(n_hidden + 1, lam)
+    penalty[-1] = 0.0
+
+    gram = design.T @ (design * sw[:, None]) + np.diag(penalty)
+    rhs = design.T @ (sw * y.astype(np.float64)) + penalty * prior
+    try:
+        beta = np.linalg.solve(gram, rhs)
+    except np.linalg.LinAlgError:
+        beta = np.linalg.lstsq(gram, rhs, rcond=None)[0]
+
+    return (
+        beta[:n_hidden].reshape(n_hidden, 1).astype(np.float32),
+        beta[n_hidden:].astype(np.float32),
+    )
+
+
+def adaptive_batch_size(
+    n: int, min_batch: int, max_batch: int, target_steps: int
+) -> int:
+    """
+    Power-of-two batch size giving roughly `target_steps` optimiser steps
+    per epoch, clipped to [min_batch, max_batch].
+    """
+    batch = 1 << max(0, int(np.ceil(np.log2(max(1, n) / target_steps))))
+    return int(min(max_batch, max(min_batch, batch)))
+
+
+def fit_head(
+    emb: np.ndarray,
+    y: np.ndarray,
+    sample_weight: np.ndarray,
+    weights: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    epochs: int,
+    lr: float,
+    batch_size: int = 32,
+    ridge_alpha: float = 1e-2,
+    seed: int = 42,
+    val: tuple[np.ndarray, np.ndarray] | None = None,
+    patience: int = 0,
+    time_budget: float | None = None,
+    return_stats: bool = False,
+):
+    """
+    Fine-tune Dense(16, relu) → Dense(1) on cached LSTM embeddings.
+
+    weights: (w1, b1, w2, b2) starting point, usually the base model head.
+    val: (emb_val, y_val) for early stopping — training stops after
+    `patience` epochs without a lower validation MSE and the best epoch's
+    weights are kept.  time_budget: stop after the epoch that exceeds it (s).
+    Returns the fitted (w1, b1, w2, b2) as float32 arrays, plus
+    {"epochs", "seconds", "stopped_early"} when return_stats is set.
+    """
+    w1, b1, w2, b2 = (np.array(w, dtype=np.float32, copy=True) for w in weights)
+    stats = {"epochs": 0, "seconds": 0.0, "stopped_early": False}
+    n = emb.shape[0]
+    if n == 0:
+        return ((w1, b1, w2, b2), stats) if return_stats else (w1, b1, w2, b2)
+
+    started = time.perf_counter()
+    early_stop = val is not None and len(val[0]) > 0 and patience > 0
+    rng = np.random.default_rng(seed)
+    params = [w1, b1, w2, b2]
+    m = [np.zeros_like(p) for p in params]
+    v = [np.zeros_like(p) for p in params]
+    beta1, beta2, eps = 0.9, 0.999, 1e-7
+    step = 0
+    best_loss, best_params, since_best = np.inf, None, 0
+
+    for epoch in range(epochs):
+        order = rng.permutation(n)
+        for start in range(0, n, batch_size):
+            idx = order[start: start + batch_size]
+            xb, yb, wb = emb[idx], y[idx], sample_weight[idx]
+
+            pre = xb @ w1 + b1
+            hidden = np.maximum(pre, 0.0)
+            pred = (hidden @ w2 + b2)[:, 0]
+
+            # d/dpred of mean(w * (pred - y)^2)
+            d_pred = (2.0 / len(idx)) * wb * (pred - yb)
+            g_w2 = hidden.T @ d_pred[:, None]
+            g_b2 = np.array([d_pred.sum()], dtype=np.float32)
+            d_hidden = d_pred[:, None] * w2[:, 0][None, :]
+            d_pre = d_hidden * (pre > 0)
+            g_w1 = xb.T @ d_pre
+            g_b1 = d_pre.sum(axis=0)
+
+            step += 1
+            lr_t = lr * np.sqrt(1 - beta2 ** step) / (1 - beta1 ** step)
+            for i, g in enumerate((g_w1, g_b1, g_w2, g_b2)):
+                m[i] = beta1 * m[i] + (1 - beta1) * g
+                v[i] = beta2 * v[i] + (1 - beta2) * g * g
+                params[i] -= (lr_t * m[i] / (np.sqrt(v[i]) + eps)).astype(np.float32)
+
+        stats["epochs"] = epoch + 1
+        if early_stop:
+            val_loss = float(np.mean((head_forward(val[0], *params) - val[1]) ** 2))
+            if val_loss < best_loss:
+                best_loss, best_params, since_best = val_loss, [p.copy() for p in params], 0
+            else:
+                since_best += 1
+                if since_best >= patience:
+                    stats["stopped_early"] = epoch + 1 < epochs
+                    break
+        if time_budget is not None and time.perf_counter() - started > time_budget:
+            stats["stopped_early"] = epoch + 1 < epochs
+            break
+
+    if best_params is not None:
+        w1, b1, w2, b2 = best_params
+    w2, b2 = _ridge_last_layer(
+        head_hidden(emb, w1, b1), y, sample_weight, w2, b2, ridge_alpha)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return ((w1, b1, w2, b2), stats) if return_stats else (w1, b1, w2, b2)
+
+
+def augmented_batches(
+    X: np.ndarray,
+    y: np.ndarray,
+    sample_weight: np.ndarray,
+    copies: int,
+    batch_size: int,
+    noise_std: float = 0.01,
+    seed: int = 42,
+):
+    """
+    Endless (x, y, w) batch generator equivalent to training on `copies`
+    shuffled copies of the windows, where every copy but the first gets
+    fresh Gaussian input noise.  Noise is drawn per batch, so memory stays
+    at one batch instead of `copies` materialised datasets.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(X)
+    while True:
+        order = rng.permutation(n * copies)
+        for start in range(0, len(order), batch_size):
+            idx = order[start: start + batch_size]
+            rows = idx % n
+            xb = X[rows].copy()
+            noisy = idx >= n
+            if noisy.any():
+                xb[noisy] += rng.normal(
+                    0, noise_std, xb[noisy].shape).astype(np.float32)
+            yield xb, y[rows], sample_weight[rows]
+
+
+# ==========================================
+# Weight Loading
+# ==========================================
+
+def load_keras_weights(path) -> list[np.ndarray]:
+    """
+    Read the LSTM + Dense weights from a Keras v3 `.keras` archive.
+    Uses h5py directly (no TensorFlow); falls back to tf.keras if h5py
+    is not installed.
+    """
+    try:
+        import h5py
+    except ImportError:
+        import tensorflow as tf
+        return tf.keras.models.load_model(str(path)).get_weights()
+
+    with zipfile.ZipFile(str(path)) as archive:
+        raw = archive.read("model.weights.h5")
+
+    with h5py.File(io.BytesIO(raw), "r") as f:
+        layers = f["layers"]
+        lstm_name = next(name for name in layers if "cell" in layers[name])
+        dense_names = sorted(
+            (name for name in layers if name.startswith("dense")),
+            key=lambda name: (len(name), name),
+        )
+
+        def _vars(group) -> list[np.ndarray]:
+            return [np.array(group["vars"][str(i)], dtype=np.float32)
+                    for i in range(len(group["vars"]))]
+
+        weights = _vars(layers[lstm_name]["cell"])
+        for name in dense_names:
+            weights.extend(_vars(layers[name]))
+    return weights
+
+
+def random_weights(seed: int = 42) -> list[np.ndarray]:
+    """
+    Freshly initialised weights (Glorot-uniform kernels, orthogonal recurrent
+    kernel, unit forget bias) — used only when base_model.keras is missing.
+    """
+    rng = np.random.default_rng(seed)
+
+    def glorot(fan_in: int, fan_out: int) -> np.ndarray:
+        limit = np.sqrt(6.0 / (fan_in + fan_out))
+        return rng.uniform(-limit, limit, (fan_in, fan_out)).astype(np.float32)
+
+    q, _ = np.linalg.qr(rng.normal(size=(4 * LSTM_UNITS, LSTM_UNITS)))
+    recurrent = q.T.astype(np.float32)
+    bias = np.zeros(4 * LSTM_UNITS, dtype=np.float32)
+    bias[LSTM_UNITS: 2 * LSTM_UNITS] = 1.0
+
+    return [
+        glorot(N_FEATURES, 4 * LSTM_UNITS), recurrent, bias,
+        glorot(LSTM_UNITS, DENSE_UNITS), np.zeros(DENSE_UNITS, np.float32),
+        glorot(DENSE_UNITS, 1), np.zeros(1, np.float32),
+    ]
+
+
+# ==========================================
+# Rollout
+# ==========================================
+
+def _next_row(
+    predicted_norm: float, last_hour_raw: float, step: int, context: np.ndarray
+) -> np.ndarray:
+    next_hour = ((last_hour_raw + step + 1) % 24) / 24.0
+    return np.concatenate([[predicted_norm, next_hour], context]).astype(np.float32)
+
+
+def rollout_with_predict(
+    predict, window: np.ndarray, steps: int,
+    last_hour_raw: float, context: np.ndarray,
+) -> np.ndarray:
+    """Generic rollout driven by a batch `predict` callable (Keras backend)."""
+    seq = np.array(window[-SEQUENCE_LENGTH:], dtype=np.float32)
+    out = np.zeros(steps, dtype=np.float32)
+    for step in range(steps):
+        pred = float(np.clip(predict(seq[None, -SEQUENCE_LENGTH:])[0], 0.0, 1.0))
+        out[step] = pred
+        seq = np.vstack([seq, _next_row(pred, last_hour_raw, step, context)])
+    return out
+
+
+# ==========================================
+# NumPy Backend
+# ==========================================
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+class NumpyLSTM:
+    """LSTM(64) → Dense(16, relu) → Dense(1), evaluated in NumPy."""
+
+    backend = "numpy"
+
+    def __init__(self, weights: list[np.ndarray] | None = None):
+        self.set_weights(weights if weights is not None else random_weights())
+
+    def get_weights(self) -> list[np.ndarray]:
+        return [self.kernel, self.recurrent, self.bias,
+                self.w1, self.b1, self.w2, self.b2]
+
+    def set_weights(self, weights: list[np.ndarray]) -> None:
+        (self.kernel, self.recurrent, self.bias,
+         self.w1, self.b1, self.w2, self.b2) = (
+            np.asarray(w, dtype=np.float32) for w in weights)
+
+    def head_weights(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        return self.w1, self.b1, self.w2, self.b2
+
+    def set_head(self, w1, b1, w2, b2) -> None:
+        self.w1, self.b1, self.w2, self.b2 = (
+            np.asarray(w, dtype=np.float32) for w in (w1, b1, w2, b2))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(w.nbytes for w in self.get_weights())
+
+    def embed(self, X: np.ndarray) -> np.ndarray:
+        """Final LSTM hidden state (N, 64) for a batch of windows (N, T, 6)."""
+        # Input projection for every time step in one matmul
+        x_proj = np.asarray(X, dtype=np.float32) @ self.kernel + self.bias
+        return self._recur(x_proj)
+
+    def _recur(self, x_proj: np.ndarray) -> np.ndarray:
+        n, steps, _ = x_proj.shape
+        units = LSTM_UNITS
+        h = np.zeros((n, units), dtype=np.float32)
+        c = np.zeros((n, units), dtype=np.float32)
+        for t in range(steps):
+            z = x_proj[:, t, :] + h @ self.recurrent
+            i = _sigmoid(z[:, :units])
+            f = _sigmoid(z[:, units: 2 * units])
+            g = np.tanh(z[:, 2 * units: 3 * units])
+            o = _sigmoid(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * np.tanh(c)
+        return h
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Normalised glucose prediction (N,) for a batch of windows."""
+        return head_forward(self.embed(X), *self.head_weights())
+
+    def rollout(
+        self, window: np.ndarray, steps: int,
+        last_hour_raw: float, context: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Normalised trajectory (steps,). Input projections of the window rows
+        are computed once and only the appended row is projected per step.
+        """
+        proj = np.asarray(window[-SEQUENCE_LENGTH:], dtype=np.float32) @ self.kernel + self.bias
+        out = np.zeros(steps, dtype=np.float32)
+        for step in range(steps):
+            emb = self._recur(proj[None, -SEQUENCE_LENGTH:])
+            pred = float(np.clip(head_forward(emb, *self.head_weights())[0], 0.0, 1.0))
+            out[step] = pred
+            row = _next_row(pred, last_hour_raw, step, context)
+            proj = np.vstack([proj[1:], row @ self.kernel + self.bias])
+        return out
+
+    def keras_model(self):
+        """Materialise a tf.keras model with these weights (full fine-tune)."""
+        return build_keras_model(self.get_weights())
+
+
+# ==========================================
+# Keras Backend
+# ==========================================
+
+def build_keras_model(weights: list[np.ndarray] | None = None):
+    import tensorflow as tf
+    model = tf.keras.Sequential([
+        tf.keras.Input(shape=(SEQUENCE_LENGTH, N_FEATURES)),
+        tf.keras.layers.LSTM(LSTM_UNITS),
+        tf.keras.layers.Dense(DENSE_UNITS, activation="relu"),
+        tf.keras.layers.Dense(1),
+    ], name="glucose_lstm")
+    if weights is not None:
+        model.set_weights(weights)
+    return model
+
+
+class KerasLSTM:
+    """Same network as NumpyLSTM, evaluated by tf.keras."""
+
+    backend = "keras"
+
+    def __init__(self, weights: list[np.ndarray] | None = None):
+        self.model = build_keras_model(weights)
+
+    def get_weights(self) -> list[np.ndarray]:
+        return self.model.get_weights()
+
+    def set_weights(self, weights: list[np.ndarray]) -> None:
+        self.model.set_weights(weights)
+
+    def head_weights(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        w1, b1 = self.model.layers[1].get_weights()
+        w2, b2 = self.model.layers[2].get_weights()
+        return w1, b1, w2, b2
+
+    def set_head(self, w1, b1, w2, b2) -> None:
+        self.model.layers[1].set_weights([w1, b1])
+        self.model.layers[2].set_weights([w2, b2])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(w.nbytes for w in self.get_weights())
+
+    def embed(self, X: np.ndarray) -> np.ndarray:
+        out = self.model.layers[0](np.asarray(X, dtype=np.float32), training=False)
+        return np.asarray(out, dtype=np.float32)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        out = self.model(np.asarray(X, dtype=np.float32), training=False)
+        return np.asarray(out, dtype=np.float32)[:, 0]
+
+    def rollout(
+        self, window: np.ndarray, steps: int,
+        last_hour_raw: float, context: np.ndarray,
+    ) -> np.ndarray:
+        return rollout_with_predict(
+            self.predict, window, steps, last_hour_raw, context)
+
+    def keras_model(self):
+        return self.model
+
+
+def make_engine(backend: str, weights: list[np.ndarray] | None = None):
+    """Build an inference engine for the configured backend ("numpy" / "keras")."""
+    if backend == "keras":
+        return KerasLSTM(weights)
+    return NumpyLSTM(weights)
+
+
+def max_abs_diff_vs_keras(weights: list[np.ndarray], X: np.ndarray) -> float:
+    """
+    Largest absolute difference between NumpyLSTM and tf.keras outputs for
+    the same weights and inputs — used to validate the NumPy backend.
+    """
+    numpy_out = NumpyLSTM(weights).predict(X)
+    keras_out = KerasLSTM(weights).predict(X)
+    return float(np.max(np.abs(numpy_out - keras_out)))
@@ -0,0 +1,220 @@
+"""
+Per-patient model store for the glucose prediction service.
+
+Fine-tuned weights are persisted to local disk (one .npz per patient,
+written atomically) together with sigma and a fingerprint of the training
+data, and a byte-budgeted LRU keeps the hot models in memory.  A restart
+or a freshly forked worker lazily rehydrates models from disk instead of
+re-running the fine-tune for every patient.
+"""
+
+import gc
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from app.services.lstm_engine import make_engine
+
+
+# ==========================================
+# Byte-budgeted LRU
+# ==========================================
+
+class ByteLRU:
+    """
+    Thread-safe LRU mapping bounded by the total size of its values.
+    size_fn returns the byte size of a value; on_evict is called for every
+    value dropped to stay under max_bytes.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        size_fn: Callable[[object], int],
+        on_evict: Callable[[str, object], None] | None = None,
+    ):
+        self.max_bytes = max_bytes
+        self._size_fn = size_fn
+        self._on_evict = on_evict
+        self._items: OrderedDict[str, tuple[object, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key: str, value) -> None:
+        size = self._size_fn(value)
+        evicted = []
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                old_key, (old_value, old_size) = self._items.popitem(last=False)
+                self._bytes -= old_size
+                evicted.append((old_key, old_value))
+        for old_key, old_value in evicted:
+            if self._on_evict:
+                self._on_evict(old_key, old_value)
+
+    def pop(self, key: str):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None:
+                return None
+            self._bytes -= item[1]
+            return item[0]
+
+    def values(self) -> list:
+        with self._lock:
+            return [value for value, _ in self._items.values()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# ==========================================
+# Model Store
+# ==========================================
+
+def _safe_name(user_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]", "_", user_id)
+
+
+class ModelStore:
+    """
+    Disk-backed, memory-bounded store of fine-tuned per-patient models.
+
+    Entries are dicts: {"model": engine, "sigma": float,
+    "fingerprint": str, "n_readings": int, **extra metadata}.
+    The caller decides whether a stored fingerprint is still usable.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, backend: str = "numpy"):
+        self.directory = Path(directory)
+        self.backend = backend
+        self._memory = ByteLRU(
+            max_bytes,
+            size_fn=lambda entry: entry["model"].nbytes,
+            on_evict=self._release,
+        )
+
+    def _path(self, user_id: str) -> Path:
+        return self.directory / f"{_safe_name(user_id)}.npz"
+
+    def _release(self, user_id: str, entry: dict) -> None:
+        """Drop an evicted model and free framework state where possible."""
+        is_keras = getattr(entry.get("model"), "backend", None) == "keras"
+        if is_keras and "tensorflow" in sys.modules and not any(
+            getattr(e.get("model"), "backend", None) == "keras"
+            for e in self._memory.values()
+        ):
+            import tensorflow as tf
+            tf.keras.backend.clear_session()
+        gc.collect()
+
+    # ==========================================
+    # Read
+    # ==========================================
+
+    def get(self, user_id: str) -> dict | None:
+        """Latest entry for this patient — from memory, else from disk."""
+        entry = self._memory.get(user_id)
+        if entry is not None:
+            return entry
+
+        path = self._path(user_id)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                weights = [data[f"w{i}"] for i in range(meta.pop("n_weights"))]
+        except Exception as e:
+            print(f"⚠️  Could not load stored model for {user_id}: {e}")
+            return None
+
+        entry = {"model": make_engine(self.backend, weights), **meta}
+        self._memory.put(user_id, entry)
+        print(f"[ModelStore] rehydrated {user_id} from disk")
+        return entry
+
+    # ==========================================
+    # Write
+    # ==========================================
+
+    def put(
+        self,
+        user_id: str,
+        model,
+        sigma: float,
+        fingerprint: str,
+        n_readings: int,
+        **extra,
+    ) -> dict:
+        """Cache the model in memory and persist its weights to disk."""
+        meta = {"sigma": sigma, "fingerprint": fingerprint,
+                "n_readings": n_readings, **extra}
+        entry = {"model": model, **meta}
+        self._memory.put(user_id, entry)
+
+        weights = model.get_weights()
+        tmp = None
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self._path(user_id)
+            # A temp file of our own: API and prediction worker processes
+            # share the directory and may write the same patient at once
+            with tempfile.NamedTemporaryFile(
+                dir=self.directory, prefix=f".{path.stem}.", suffix=".tmp", delete=False,
+            ) as tmp:
+                np.savez(
+                    tmp,
+                    meta=np.array(json.dumps({**meta, "n_weights": len(weights)})),
+                    **{f"w{i}": w for i, w in enumerate(weights)},
+                )
+            os.replace(tmp.name, path)
+            tmp = None
+        except Exception as e:
+            print(f"⚠️  Could not persist model for {user_id}: {e}")
+        finally:
+            if tmp is not None:
+                Path(tmp.name).unlink(missing_ok=True)
+        return entry
+
+    def delete(self, user_id: str) -> None:
+        entry = self._memory.pop(user_id)
+        if entry is not None:
+            self._release(user_id, entry)
+        try:
+            self._path(user_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._memory.nbytes
@@ -0,0 +1,369 @@
+"""
+Durable notification outbox.
+
+Alert writers (reading submit, LibreView sync, the prediction pipeline)
+no longer fan out inline: they store a small intent document
+
+    kind      — "emergency" / "emergency_digest" / "prediction_alert" / "stale_pattern"
+    patientId — whose alert it is
+    params    — arguments of the family_service *_deliveries builder
+
+and return.  A dispatcher thread in every API process picks up due
+intents — right away for intents enqueued by the same process, at the
+earliest retry / window end it scheduled itself, and otherwise every
+OUTBOX_POLL_SECONDS (intents left by other or crashed processes) — and
+delivers up to OUTBOX_BATCH_SIZE of them together:
+
+  1. claim them — a lease with an update-time precondition, so two
+     processes never deliver the same intent
+  2. build the notification docs and push messages (family fan-out)
+  3. store the notifications and mark the intents "pushing" in one
+     WriteBatch, so a retry never stores an alert twice
+  4. send all push messages in one push_client.send (chunked by Expo)
+  5. delete the delivered intents; the rest are retried with
+     exponential backoff, up to OUTBOX_MAX_ATTEMPTS, then marked "failed"
+
+Reading-submit latency no longer depends on family size or on the push
+provider.  If the intent itself cannot be stored, it is delivered inline.
+
+Bursts of advisory alerts (high-glucose predictions, sensor warnings) are
+coalesced per patient and alert class (family_service.digest_class).  The
+first alert goes out right away and opens a
+NOTIFICATION_COALESCE_WINDOW_SECONDS window; alerts of the same class
+arriving inside it are held until it closes and then delivered as one
+digest per recipient — "3 high glucose predictions for Ahmad, latest
+260 mg/dL" — which opens the next window.  Emergency readings and
+low-glucose predictions are never held; the emergency readings of one
+LibreView sync are queued as a single "emergency_digest" intent instead.  Window state lives in
+OUTBOX_WINDOWS_COLLECTION, so every dispatcher process sees it.
+"""
+
+import os
+import threading
+import time
+
+from firebase_admin import firestore
+from app.config.firebase import db
+from app.services.family_service import (
+    digest_class, digest_deliveries,
+    emergency_deliveries, emergency_digest_deliveries, prediction_alert_deliveries, stale_pattern_deliveries,
+    send_emergency_digest, send_emergency_notification, send_prediction_alert, send_stale_pattern_alert,
+)
+from app.services.notification_service import FIRESTORE_BATCH_LIMIT, save_notifications
+from app.services.push_service import is_expo_token, is_retryable, push_client
+
+OUTBOX_COLLECTION = "notification_outbox"
+OUTBOX_WINDOWS_COLLECTION = "notification_windows"
+
+# Each poll is a billed Firestore read even when nothing is due, per process
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", 60))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 6))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", 5))   # doubled per attempt
+OUTBOX_BACKOFF_MAX_SECONDS = 600
+OUTBOX_LEASE_SECONDS = 60   # a claimed intent is retried if not settled by then
+# 0 disables coalescing: every alert is delivered on its own
+NOTIFICATION_COALESCE_WINDOW_SECONDS = float(os.getenv("NOTIFICATION_COALESCE_WINDOW_SECONDS", 300))
+
+# kind → (builder returning (notification docs, push messages), inline fallback)
+OUTBOX_KINDS = {
+    "emergency":        (emergency_deliveries, send_emergency_notification),
+    "emergency_digest": (emergency_digest_deliveries, send_emergency_digest),
+    "prediction_alert": (prediction_alert_deliveries, send_prediction_alert),
+    "stale_pattern":    (stale_pattern_deliveries, send_stale_pattern_alert),
+}
+
+
+def backoff_seconds(attempts: int) -> float:
+    return min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_SECONDS * 2 ** max(0, attempts - 1))
+
+
+def _is_due(intent: dict, now: float) -> bool:
+    return (intent.get("nextAttemptEpoch", 0) <= now
+            and intent.get("leaseUntilEpoch", 0) <= now)
+
+
+def _digest_value(params: dict) -> int:
+    """The value a digest reports as "latest": the predicted level."""
+    return int(params.get("predicted", params.get("current", 0)))
+
+
+# ==========================================
+# Outbox
+# ==========================================
+
+class NotificationOutbox:
+
+    def __init__(self):
+        self.owner = f"{os.getpid()}:{id(self):x}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._next_due = float("inf")   # earliest nextAttemptEpoch this process wrote
+
+    def _note_due(self, epoch: float) -> None:
+        self._next_due = min(self._next_due, epoch)
+
+    def next_wakeup(self, now: float) -> float:
+        """Epoch of the next dispatch: a retry / window end we scheduled, or the poll."""
+        return min(self._next_due, now + OUTBOX_POLL_SECONDS)
+
+    # ── Write Side ────────────────────────────────────────────────────
+
+    def enqueue(self, kind: str, patient_id: str, **params) -> None:
+        """Queue a notification intent; delivered by the dispatcher."""
+        intent = {
+            "kind":             kind,
+            "patientId":        patient_id,
+            "params":           params,
+            "status":           "pending",
+            "attempts":         0,
+            "nextAttemptEpoch": 0,
+            "leaseUntilEpoch":  0,
+            "createdAt":        firestore.SERVER_TIMESTAMP,
+            "createdEpoch":     time.time(),
+        }
+        alert_class = digest_class(kind, params) if NOTIFICATION_COALESCE_WINDOW_SECONDS > 0 else None
+        if alert_class:
+            intent["alertClass"] = alert_class
+            intent["coalesceKey"] = f"{patient_id}:{alert_class}"
+        try:
+            db.collection(OUTBOX_COLLECTION).add(intent)
+        except Exception as e:
+            print(f"⚠️ [Outbox] enqueue failed, delivering inline: {e}")
+            OUTBOX_KINDS[kind][1](patient_id=patient_id, **params)
+            return
+        self._wake.set()
+
+    # ── Dispatcher ────────────────────────────────────────────────────
+
+    def _claim(self, docs: list, now: float) -> list:
+        """
+        Lease the intents; skips any another process changed since we read it.
+        nextAttemptEpoch moves to the lease end too, so leased intents drop out
+        of the due query and are picked up again only if the lease lapses.
+        """
+        lease_until = now + OUTBOX_LEASE_SECONDS
+        lease = {"leaseUntilEpoch": lease_until, "nextAttemptEpoch": lease_until, "claimedBy": self.owner}
+        batch = db.batch()
+        for doc in docs:
+            batch.update(doc.reference, lease,
+                         option=db.write_option(last_update_time=doc.update_time))
+        try:
+            batch.commit()
+            return docs
+        except Exception:
+            pass   # at least one was taken: claim one by one
+        claimed = []
+        for doc in docs:
+            try:
+                doc.reference.update(lease, option=db.write_option(last_update_time=doc.update_time))
+                claimed.append(doc)
+            except Exception:
+                continue
+        return claimed
+
+    def _coalesce(self, claimed: list, now: float, summary: dict) -> list:
+        """
+        Hold coalescable alerts whose window is still open; merge the rest
+        per window key.  Returns [(doc to deliver, docs merged into it, key)].
+        """
+        units, keyed = [], {}
+        for doc in claimed:
+            data = doc.to_dict()
+            key = data.get("coalesceKey")
+            # Re-checked here so intents queued under older rules are never held
+            holdable = digest_class(data.get("kind"), data.get("params", {})) is not None
+            if key and holdable and data.get("status") == "pending":
+                keyed.setdefault(key, []).append(doc)
+            else:
+                units.append((doc, [], None))
+        if not keyed:
+            return units
+
+        refs = [db.collection(OUTBOX_WINDOWS_COLLECTION).document(key) for key in keyed]
+        try:
+            windows = {snap.id: snap.to_dict().get("openUntilEpoch", 0)
+                       for snap in db.get_all(refs) if snap.exists}
+        except Exception as e:
+            print(f"⚠️ [Outbox] could not read coalesce windows, not merging: {e}")
+            windows = {}
+
+        hold, held = db.batch(), 0
+        for key, docs in keyed.items():
+            docs.sort(key=lambda d: d.to_dict().get("createdEpoch", 0))
+            open_until = windows.get(key, 0)
+            if open_until > now:
+                for doc in docs:
+                    hold.update(doc.reference, {"nextAttemptEpoch": open_until, "leaseUntilEpoch": 0})
+                held += len(docs)
+                self._note_due(open_until)
+            else:
+                units.append((docs[-1], docs[:-1], key))   # the latest carries the digest
+        if held:
+            try:
+                hold.commit()
+                summary["held"] = held
+            except Exception as e:
+                # Leases lapse and the window is checked again
+                print(f"⚠️ [Outbox] could not hold coalesced alerts: {e}")
+                self._note_due(now + OUTBOX_LEASE_SECONDS)
+        return units
+
+    def _retry(self, intent: dict, error: str, now: float, batch=None) -> str:
+        attempts = intent["data"].get("attempts", 0) + 1
+        update = {"attempts": attempts, "leaseUntilEpoch": 0, "lastError": error[:500]}
+        if "messages" in intent:
+            update["messages"] = intent["messages"]
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            update["status"] = "failed"
+            print(f"❌ [Outbox] {intent['ref'].id} failed after {attempts} attempts: {error}")
+        else:
+            update["nextAttemptEpoch"] = now + backoff_seconds(attempts)
+            self._note_due(update["nextAttemptEpoch"])
+        if batch is not None:
+            batch.update(intent["ref"], update)
+        else:
+            try:
+                intent["ref"].update(update)
+            except Exception as e:
+                print(f"⚠️ [Outbox] could not reschedule {intent['ref'].id}: {e}")
+        return update.get("status", "retried")
+
+    def dispatch_once(self, now: float | None = None) -> dict:
+        """Deliver one batch of due intents; returns a summary."""
+        now = now if now is not None else time.time()
+        summary = {"claimed": 0, "delivered": 0, "retried": 0, "failed": 0, "pushes": 0,
+                   "held": 0, "merged": 0}
+
+        # Due-first in the query itself (composite index: status + nextAttemptEpoch),
+        # so held, backing-off or leased intents can never crowd out due ones
+        query = db.collection(OUTBOX_COLLECTION)\
+            .where("status", "in", ["pending", "pushing"])\
+            .where("nextAttemptEpoch", "<=", now)\
+            .order_by("nextAttemptEpoch")\
+            .limit(OUTBOX_BATCH_SIZE * 2)
+        due = [doc for doc in query.stream() if _is_due(doc.to_dict(), now)][:OUTBOX_BATCH_SIZE]
+        claimed = self._claim(due, now) if due else []
+        summary["claimed"] = len(claimed)
+        if not claimed:
+            return summary
+
+        def _settle_retry(intent, error, batch=None):
+            outcome = self._retry(intent, error, now, batch)
+            summary["failed" if outcome == "failed" else "retried"] += 1
+
+        # ── Build: family fan-out (or a digest) of the intents not delivered yet ──
+        intents = []
+        for doc, merged, key in self._coalesce(claimed, now, summary):
+            data = doc.to_dict()
+            intent = {"ref": doc.reference, "data": data,
+                      "merged": [m.reference for m in merged], "window": key}
+            if data.get("status") == "pushing":
+                intent["notifications"], intent["messages"] = [], data.get("messages", [])
+            else:
+                try:
+                    params = data.get("params", {})
+                    if merged:
+                        intent["notifications"], intent["messages"] = digest_deliveries(
+                            data["patientId"], params.get("patient_name"), data["alertClass"],
+                            count=len(merged) + 1, latest_value=_digest_value(params))
+                    else:
+                        builder = OUTBOX_KINDS[data["kind"]][0]
+                        intent["notifications"], intent["messages"] = builder(
+                            patient_id=data["patientId"], **params)
+                except Exception as e:
+                    _settle_retry(intent, f"build: {e}")
+                    continue
+            intents.append(intent)
+
+        # ── Store notifications + mark "pushing" (+ drop merged intents,
+        #    open the next window), atomically ─────────────────────────
+        stored, group, writes = [], [], 0
+        for intent in intents + [None]:
+            size = 0 if intent is None else (
+                len(intent["notifications"]) + 1 + len(intent["merged"]) + bool(intent["window"]))
+            if group and (intent is None or writes + size > FIRESTORE_BATCH_LIMIT):
+                batch = db.batch()
+                for member in group:
+                    save_notifications(member["notifications"], batch)
+                    batch.update(member["ref"], {"status": "pushing", "messages": member["messages"]})
+                    for ref in member["merged"]:
+                        batch.delete(ref)
+                    if member["window"]:
+                        batch.set(db.collection(OUTBOX_WINDOWS_COLLECTION).document(member["window"]), {
+                            "patientId":      member["data"]["patientId"],
+                            "openUntilEpoch": now + NOTIFICATION_COALESCE_WINDOW_SECONDS,
+                        })
+                try:
+                    batch.commit()
+                    stored.extend(group)
+                    summary["merged"] += sum(len(member["merged"]) for member in group)
+                except Exception as e:
+                    for member in group:
+                        member.pop("messages")   # nothing stored: rebuild on retry
+                        _settle_retry(member, f"store: {e}")
+                group, writes = [], 0
+            if intent is not None:
+                group.append(intent)
+                writes += size
+
+        # ── One push send for the whole batch ─────────────────────────
+        outgoing = [(intent, m) for intent in stored for m in intent["messages"] if is_expo_token(m.get("to"))]
+        tickets = push_client.send([m for _, m in outgoing]) if outgoing else []
+        summary["pushes"] = len(outgoing)
+        unsent: dict[int, list[dict]] = {}
+        for (intent, message), ticket in zip(outgoing, tickets):
+            if is_retryable(ticket):
+                unsent.setdefault(id(intent), []).append(message)
+
+        # ── Settle: delete delivered intents, back off the rest ───────
+        batch = db.batch()
+        for intent in stored:
+            if id(intent) in unsent:
+                intent["messages"] = unsent[id(intent)]
+                _settle_retry(intent, "push: provider unavailable", batch)
+            else:
+                batch.delete(intent["ref"])
+                summary["delivered"] += 1
+        if stored:
+            try:
+                batch.commit()
+            except Exception as e:
+                # Leases lapse and the intents are pushed again
+                print(f"⚠️ [Outbox] could not settle batch: {e}")
+                self._note_due(now + OUTBOX_LEASE_SECONDS)
+
+        print(f"[Outbox] {summary}")
+        return summary
+
+    # ── Lifecycle ─────────────────────────────────────────────────────
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(max(0.0, self.next_wakeup(time.time()) - time.time()))
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            if self._next_due <= time.time():
+                self._next_due = float("inf")   # re-noted by whatever this round schedules
+            try:
+                if self.dispatch_once()["claimed"] >= OUTBOX_BATCH_SIZE:
+                    self._wake.set()   # more waiting: go again right away
+            except Exception as e:
+                print(f"⚠️ [Outbox] dispatch failed: {e}")
+
+    def start(self) -> None:
+        self._stop.clear()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="notification-outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(10)
+
+
+notification_outbox = NotificationOutbox()
@@ -2,9 +2,10 @@ from datetime import datetime, timezone
 from app.config.firebase import db
 
 NOTIFICATIONS_COLLECTION = "notifications"
+FIRESTORE_BATCH_LIMIT = 500   # writes per WriteBatch
 
 
-def save_notification(
+def notification_doc(
     user_id: str,
     notif_type: str,
     title: str,
@@ -13,7 +14,7 @@ def save_notification(
     patient_name: str | None = None,
     notif_key: str | None = None,
     notif_params: dict | None = None,
-) -> None:
+) -> dict:
     data = {
         "userId": user_id,
         "type": notif_type,
@@ -29,7 +30,39 @@ def save_notification(
         data["notifKey"] = notif_key
     if notif_params:
         data["notifParams"] = notif_params
-    db.collection(NOTIFICATIONS_COLLECTION).add(data)
+    return data
+
+
+def save_notification(
+    user_id: str,
+    notif_type: str,
+    title: str,
+    body: str,
+    glucose_value: int | None = None,
+    patient_name: str | None = None,
+    notif_key: str | None = None,
+    notif_params: dict | None = None,
+) -> None:
+    db.collection(NOTIFICATIONS_COLLECTION).add(notification_doc(
+        user_id, notif_type, title, body, glucose_value,
+        patient_name=patient_name, notif_key=notif_key, notif_params=notif_params,
+    ))
+
+
+def save_notifications(docs: list[dict], batch=None) -> None:
+    """
+    Store several notification_doc()s in one WriteBatch.
+    With `batch`, the writes are only added to it and the caller commits.
+    """
+    if batch is not None:
+        for data in docs:
+            batch.set(db.collection(NOTIFICATIONS_COLLECTION).document(), data)
+        return
+    for start in range(0, len(docs), FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for data in docs[start:start + FIRESTORE_BATCH_LIMIT]:
+            batch.set(db.collection(NOTIFICATIONS_COLLECTION).document(), data)
+        batch.commit()
 
 
 def get_notifications(user_id: str, limit: int = 50) -> list:
@@ -0,0 +1,138 @@
+"""
+Incrementally maintained hour-of-day pattern profile.
+
+Every reading of the last `days` days is kept once, as a compact sample
+(epoch µs, minute of day, hour of day, value), sorted by minute of day
+and indexed by 96 quarter-hour bins.  New readings are merged in as
+they show up in the patient's reading list, expired ones are dropped,
+and a pattern query touches only the bins around the requested time of
+day — its cost depends on the ±window size, not on the patient's history.
+
+Tolerance vs. the original per-reading scan: the selected sample set is
+identical (same circular-hour test, same cutoff), so sample_count,
+typical_min / typical_max, risk_level, confidence and variability are
+exact.  The recency-weighted mean and the std are summed in a different
+order (NumPy pairwise vs. sequential) — relative error ≤ 1e-12, which can
+change the rounded typical_avg by 1 mg/dL only when the mean lies within
+that distance of a .5 boundary.
+"""
+
+import numpy as np
+
+N_BINS = 96
+BIN_MINUTES = 15
+_US_PER_DAY = 86_400_000_000
+
+
+class PatternProfile:
+    """
+    Samples of one patient's readings in [since_us, last_ts_us], sorted by
+    minute of day.  bin_offsets[b] is the index of the first sample in
+    quarter-hour bin b (bin_offsets[96] == number of samples).
+    """
+
+    def __init__(self, days: int):
+        self.days = days
+        self.since_us = 0
+        self.last_ts_us = -1
+        self.ts_us = np.zeros(0, dtype=np.int64)
+        self.minute = np.zeros(0, dtype=np.int16)
+        self.hour = np.zeros(0, dtype=np.float64)
+        self.value = np.zeros(0, dtype=np.float64)
+        self.bin_offsets = np.zeros(N_BINS + 1, dtype=np.int64)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.ts_us.nbytes + self.minute.nbytes + self.hour.nbytes
+                   + self.value.nbytes + self.bin_offsets.nbytes)
+
+    def __len__(self) -> int:
+        return len(self.ts_us)
+
+    # ==========================================
+    # Update
+    # ==========================================
+
+    def sync(self, columns: dict, now_us: int) -> bool:
+        """
+        Bring the profile up to date with a patient's full columnar reading
+        list.  Readings newer than the last one seen are merged in; if the
+        already-covered range no longer matches (count or value total changed
+        by edits, deletes or back-filled imports) the profile is rebuilt.
+        Returns True when it was rebuilt.
+        """
+        has_ts = columns["has_ts"]
+        ts_us = columns["ts_us"][has_ts]
+        covered = (ts_us >= self.since_us) & (ts_us <= self.last_ts_us)
+        if int(covered.sum()) != len(self) or not np.isclose(
+            columns["value"][has_ts][covered].sum(), self.value.sum()
+        ):
+            self._reset(now_us)
+            self._add(columns, columns["has_ts"] & (columns["ts_us"] >= self.since_us))
+            return True
+
+        self._expire(now_us)
+        self._add(columns, columns["has_ts"] & (columns["ts_us"] > self.last_ts_us)
+                  & (columns["ts_us"] >= self.since_us))
+        return False
+
+    def _reset(self, now_us: int) -> None:
+        self.__init__(self.days)
+        self.since_us = now_us - self.days * _US_PER_DAY
+
+    def _expire(self, now_us: int) -> None:
+        since = now_us - self.days * _US_PER_DAY
+        if since <= self.since_us:
+            return
+        self.since_us = since
+        keep = self.ts_us >= since
+        if not keep.all():
+            self._set(self.ts_us[keep], self.minute[keep],
+                      self.hour[keep], self.value[keep])
+
+    def _add(self, columns: dict, mask: np.ndarray) -> None:
+        if not mask.any():
+            return
+        hour = columns["hour"][mask]
+        minute = np.rint(hour * 60).astype(np.int16)
+        self._set(
+            np.concatenate([self.ts_us, columns["ts_us"][mask]]),
+            np.concatenate([self.minute, minute]),
+            np.concatenate([self.hour, hour]),
+            np.concatenate([self.value, columns["value"][mask]]),
+        )
+
+    def _set(self, ts_us, minute, hour, value) -> None:
+        order = np.argsort(minute, kind="stable")
+        self.ts_us, self.minute = ts_us[order], minute[order]
+        self.hour, self.value = hour[order], value[order]
+        self.bin_offsets = np.searchsorted(
+            self.minute, np.arange(N_BINS + 1) * BIN_MINUTES, side="left")
+        if len(ts_us):
+            self.last_ts_us = max(self.last_ts_us, int(ts_us.max()))
+
+    # ==========================================
+    # Query
+    # ==========================================
+
+    def window(
+        self, current_hour: float, half_width_hours: float, now_us: int, days: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (values, days_ago) of the readings of the last `days` days whose
+        hour of day lies within ±half_width_hours (circular) of current_hour.
+        """
+        centre_bin = int(current_hour * 60) // BIN_MINUTES
+        reach = int(np.ceil(half_width_hours * 60 / BIN_MINUTES)) + 1
+        bins = np.arange(centre_bin - reach, centre_bin + reach + 1) % N_BINS
+        idx = np.concatenate([
+            np.arange(self.bin_offsets[b], self.bin_offsets[b + 1]) for b in np.unique(bins)
+        ])
+
+        d = np.abs(self.hour[idx] - current_hour)
+        in_window = np.minimum(d, 24.0 - d) <= half_width_hours
+        in_window &= self.ts_us[idx] >= now_us - days * _US_PER_DAY
+        idx = idx[in_window]
+
+        days_ago = np.maximum(0.0, (now_us - self.ts_us[idx]) / 1e6 / 86400)
+        return self.value[idx], days_ago
@@ -0,0 +1,56 @@
+"""
+Prediction result cache (API process).
+
+predict() results keyed by (patient, horizon, language, input watermark).
+Every write that changes the patient's inputs moves the watermark (see
+input_watermark_service), which makes the old entries unreachable; they
+age out of the LRU.  Entries also expire after
+PREDICTION_RESULT_CACHE_TTL_SECONDS, because a prediction is relative to
+the time it was made (hours since the last reading, stale notes).
+
+The watermark must be taken *before* the prediction is computed, so that
+a write landing during the computation invalidates its result.
+"""
+
+import os
+import time
+
+from app.services.input_watermark_service import current_watermark
+from app.services.model_store import ByteLRU
+
+PREDICTION_RESULT_CACHE_TTL_SECONDS = float(os.getenv("PREDICTION_RESULT_CACHE_TTL_SECONDS", 300))
+PREDICTION_RESULT_CACHE_MAX_BYTES = int(os.getenv("PREDICTION_RESULT_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+RESULT_ENTRY_BYTES = 4096   # rough size of one result dict incl. advice texts
+
+
+class PredictionResultCache:
+
+    def __init__(self, ttl_seconds: float = PREDICTION_RESULT_CACHE_TTL_SECONDS,
+                 max_bytes: int = PREDICTION_RESULT_CACHE_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self._entries = ByteLRU(max_bytes, size_fn=lambda e: RESULT_ENTRY_BYTES)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(user_id: str, hours: int, lang: str, watermark: tuple) -> str:
+        return f"{user_id}|{hours}|{lang}|{watermark[0]}.{watermark[1]}"
+
+    def get(self, user_id: str, hours: int, lang: str) -> dict | None:
+        """Cached result for the patient's current watermark (with cached=True), or None."""
+        entry = self._entries.get(self._key(user_id, hours, lang, current_watermark(user_id)))
+        if entry is None or time.monotonic() - entry["at"] > self.ttl_seconds:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {**entry["result"], "cached": True}
+
+    def put(self, user_id: str, hours: int, lang: str, watermark: tuple, result: dict) -> None:
+        """Store a result computed from the inputs as of `watermark`."""
+        self._entries.put(
+            self._key(user_id, hours, lang, watermark),
+            {"result": result, "at": time.monotonic()},
+        )
+
+
+prediction_result_cache = PredictionResultCache()
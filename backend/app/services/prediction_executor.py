@@ -0,0 +1,343 @@
+"""
+Process-pool executor for prediction work.
+
+LSTM fine-tuning and inference run in a fixed number of worker processes
+instead of the FastAPI threadpool, so heavy NumPy / TensorFlow work never
+competes for the API process's GIL.  Each worker is a single-process pool
+with its own PredictionService caches (model store, embeddings,
+trajectories, pattern profiles); a patient is always routed to the same
+worker (crc32 of the user id), so those caches stay warm.
+
+Identical jobs (same method, patient and arguments) that are already
+queued or running are coalesced: a patient and their family opening the
+app together, or an on-demand request racing the auto-prediction loop,
+share one computation instead of each fetching the data and fine-tuning.
+
+Jobs wait in two lanes per worker.  Interactive requests (the predict
+routes) are always dispatched first and tracked against a latency SLO
+(PREDICTION_INTERACTIVE_SLO_SECONDS); batch jobs (auto-prediction) only
+run on leftover capacity — see batch_capacity() and metrics().
+
+Workers are started lazily with the "spawn" start method (the Firestore
+gRPC client is not fork-safe) and import the prediction service once.
+PREDICTION_EXECUTOR=inline runs jobs on a thread in the API process
+instead (development / tests).
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Worker processes per API process.  The default splits the host's cores
+# (one left for the event loops) across the uvicorn workers, so
+# `uvicorn --workers N` (WEB_CONCURRENCY=N) does not start N×(cpu-1) pools.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+PREDICTION_WORKERS = int(os.getenv(
+    "PREDICTION_WORKERS", str(max(1, ((os.cpu_count() or 2) - 1) // WEB_CONCURRENCY))))
+PREDICTION_WORKER_THREADS = os.getenv("PREDICTION_WORKER_THREADS", "1")
+PREDICTION_EXECUTOR = os.getenv("PREDICTION_EXECUTOR", "process")   # process / inline
+PREDICTION_INTERACTIVE_SLO_SECONDS = float(os.getenv("PREDICTION_INTERACTIVE_SLO_SECONDS", 2))
+
+LANES = ("interactive", "batch")      # dispatch order: strict priority
+LANE_WAIT_SAMPLES = 512               # recent queue waits kept per lane
+LANE_PRESSURE_WINDOW_SECONDS = 60     # interactive waits that count for batch back-off
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+
+# ==========================================
+# Worker Side
+# ==========================================
+
+def _init_worker() -> None:
+    """Runs once per worker: cap BLAS / TF threads, then load the service."""
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"):
+        os.environ.setdefault(var, PREDICTION_WORKER_THREADS)
+    from app.services.prediction_service import prediction_service  # noqa: F401
+    print(f"[PredictionWorker] ready (pid {os.getpid()})")
+
+
+def _run(method: str, kwargs: dict):
+    from app.services.prediction_service import prediction_service
+    return getattr(prediction_service, method)(**kwargs)
+
+
+# ==========================================
+# Executor
+# ==========================================
+
+class PredictionExecutor:
+    """
+    Routes prediction jobs to per-patient worker processes.
+
+    submit() returns a concurrent Future (scheduler / background use);
+    run() is the awaitable used by the API routes.  Every caller gets its
+    own Future, so cancelling one (e.g. a scheduler timeout) never cancels
+    a coalesced job another caller is still waiting for.
+
+    Each worker runs one job at a time, fed from two lanes: "interactive"
+    (API requests) always goes first, "batch" (auto-prediction) only gets
+    a worker with nothing interactive waiting.  batch_capacity() tells the
+    scheduler how much it may keep in flight; metrics() reports queue
+    depth and wait times per lane.
+    """
+
+    def __init__(self, workers: int = PREDICTION_WORKERS, mode: str = PREDICTION_EXECUTOR):
+        self.workers = max(1, workers)
+        self.mode = mode
+        self._pools: list = [None] * self.workers
+        self._lock = threading.Lock()
+        self._flights: dict[tuple, dict] = {}   # job key → {"job", "waiters"}
+        self._flight_lock = threading.RLock()
+        self.coalesced = 0
+        # Lanes: per worker one queue per lane, and the lane of the running job
+        self._queues = [{lane: deque() for lane in LANES} for _ in range(self.workers)]
+        self._running: list[str | None] = [None] * self.workers
+        self._dispatch_lock = threading.Lock()
+        self._waits = {lane: deque(maxlen=LANE_WAIT_SAMPLES) for lane in LANES}   # (at, wait s)
+        self._submitted = {lane: 0 for lane in LANES}
+        self.slo_breaches = 0
+
+    def _shard(self, user_id: str) -> int:
+        return zlib.crc32(user_id.encode()) % self.workers
+
+    def _pool(self, shard: int):
+        with self._lock:
+            pool = self._pools[shard]
+            if pool is None:
+                if self.mode == "inline":
+                    pool = ThreadPoolExecutor(
+                        max_workers=1, thread_name_prefix=f"prediction-{shard}")
+                else:
+                    pool = ProcessPoolExecutor(
+                        max_workers=1,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                    )
+                self._pools[shard] = pool
+            return pool
+
+    def _reset(self, shard: int, broken) -> None:
+        with self._lock:
+            if self._pools[shard] is broken:
+                self._pools[shard] = None
+        broken.shutdown(wait=False, cancel_futures=True)
+        print(f"⚠️  [PredictionExecutor] worker {shard} crashed — restarting")
+
+    def _pool_submit(self, shard: int, job: dict) -> Future:
+        args = (_run, job["method"], {"user_id": job["user_id"], **job["kwargs"]})
+        pool = self._pool(shard)
+        try:
+            return pool.submit(*args)
+        except BrokenProcessPool:
+            self._reset(shard, pool)
+            return self._pool(shard).submit(*args)
+
+    # ==========================================
+    # Lanes
+    # ==========================================
+
+    def _enqueue(self, method: str, user_id: str, kwargs: dict, lane: str) -> dict:
+        shard = self._shard(user_id)
+        job = {
+            "method": method, "user_id": user_id, "kwargs": kwargs, "lane": lane,
+            "future": Future(), "enqueued": time.monotonic(), "dispatched": False,
+        }
+        with self._dispatch_lock:
+            self._queues[shard][lane].append(job)
+            self._submitted[lane] += 1
+        self._dispatch(shard)
+        return job
+
+    def _promote(self, job: dict) -> None:
+        """An interactive caller joined a queued batch job: move it up a lane."""
+        with self._dispatch_lock:
+            if job["dispatched"] or job["lane"] == "interactive":
+                return
+            job["lane"] = "interactive"
+            self._queues[self._shard(job["user_id"])]["interactive"].append(job)
+        self._dispatch(self._shard(job["user_id"]))
+
+    def _next_job(self, shard: int) -> dict | None:
+        # Caller holds _dispatch_lock
+        for lane in LANES:
+            queue = self._queues[shard][lane]
+            while queue:
+                job = queue.popleft()
+                if job["dispatched"] or job["lane"] != lane:
+                    continue   # promoted: its entry in the other lane is live
+                job["dispatched"] = True
+                if job["future"].set_running_or_notify_cancel():
+                    return job
+        return None
+
+    def _dispatch(self, shard: int) -> None:
+        """Start the next job if the worker is idle — interactive lane first."""
+        with self._dispatch_lock:
+            if self._running[shard] is not None:
+                return
+            job = self._next_job(shard)
+            if job is None:
+                return
+            self._running[shard] = job["lane"]
+            now = time.monotonic()
+            wait = now - job["enqueued"]
+            self._waits[job["lane"]].append((now, wait))
+            if job["lane"] == "interactive" and wait > PREDICTION_INTERACTIVE_SLO_SECONDS:
+                self.slo_breaches += 1
+        try:
+            pool_future = self._pool_submit(shard, job)
+        except Exception as exc:
+            self._finish(shard, job, None, exc)
+            return
+        pool_future.add_done_callback(lambda f: self._finish(shard, job, f))
+
+    def _finish(self, shard: int, job: dict, pool_future: Future | None,
+                exc: BaseException | None = None) -> None:
+        with self._dispatch_lock:
+            self._running[shard] = None
+        self._dispatch(shard)   # next job starts before this caller wakes up
+
+        if exc is None and pool_future.cancelled():
+            exc = BrokenProcessPool("prediction worker shut down")
+        elif exc is None:
+            exc = pool_future.exception()
+        if exc is None:
+            job["future"].set_result(pool_future.result())
+        else:
+            job["future"].set_exception(exc)
+
+    def batch_capacity(self, limit: int) -> int:
+        """
+        How many batch jobs the scheduler may keep in flight: the workers
+        with no interactive job running or queued, at most `limit`, halved
+        while recent interactive waits exceed the SLO.
+        """
+        now = time.monotonic()
+        with self._dispatch_lock:
+            free = sum(
+                1 for shard in range(self.workers)
+                if self._running[shard] != "interactive"
+                and not any(j["lane"] == "interactive" and not j["dispatched"]
+                            for j in self._queues[shard]["interactive"])
+            )
+            recent = [w for at, w in self._waits["interactive"] if now - at <= LANE_PRESSURE_WINDOW_SECONDS]
+        capacity = min(limit, free)
+        if recent and _percentile(recent, 0.95) > PREDICTION_INTERACTIVE_SLO_SECONDS:
+            capacity //= 2
+        return capacity
+
+    def metrics(self) -> dict:
+        """Queue depth, running jobs and wait times per lane."""
+        with self._dispatch_lock:
+            lanes = {}
+            for lane in LANES:
+                waits = [w for _, w in self._waits[lane]]
+                lanes[lane] = {
+                    "queued":     sum(1 for q in self._queues for j in q[lane]
+                                      if j["lane"] == lane and not j["dispatched"]),
+                    "running":    sum(1 for r in self._running if r == lane),
+                    "submitted":  self._submitted[lane],
+                    "wait_p50_s": _percentile(waits, 0.50),
+                    "wait_p95_s": _percentile(waits, 0.95),
+                    "wait_max_s": round(max(waits), 3) if waits else None,
+                }
+        return {
+            "workers":           self.workers,
+            "lanes":             lanes,
+            "interactive_slo_s": PREDICTION_INTERACTIVE_SLO_SECONDS,
+            "slo_breaches":      self.slo_breaches,
+            "coalesced":         self.coalesced,
+        }
+
+    # ==========================================
+    # Single-Flight Submit
+    # ==========================================
+
+    def _land(self, key: tuple, source: Future) -> None:
+        with self._flight_lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight["job"]["future"] is source:
+                del self._flights[key]
+
+    def _follow(self, flight: dict) -> Future:
+        """A caller's own Future, resolved from the shared job."""
+        source = flight["job"]["future"]
+        follower: Future = Future()
+
+        def _resolve(src: Future) -> None:
+            try:
+                if src.cancelled():
+                    follower.cancel()
+                elif src.exception() is not None:
+                    follower.set_exception(src.exception())
+                else:
+                    follower.set_result(src.result())
+            except InvalidStateError:
+                pass   # this caller already cancelled
+
+        def _on_cancel(f: Future) -> None:
+            if not f.cancelled():
+                return
+            with self._flight_lock:
+                flight["waiters"] -= 1
+                last = flight["waiters"] == 0
+            if last:
+                source.cancel()   # nobody is waiting any more (no-op once running)
+
+        follower.add_done_callback(_on_cancel)
+        source.add_done_callback(_resolve)
+        return follower
+
+    def submit(self, method: str, user_id: str, lane: str = "interactive", **kwargs) -> Future:
+        """
+        Queue `prediction_service.<method>(user_id=..., **kwargs)` on the
+        patient's worker in `lane`, or join the identical job already in
+        flight (an interactive caller lifts a queued batch job to its lane).
+        """
+        key = (method, user_id, tuple(sorted(kwargs.items())))
+        with self._flight_lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = {"job": self._enqueue(method, user_id, kwargs, lane), "waiters": 0}
+                self._flights[key] = flight
+                flight["job"]["future"].add_done_callback(lambda f: self._land(key, f))
+            else:
+                self.coalesced += 1
+                if lane == "interactive":
+                    self._promote(flight["job"])
+            flight["waiters"] += 1
+            return self._follow(flight)
+
+    async def run(self, method: str, user_id: str, **kwargs):
+        """Await an interactive prediction job without blocking the event loop."""
+        shard = self._shard(user_id)
+        pool = self._pool(shard)
+        try:
+            return await asyncio.wrap_future(self.submit(method, user_id, **kwargs))
+        except BrokenProcessPool:
+            # The worker died mid-job (e.g. OOM): restart it and retry once
+            self._reset(shard, pool)
+            return await asyncio.wrap_future(self.submit(method, user_id, **kwargs))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pools, self._pools = self._pools, [None] * self.workers
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+
+prediction_executor = PredictionExecutor()
@@ -0,0 +1,245 @@
+"""
+Columnar feature building for the glucose prediction service.
+
+Readings and daily-log context are converted once into sorted NumPy
+arrays (integer epoch microseconds + values); the per-reading lifestyle
+features are then computed for every reading at once:
+
+  carbs_30min : meals with  ts - 30 min <= meal_ts <= ts
+  carbs_2h    : meals with  ts - 2 h    <= meal_ts <  ts - 30 min
+  activity_2h : activities  ts - 2 h    <= act_ts  <= ts
+  sleep_hours : most recent sleep log with sleep_ts <= ts (else baseline)
+
+Window sums use `searchsorted` on the timestamps and differences of a
+cumulative sum, so building the (N, 6) matrix costs O((N + L) log L)
+instead of O(N × L) Python work.
+"""
+
+from datetime import datetime, timezone, timedelta
+import numpy as np
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_US = timedelta(microseconds=1)
+_US_PER_MIN = 60_000_000
+_30_MIN_US = 30 * _US_PER_MIN
+_2_H_US = 120 * _US_PER_MIN
+_MAX_OUTLIER_PASSES = 32
+
+
+# ==========================================
+# Timestamp Conversion
+# ==========================================
+
+def to_epoch_us(ts: datetime) -> int:
+    """Exact integer microseconds since the epoch (naive → UTC)."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (ts - _EPOCH) // _ONE_US
+
+
+def readings_to_columns(readings: list[dict]) -> dict:
+    """
+    Columnar view of a reading list, in the same order.
+
+    Returns:
+        ts_us      : int64 epoch microseconds (0 where measuredAt is missing)
+        has_ts     : bool mask of readings with a timestamp
+        hour       : float hour-of-day (hour + minute / 60) in the reading's tz
+        value      : float64 glucose values
+        is_cgm     : bool mask for CGM sources (libreview / csv_cgm)
+    """
+    n = len(readings)
+    ts_us = np.zeros(n, dtype=np.int64)
+    has_ts = np.zeros(n, dtype=bool)
+    hour = np.full(n, 12.0)
+    for i, r in enumerate(readings):
+        ts = r.get("measuredAt")
+        if ts is None:
+            continue
+        if isinstance(ts, str):
+            ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+        ts_us[i] = to_epoch_us(ts)
+        has_ts[i] = True
+        hour[i] = float(ts.hour) + float(ts.minute) / 60.0
+
+    return {
+        "ts_us":  ts_us,
+        "has_ts": has_ts,
+        "hour":   hour,
+        "value":  np.array([float(r["value"]) for r in readings], dtype=np.float64),
+        "is_cgm": np.array(
+            [r.get("source") in ("libreview", "csv_cgm") for r in readings], dtype=bool),
+    }
+
+
+# ==========================================
+# Daily-log Context Arrays
+# ==========================================
+
+def _sorted_series(items: list[dict], key: str) -> tuple[np.ndarray, np.ndarray]:
+    ts = np.array([to_epoch_us(it["ts"]) for it in items], dtype=np.int64)
+    values = np.array([it[key] for it in items], dtype=np.float64)
+    order = np.argsort(ts, kind="stable")
+    return ts[order], values[order]
+
+
+def log_context_arrays(log_ctx: dict) -> dict:
+    """
+    Sorted timestamp arrays + cumulative sums for meals and activities,
+    and sorted (ts, hours) arrays for sleep logs.
+    """
+    meal_ts, carbs = _sorted_series(log_ctx["meals"], "carbs")
+    act_ts, minutes = _sorted_series(log_ctx["activities"], "minutes")
+    sleep_ts, sleep_hours = _sorted_series(log_ctx["sleep_logs"], "hours")
+    return {
+        "meal_ts":     meal_ts,
+        "carbs_cum":   np.concatenate([[0.0], np.cumsum(carbs)]),
+        "act_ts":      act_ts,
+        "minutes_cum": np.concatenate([[0.0], np.cumsum(minutes)]),
+        "sleep_ts":    sleep_ts,
+        "sleep_hours": sleep_hours,
+    }
+
+
+# ==========================================
+# Context Features
+# ==========================================
+
+def _window_sum(
+    event_ts: np.ndarray, cum: np.ndarray,
+    start: np.ndarray, end: np.ndarray, end_side: str,
+) -> np.ndarray:
+    lo = np.searchsorted(event_ts, start, side="left")
+    hi = np.searchsorted(event_ts, end, side=end_side)
+    return cum[hi] - cum[np.minimum(lo, hi)]
+
+
+def context_features(
+    ts_us: np.ndarray, has_ts: np.ndarray, arrays: dict, sleep_baseline: float
+) -> np.ndarray:
+    """
+    (N, 4) matrix of [carbs_30min, carbs_2h, activity_2h, sleep_hours]
+    for each timestamp. Rows without a timestamp get (0, 0, 0, baseline).
+    """
+    start_2h = ts_us - _2_H_US
+    start_30m = ts_us - _30_MIN_US
+
+    carbs_30 = _window_sum(arrays["meal_ts"], arrays["carbs_cum"], start_30m, ts_us, "right")
+    carbs_2h = _window_sum(arrays["meal_ts"], arrays["carbs_cum"], start_2h, start_30m, "left")
+    activity = _window_sum(arrays["act_ts"], arrays["minutes_cum"], start_2h, ts_us, "right")
+
+    sleep_idx = np.searchsorted(arrays["sleep_ts"], ts_us, side="right") - 1
+    sleep = np.where(
+        sleep_idx >= 0,
+        arrays["sleep_hours"][np.maximum(sleep_idx, 0)] if len(arrays["sleep_hours"]) else 0.0,
+        sleep_baseline,
+    )
+
+    ctx = np.stack([carbs_30, carbs_2h, activity, sleep], axis=1)
+    ctx[~has_ts] = [0.0, 0.0, 0.0, sleep_baseline]
+    return ctx
+
+
+def build_feature_matrix(columns: dict, arrays: dict, sleep_baseline: float) -> np.ndarray:
+    """
+    (N, 6) float32 matrix [glucose, hour, carbs_30min, carbs_2h,
+    activity_2h, sleep_hours] for a columnar reading list.
+    """
+    ctx = context_features(
+        columns["ts_us"], columns["has_ts"], arrays, sleep_baseline)
+    return np.column_stack(
+        [columns["value"], columns["hour"], ctx]).astype(np.float32)
+
+
+# ==========================================
+# Outlier Cleaning
+# ==========================================
+
+def outlier_sources(
+    columns: dict, cgm_max_change: float, manual_max_change: float
+) -> np.ndarray:
+    """
+    For each reading, the index of the reading whose value survives
+    outlier cleaning (itself, or the last accepted reading before it).
+
+    A reading is replaced when it jumps more than the allowed change from
+    the previous *cleaned* value; the allowed change scales with the gap
+    to the previous reading (x1 per 30 min, minimum x1).  Because the
+    comparison is against the cleaned value, acceptance is resolved by
+    fixed-point iteration: each pass fixes at least one more leading
+    reading, and real data converges in a handful of passes (pathological
+    chains fall back to a scalar scan after _MAX_OUTLIER_PASSES).
+    """
+    values = columns["value"]
+    n = len(values)
+    idx = np.arange(n)
+    if n == 0:
+        return idx
+
+    max_change = np.where(columns["is_cgm"], cgm_max_change, manual_max_change)
+    both_ts = columns["has_ts"][1:] & columns["has_ts"][:-1]
+    hours_gap = np.abs(np.diff(columns["ts_us"])) / 1e6 / 3600
+    scale = np.where(both_ts, np.maximum(1.0, hours_gap / 0.5), 1.0)
+    max_change[1:] = max_change[1:] * scale
+
+    accepted = np.ones(n, dtype=bool)
+    for _ in range(_MAX_OUTLIER_PASSES):
+        sources = np.maximum.accumulate(np.where(accepted, idx, 0))
+        prev_clean = values[sources[:-1]]
+        new_accepted = np.concatenate(
+            [[True], np.abs(values[1:] - prev_clean) <= max_change[1:]])
+        if np.array_equal(new_accepted, accepted):
+            return sources
+        accepted = new_accepted
+
+    sources = idx.copy()
+    vals, limits = values.tolist(), max_change.tolist()
+    for i in range(1, n):
+        if abs(vals[i] - vals[sources[i - 1]]) > limits[i]:
+            sources[i] = sources[i - 1]
+    return sources
+
+
+# ==========================================
+# Global Trend + Meal Detection
+# ==========================================
+
+def global_slope(values: np.ndarray) -> float:
+    """Least-squares slope of value vs. reading index (mg/dL per interval)."""
+    n = len(values)
+    if n == 0:
+        return 0.0
+    x = np.arange(n, dtype=np.float64) - (n - 1) / 2
+    den = float(np.dot(x, x))
+    if not den:
+        return 0.0
+    return float(np.dot(x, values - values.mean())) / den
+
+
+def last_meal_spike(columns: dict, now_us: int) -> dict | None:
+    """
+    Most recent reading that starts a meal-like rise within the last 24 h:
+    +40 mg/dL over the next 2 readings (high confidence) or +25 mg/dL over
+    the next 4 (medium).  Returns {"hours_ago", "confidence"} or None.
+    """
+    values = columns["value"]
+    n = len(values)
+    if n < 5:
+        return None
+
+    starts = n - 2  # candidates i = 0 … n-3
+    rise_2 = values[2:2 + starts] - values[:starts] > 40
+    rise_4 = np.zeros(starts, dtype=bool)
+    rise_4[:n - 4] = values[4:] - values[:n - 4] > 25
+
+    hours_ago = (now_us - columns["ts_us"][:starts]) / 1e6 / 3600.0
+    recent = columns["has_ts"][:starts] & (hours_ago <= 24)
+    hits = np.flatnonzero((rise_2 | rise_4) & recent)
+    if not len(hits):
+        return None
+
+    i = hits[-1]
+    return {
+        "hours_ago":  round(float(hours_ago[i]), 1),
+        "confidence": "high" if rise_2[i] else "medium",
+    }
@@ -17,6 +17,8 @@ and computes a weighted average + IQR (p25/p75) on raw values.
 
 import os
 import json
+import hashlib
+import time
 import urllib.request
 import urllib.error
 import numpy as np
@@ -24,8 +26,18 @@ from pathlib import Path
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
 from firebase_admin import firestore
-from app.services.family_service import send_prediction_alert, send_stale_pattern_alert
+from app.services.notification_outbox import notification_outbox
 from app.services.health_service import health_service
+from app.services.lstm_engine import (
+    adaptive_batch_size, augmented_batches,
+    fit_head, head_forward, load_keras_weights, make_engine,
+)
+from app.services.model_store import ByteLRU, ModelStore
+from app.services.pattern_profile import PatternProfile
+from app.services.prediction_features import (
+    build_feature_matrix, context_features, global_slope, last_meal_spike,
+    log_context_arrays, outlier_sources, readings_to_columns, to_epoch_us,
+)
 
 load_dotenv()
 
@@ -46,12 +58,33 @@ PATCH_ERROR_THRESHOLD = 40
 CGM_MAX_CHANGE = 50
 MANUAL_MAX_CHANGE = 80
 AUGMENT_COPIES = 3
-FINETUNE_EPOCHS = 15
+FINETUNE_EPOCHS = 15              # upper bound; early stopping usually ends sooner
 FINETUNE_LR = 5e-4
+FINETUNE_PATIENCE = 3             # epochs without a better val loss before stopping
+FINETUNE_MIN_BATCH = 8
+FINETUNE_MAX_BATCH = 256
+FINETUNE_TARGET_STEPS = 100       # batch size aims for ~this many steps per epoch
+FINETUNE_TIME_BUDGET_SECONDS = float(os.getenv("FINETUNE_TIME_BUDGET_SECONDS", 20))
+HEAD_BATCH_SIZE = 32              # minimum batch size for head-only fine-tuning
+HEAD_RIDGE_ALPHA = 1e-2
+INCREMENTAL_MAX_NEW_ROWS = 48     # warm-start only if ≤ this many readings were added
+INCREMENTAL_REPLAY_WINDOWS = 32   # recent old windows replayed with the new ones
+INCREMENTAL_EPOCHS = 5
+FULL_REFIT_EVERY = 24             # incremental updates before a forced full refit
+SIGMA_MEMORY_WINDOWS = 50         # how slowly sigma follows new residuals
 MAX_STALE_HOURS = 24
 PATTERN_DAYS = 30
 PATTERN_HOUR_WINDOW = 1.5   # ±1.5 h circular window
 PATTERN_MIN_SAMPLES = 5
+MAX_HORIZON_HOURS = 24
+# Input horizon: only readings / daily logs newer than the horizon start are
+# fetched, and at most PREDICTION_MAX_WINDOWS training windows are built.
+# Both boundaries move in steps, so the feature matrix keeps a stable prefix
+# between steps (incremental updates and embedding reuse keep working).
+PREDICTION_HISTORY_DAYS = max(PATTERN_DAYS, int(os.getenv("PREDICTION_HISTORY_DAYS", 90)))
+PREDICTION_MAX_WINDOWS = int(os.getenv("PREDICTION_MAX_WINDOWS", 2880))
+HORIZON_STEP_DAYS = 7
+HORIZON_STEP_WINDOWS = 96
 
 ALERT_RATE_LIMIT: dict[str, int] = {
     "low":         60,   # minutes between same-type alerts
@@ -65,8 +98,21 @@ ALERT_RATE_LIMIT: dict[str, int] = {
 ACTIVITY_LEVEL_MAP = {"low": 0.2, "moderate": 0.5, "high": 0.8}
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+# "head": fit only the Dense layers on cached frozen-LSTM embeddings (fast)
+# "full": legacy Keras model.fit over augmented windows
+FINETUNE_MODE = os.getenv("PREDICTION_FINETUNE_MODE", "head")
+# Inference backend: "numpy" (no TensorFlow import) or "keras"
+PREDICTION_BACKEND = os.getenv("PREDICTION_BACKEND", "numpy")
 BASE_MODEL_PATH = Path(__file__).parent.parent.parent / \
     "models" / "base_model.keras"
+MODEL_STORE_DIR = Path(os.getenv(
+    "MODEL_STORE_DIR",
+    str(Path(__file__).parent.parent.parent / "models" / "patients"),
+))
+MODEL_STORE_MAX_BYTES = int(os.getenv("MODEL_STORE_MAX_BYTES", 64 * 1024 * 1024))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+TRAJECTORY_CACHE_MAX_BYTES = 4 * 1024 * 1024
+PATTERN_PROFILE_CACHE_MAX_BYTES = int(os.getenv("PATTERN_PROFILE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
 
 
 # ==========================================
@@ -75,7 +121,21 @@ BASE_MODEL_PATH = Path(__file__).parent.parent.parent / \
 
 class PredictionService:
 
-    _model_cache:     dict = {}   # user_id → {model, n_readings, sigma}
+    # user_id → {model (engine), sigma, fingerprint, n_readings}; disk-backed
+    _model_store = ModelStore(MODEL_STORE_DIR, MODEL_STORE_MAX_BYTES, PREDICTION_BACKEND)
+    # user_id → {scaled, emb}  (frozen-LSTM outputs, memory only)
+    _embedding_cache = ByteLRU(
+        EMBEDDING_CACHE_MAX_BYTES,
+        size_fn=lambda e: e["scaled"].nbytes + e["emb"].nbytes,
+    )
+    # user_id → {watermark, trajectory (mg/dL, 1…24 h), sigma}
+    _trajectory_cache = ByteLRU(
+        TRAJECTORY_CACHE_MAX_BYTES,
+        size_fn=lambda e: e["trajectory"].nbytes + 128,
+    )
+    # user_id → PatternProfile (hour-of-day samples of the last PATTERN_DAYS)
+    _pattern_profiles = ByteLRU(
+        PATTERN_PROFILE_CACHE_MAX_BYTES, size_fn=lambda p: p.nbytes)
     _base_weights = None
     _last_alert_sent: dict = {}   # "{user_id}:{alert_type}" → datetime
 
@@ -102,10 +162,35 @@ class PredictionService:
     # Fetch Glucose Readings
     # ==========================================
 
-    def _fetch_readings(self, user_id: str) -> list[dict]:
+    @staticmethod
+    def _horizon_start(now: datetime | None = None) -> datetime:
+        """
+        Oldest timestamp used for prediction inputs: PREDICTION_HISTORY_DAYS
+        ago, floored to a HORIZON_STEP_DAYS boundary (UTC midnight).
+        """
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - timedelta(days=PREDICTION_HISTORY_DAYS)
+        step_us = HORIZON_STEP_DAYS * 86_400_000_000
+        start_us = to_epoch_us(cutoff) // step_us * step_us
+        return datetime.fromtimestamp(0, timezone.utc) + timedelta(microseconds=start_us)
+
+    @staticmethod
+    def _window_start(n_rows: int) -> int:
+        """
+        First feature row to keep so that at most PREDICTION_MAX_WINDOWS
+        windows are built; advances in HORIZON_STEP_WINDOWS-row steps.
+        """
+        max_rows = PREDICTION_MAX_WINDOWS + SEQUENCE_LENGTH
+        if n_rows <= max_rows:
+            return 0
+        return ((n_rows - max_rows) // HORIZON_STEP_WINDOWS + 1) * HORIZON_STEP_WINDOWS
+
+    def _fetch_readings(self, user_id: str, since: datetime | None = None) -> list[dict]:
+        since = since or self._horizon_start()
         docs = (
             self.db.collection("glucose_readings")
             .where("userId", "==", user_id)
+            .where("measuredAt", ">=", since)
             .stream()
         )
         readings = []
@@ -142,28 +227,50 @@ class PredictionService:
     # Fetch Daily Log Context
     # ==========================================
 
-    def _fetch_daily_log_context(self, user_id: str) -> dict:
+    def _fetch_daily_log_context(self, user_id: str, since: datetime | None = None) -> dict:
+        """
+        Meals / activities from 2 h before the horizon start (their context
+        window), sleep logs since the horizon start plus the last one before it.
+        """
         def _ensure_tz(ts):
             if ts and hasattr(ts, "tzinfo") and ts.tzinfo is None:
                 return ts.replace(tzinfo=timezone.utc)
             return ts
 
+        since = since or self._horizon_start()
+        events_since = since - timedelta(hours=2)
         meals, activities, sleep_logs = [], [], []
 
-        for doc in self.db.collection("meals").where("userId", "==", user_id).stream():
+        def _logs(collection: str, start: datetime):
+            return (
+                self.db.collection(collection)
+                .where("userId", "==", user_id)
+                .where("timestamp", ">=", start)
+                .stream()
+            )
+
+        for doc in _logs("meals", events_since):
             d = doc.to_dict()
             ts = _ensure_tz(d.get("timestamp"))
             if ts:
                 meals.append({"ts": ts, "carbs": float(d.get("carbs", 0))})
 
-        for doc in self.db.collection("activities").where("userId", "==", user_id).stream():
+        for doc in _logs("activities", events_since):
             d = doc.to_dict()
             ts = _ensure_tz(d.get("timestamp"))
             if ts:
                 activities.append(
                     {"ts": ts, "minutes": float(d.get("duration_minutes", 0))})
 
-        for doc in self.db.collection("sleep_logs").where("userId", "==", user_id).stream():
+        previous_sleep = (
+            self.db.collection("sleep_logs")
+            .where("userId", "==", user_id)
+            .where("timestamp", "<", since)
+            .order_by("timestamp", direction="DESCENDING")
+            .limit(1)
+            .stream()
+        )
+        for doc in [*previous_sleep, *_logs("sleep_logs", since)]:
             d = doc.to_dict()
             ts = _ensure_tz(d.get("timestamp"))
             if ts:
@@ -173,74 +280,35 @@ class PredictionService:
         sleep_logs.sort(key=lambda x: x["ts"])
         return {"meals": meals, "activities": activities, "sleep_logs": sleep_logs}
 
-    # ==========================================
-    # Context Features for One Reading
-    # ==========================================
-
-    def _context_for_reading(
-        self, reading: dict, log_ctx: dict, sleep_baseline: float
-    ) -> tuple[float, float, float, float, float]:
-        ts = reading.get("measuredAt")
-        if ts is None:
-            return 12.0, 0.0, 0.0, 0.0, sleep_baseline
-        if hasattr(ts, "tzinfo") and ts.tzinfo is None:
-            ts = ts.replace(tzinfo=timezone.utc)
-
-        window_2h_start = ts - timedelta(hours=2)
-        window_30m_start = ts - timedelta(minutes=30)
-        hour = float(ts.hour) + float(ts.minute) / 60.0
-
-        carbs_30min = sum(
-            m["carbs"] for m in log_ctx["meals"]
-            if window_30m_start <= m["ts"] <= ts
-        )
-        carbs_2h = sum(
-            m["carbs"] for m in log_ctx["meals"]
-            if window_2h_start <= m["ts"] < window_30m_start
-        )
-        activity_2h = sum(
-            a["minutes"] for a in log_ctx["activities"]
-            if window_2h_start <= a["ts"] <= ts
-        )
-        past_sleep = [s for s in log_ctx["sleep_logs"] if s["ts"] <= ts]
-        sleep_hours = past_sleep[-1]["hours"] if past_sleep else sleep_baseline
-
-        return hour, carbs_30min, carbs_2h, activity_2h, sleep_hours
-
     # ==========================================
     # Remove Outliers
     # ==========================================
 
-    def _remove_outliers(self, readings: list[dict]) -> list[dict]:
+    def _remove_outliers(
+        self, readings: list[dict], columns: dict | None = None
+    ) -> list[dict]:
         if not readings:
             return readings
-        cleaned = [readings[0]]
-        for i in range(1, len(readings)):
-            current = readings[i]
-            prev = cleaned[-1]
-            is_cgm = current.get("source") in ("libreview", "csv_cgm")
-            base_max = CGM_MAX_CHANGE if is_cgm else MANUAL_MAX_CHANGE
-
-            prev_ts = prev.get("measuredAt")
-            curr_ts = current.get("measuredAt")
-            if prev_ts and curr_ts:
-                if hasattr(prev_ts, "tzinfo") and prev_ts.tzinfo is None:
-                    prev_ts = prev_ts.replace(tzinfo=timezone.utc)
-                if hasattr(curr_ts, "tzinfo") and curr_ts.tzinfo is None:
-                    curr_ts = curr_ts.replace(tzinfo=timezone.utc)
-                hours_gap = abs((curr_ts - prev_ts).total_seconds()) / 3600
-                max_change = base_max * max(1.0, hours_gap / 0.5)
-            else:
-                max_change = base_max
-
-            if abs(current["value"] - prev["value"]) > max_change:
-                fixed = dict(current)
-                fixed["value"] = prev["value"]
-                cleaned.append(fixed)
-            else:
-                cleaned.append(current)
+        if columns is None:
+            columns = readings_to_columns(readings)
+        sources = outlier_sources(columns, CGM_MAX_CHANGE, MANUAL_MAX_CHANGE)
+
+        cleaned = list(readings)
+        for i in np.flatnonzero(sources != np.arange(len(readings))):
+            fixed = dict(readings[i])
+            fixed["value"] = readings[sources[i]]["value"]
+            cleaned[i] = fixed
         return cleaned
 
+    def _clean_readings(self, raw_readings: list[dict]) -> tuple[list[dict], dict]:
+        """
+        Outlier-cleaned readings plus their columnar view (converted once
+        and shared by feature building, trend and meal detection).
+        """
+        columns = readings_to_columns(raw_readings)
+        cleaned = self._remove_outliers(raw_readings, columns)
+        return cleaned, columns
+
     # ==========================================
     # Trend + Probability
     # ==========================================
@@ -289,27 +357,230 @@ class PredictionService:
     # ==========================================
 
     def _get_base_model(self):
-        import tensorflow as tf
-        model = tf.keras.Sequential([
-            tf.keras.layers.LSTM(64, input_shape=(
-                SEQUENCE_LENGTH, N_FEATURES)),
-            tf.keras.layers.Dense(16, activation="relu"),
-            tf.keras.layers.Dense(1),
-        ], name="glucose_lstm")
-
+        """
+        Fresh inference engine (PREDICTION_BACKEND) holding the base weights.
+        Weights are read from base_model.keras once, without TensorFlow.
+        """
         if PredictionService._base_weights is None and BASE_MODEL_PATH.exists():
             try:
-                tmp = tf.keras.models.load_model(str(BASE_MODEL_PATH))
-                PredictionService._base_weights = tmp.get_weights()
+                PredictionService._base_weights = load_keras_weights(
+                    BASE_MODEL_PATH)
                 print(f"✅ Base model weights loaded from {BASE_MODEL_PATH}")
             except Exception as e:
                 print(f"⚠️  Could not load base model: {e}")
 
-        if PredictionService._base_weights is not None:
-            model(np.zeros((1, SEQUENCE_LENGTH, N_FEATURES), dtype=np.float32))
-            model.set_weights(PredictionService._base_weights)
+        return make_engine(PREDICTION_BACKEND, PredictionService._base_weights)
+
+    # ==========================================
+    # Fine-tuning
+    # ==========================================
+
+    @staticmethod
+    def _recency_weights(n_train: int) -> np.ndarray:
+        return np.exp(np.linspace(0, 3, n_train)).astype(np.float32)
+
+    def _lstm_embeddings(
+        self, model, user_id: str, scaled: np.ndarray, X: np.ndarray
+    ) -> np.ndarray:
+        """
+        Frozen-LSTM outputs (64-dim) for every window in X, cached per patient.
+        Windows are built from consecutive rows of `scaled`, so when the new
+        matrix extends the cached one only the windows over new rows are run.
+        """
+        cached = PredictionService._embedding_cache.get(user_id)
+        reuse = 0
+        if cached is not None:
+            old_scaled = cached["scaled"]
+            if len(old_scaled) <= len(scaled) and np.array_equal(
+                old_scaled, scaled[: len(old_scaled)]
+            ):
+                reuse = min(len(cached["emb"]), len(X))
+
+        emb = cached["emb"][:reuse] if reuse else np.zeros((0, 64), np.float32)
+        if reuse < len(X):
+            emb = np.concatenate([emb, model.embed(X[reuse:])])
+
+        PredictionService._embedding_cache.put(
+            user_id, {"scaled": scaled.copy(), "emb": emb})
+        print(f"[Prediction] LSTM embeddings: {reuse} cached, {len(X) - reuse} new")
+        return emb
+
+    def _finetune_head(
+        self,
+        model,
+        user_id: str,
+        scaled: np.ndarray,
+        X: np.ndarray,
+        y_train: np.ndarray,
+        split: int,
+        y_val: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray, dict]:
+        """
+        Head-only fine-tune: the LSTM runs once per window (cached), then
+        Dense(16) → Dense(1) are fitted in NumPy with a ridge-refit last layer.
+        Gaussian input augmentation is not used here; the ridge prior towards
+        the pretrained head plays the regularising role instead.
+        Returns (val predictions, train predictions, training stats).
+        """
+        emb = self._lstm_embeddings(model, user_id, scaled, X)
+        emb_train, emb_val = emb[:split], emb[split:]
+
+        w = self._recency_weights(len(emb_train))
+        w = w / w.mean()
+        batch_size = adaptive_batch_size(
+            len(emb_train), HEAD_BATCH_SIZE, FINETUNE_MAX_BATCH, FINETUNE_TARGET_STEPS)
+        (w1, b1, w2, b2), stats = fit_head(
+            emb_train, y_train, w, model.head_weights(),
+            epochs=FINETUNE_EPOCHS, lr=FINETUNE_LR,
+            batch_size=batch_size, ridge_alpha=HEAD_RIDGE_ALPHA,
+            val=(emb_val, y_val) if y_val is not None else None,
+            patience=FINETUNE_PATIENCE, time_budget=FINETUNE_TIME_BUDGET_SECONDS,
+            return_stats=True,
+        )
+        model.set_head(w1, b1, w2, b2)
+
+        return (
+            head_forward(emb_val, w1, b1, w2, b2),
+            head_forward(emb_train, w1, b1, w2, b2),
+            {**stats, "batch_size": batch_size},
+        )
+
+    def _finetune_full(
+        self,
+        model,
+        X_raw_train: np.ndarray,
+        y_raw_train: np.ndarray,
+        X_val: np.ndarray,
+        epochs: int = FINETUNE_EPOCHS,
+        y_val: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray, dict]:
+        """
+        Legacy fine-tune: Keras model.fit with the LSTM frozen, over
+        AUGMENT_COPIES noise-augmented copies of the training windows
+        (noise is generated per batch, the copies are never materialised).
+        The fitted weights are copied back into the engine afterwards.
+        With y_val, training stops early on val_loss (best weights kept);
+        it always stops after the epoch that exceeds the time budget.
+        Returns (val predictions, train predictions, training stats).
+        """
+        import tensorflow as tf
+        tf.random.set_seed(42)
+        started = time.perf_counter()
+
+        class TimeBudget(tf.keras.callbacks.Callback):
+            def on_epoch_end(self, epoch, logs=None):
+                if time.perf_counter() - started > FINETUNE_TIME_BUDGET_SECONDS:
+                    self.model.stop_training = True
+
+        keras_model = model.keras_model()
+        keras_model.layers[0].trainable = False
+        keras_model.compile(
+            optimizer=tf.keras.optimizers.Adam(learning_rate=FINETUNE_LR),
+            loss="mse",
+        )
+        raw_w = self._recency_weights(len(X_raw_train))
+        raw_w = raw_w / raw_w.mean()
+        batch_size = adaptive_batch_size(
+            len(X_raw_train) * AUGMENT_COPIES,
+            FINETUNE_MIN_BATCH, FINETUNE_MAX_BATCH, FINETUNE_TARGET_STEPS)
+        batches = augmented_batches(
+            X_raw_train, y_raw_train, raw_w, AUGMENT_COPIES, batch_size=batch_size)
+        steps = -(-len(X_raw_train) * AUGMENT_COPIES // batch_size)
+
+        callbacks = [TimeBudget()]
+        validation_data = None
+        if y_val is not None and len(X_val) > 0:
+            validation_data = (X_val, y_val)
+            callbacks.append(tf.keras.callbacks.EarlyStopping(
+                monitor="val_loss", patience=FINETUNE_PATIENCE,
+                restore_best_weights=True))
+
+        history = keras_model.fit(
+            batches, steps_per_epoch=steps, epochs=epochs, shuffle=False,
+            validation_data=validation_data, callbacks=callbacks, verbose=0)
+        model.set_weights(keras_model.get_weights())
+
+        n_epochs = len(history.epoch)
+        stats = {
+            "epochs":        n_epochs,
+            "batch_size":    batch_size,
+            "seconds":       round(time.perf_counter() - started, 3),
+            "stopped_early": n_epochs < epochs,
+        }
+        if len(X_val) > 0:
+            return model.predict(X_val), np.zeros(0), stats
+        return np.zeros(0), model.predict(X_raw_train), stats
+
+    # ==========================================
+    # Incremental (warm-start) Fine-tuning
+    # ==========================================
 
-        return model
+    @staticmethod
+    def _can_update_incrementally(cache: dict | None, scaled: np.ndarray) -> bool:
+        """
+        Warm-start is allowed when the stored model was trained on an exact
+        prefix of the current matrix, only a few rows were appended, and the
+        patient has not reached the periodic full refit (drift cap).
+        """
+        if not cache:
+            return False
+        old_n = cache.get("n_readings", 0)
+        new_rows = len(scaled) - old_n
+        if old_n <= SEQUENCE_LENGTH or not 0 < new_rows <= INCREMENTAL_MAX_NEW_ROWS:
+            return False
+        if cache.get("updates_since_refit", 0) >= FULL_REFIT_EVERY:
+            return False
+        return hashlib.sha1(scaled[:old_n].tobytes()).hexdigest() == cache["fingerprint"]
+
+    def _finetune_incremental(
+        self,
+        cache: dict,
+        user_id: str,
+        scaled: np.ndarray,
+        X: np.ndarray,
+        y: np.ndarray,
+    ) -> tuple[object, float, dict]:
+        """
+        Start from the patient's previous fine-tuned weights and train briefly
+        on the windows whose target is a new reading (plus a short replay of
+        the most recent old windows). Sigma is updated from the previous
+        model's out-of-sample error on the new windows.
+        Returns (model, sigma, training stats).
+        """
+        previous = cache["model"]
+        model = make_engine(
+            PREDICTION_BACKEND, [w.copy() for w in previous.get_weights()])
+
+        first_new = cache["n_readings"] - SEQUENCE_LENGTH
+        start = max(0, first_new - INCREMENTAL_REPLAY_WINDOWS)
+        X_inc, y_inc = X[start:], y[start:]
+
+        y_new_pred = previous.predict(X[first_new:])
+        new_mse = float(np.mean(
+            ((np.clip(y_new_pred, 0.0, 1.0) - y[first_new:])
+             * (GLUCOSE_MAX - GLUCOSE_MIN)) ** 2))
+        alpha = len(y_new_pred) / (len(y_new_pred) + SIGMA_MEMORY_WINDOWS)
+        sigma = max(1.0, float(np.sqrt(
+            (1 - alpha) * cache["sigma"] ** 2 + alpha * new_mse)))
+
+        if FINETUNE_MODE == "head":
+            emb = self._lstm_embeddings(model, user_id, scaled, X)[start:]
+            w = self._recency_weights(len(emb))
+            (w1, b1, w2, b2), stats = fit_head(
+                emb, y_inc, w / w.mean(), model.head_weights(),
+                epochs=INCREMENTAL_EPOCHS, lr=FINETUNE_LR,
+                batch_size=HEAD_BATCH_SIZE, ridge_alpha=HEAD_RIDGE_ALPHA,
+                time_budget=FINETUNE_TIME_BUDGET_SECONDS, return_stats=True,
+            )
+            model.set_head(w1, b1, w2, b2)
+            stats["batch_size"] = HEAD_BATCH_SIZE
+        else:
+            _, _, stats = self._finetune_full(
+                model, X_inc, y_inc, X_inc[:0], epochs=INCREMENTAL_EPOCHS)
+
+        print(f"[Prediction] incremental update: {len(X) - first_new} new windows, "
+              f"{first_new - start} replayed, σ = {sigma:.1f} mg/dL")
+        return model, sigma, stats
 
     # ==========================================
     # LSTM Prediction
@@ -321,13 +592,46 @@ class PredictionService:
         user_id: str,
         hours: int = 1,
         seed_override: np.ndarray | None = None,
-    ) -> tuple[float, float]:
-        import tensorflow as tf
-        tf.random.set_seed(42)
+    ) -> tuple[float, float, dict]:
+        """
+        LSTM prediction `hours` ahead, served from the trajectory cache.
+        Returns (predicted mg/dL, sigma, training info).
+        """
+        trajectory, sigma, training = self._predict_lstm_trajectory(
+            feature_matrix, user_id, seed_override)
+        return float(trajectory[hours - 1]), sigma, training
+
+    def _predict_lstm_trajectory(
+        self,
+        feature_matrix: np.ndarray,
+        user_id: str,
+        seed_override: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, float, dict]:
+        """
+        Full 1…MAX_HORIZON_HOURS trajectory (mg/dL) from one rollout.
+        Cached per patient under a watermark of the model inputs, so every
+        horizon (and the family endpoint) reuses the same computation.
+
+        Also returns how the model was obtained: source is "cache"
+        (trajectory reused), "stored" (model reused), "incremental" or
+        "full_refit", plus the epochs / batch size / seconds of its last
+        fine-tune.
+        """
         np.random.seed(42)
 
         n = feature_matrix.shape[0]
         scaled = self._normalise(feature_matrix)
+        fingerprint = hashlib.sha1(scaled.tobytes()).hexdigest()
+        watermark = fingerprint
+        if seed_override is not None:
+            watermark = hashlib.sha1(
+                fingerprint.encode() + np.ascontiguousarray(seed_override).tobytes()
+            ).hexdigest()
+
+        cached_traj = PredictionService._trajectory_cache.get(user_id)
+        if cached_traj and cached_traj["watermark"] == watermark:
+            return (cached_traj["trajectory"], cached_traj["sigma"],
+                    {**cached_traj["training"], "source": "cache"})
 
         X, y = [], []
         for i in range(n - SEQUENCE_LENGTH):
@@ -340,42 +644,38 @@ class PredictionService:
         X_raw_train, X_val = X[:split], X[split:]
         y_raw_train, y_val = y[:split], y[split:]
 
-        X_aug, y_aug = [X_raw_train], [y_raw_train]
-        for _ in range(AUGMENT_COPIES - 1):
-            noise = np.random.normal(
-                0, 0.01, X_raw_train.shape).astype(np.float32)
-            X_aug.append(X_raw_train + noise)
-            y_aug.append(y_raw_train)
-        X_train = np.concatenate(X_aug)
-        y_train = np.concatenate(y_aug)
-
-        cache = PredictionService._model_cache.get(user_id)
-        if cache and cache["n_readings"] == n:
+        cache = PredictionService._model_store.get(user_id)
+        if cache and cache["fingerprint"] == fingerprint:
             model = cache["model"]
             sigma = cache["sigma"]
+            training = {**cache.get("training", {}), "source": "stored"}
+        elif self._can_update_incrementally(cache, scaled):
+            model, sigma, stats = self._finetune_incremental(
+                cache, user_id, scaled, X, y)
+            training = {"source": "incremental", "mode": FINETUNE_MODE, **stats}
+            PredictionService._model_store.put(
+                user_id, model, sigma=sigma, fingerprint=fingerprint, n_readings=n,
+                updates_since_refit=cache.get("updates_since_refit", 0) + 1,
+                training=training)
         else:
             model = self._get_base_model()
-            model.layers[0].trainable = False
-            model.compile(
-                optimizer=tf.keras.optimizers.Adam(learning_rate=FINETUNE_LR),
-                loss="mse",
-            )
-            raw_w = np.exp(np.linspace(0, 3, len(X_raw_train))
-                           ).astype(np.float32)
-            aug_w = np.concatenate([raw_w] * AUGMENT_COPIES)
-            aug_w = aug_w / aug_w.mean()
-
-            model.fit(X_train, y_train, sample_weight=aug_w,
-                      epochs=FINETUNE_EPOCHS, batch_size=8, verbose=0)
+            if FINETUNE_MODE == "head":
+                y_pred_val, y_pred_tr, stats = self._finetune_head(
+                    model, user_id, scaled, X, y_raw_train, split, y_val)
+            else:
+                y_pred_val, y_pred_tr, stats = self._finetune_full(
+                    model, X_raw_train, y_raw_train, X_val, y_val=y_val)
+            training = {"source": "full_refit", "mode": FINETUNE_MODE, **stats}
+            print(f"[Prediction] fine-tune: {stats['epochs']} epochs, "
+                  f"batch {stats['batch_size']}, {stats['seconds']:.2f}s"
+                  f"{' (stopped early)' if stats['stopped_early'] else ''}")
 
             if len(X_val) > 0:
-                y_pred_val = model.predict(X_val, verbose=0).flatten()
                 y_true_mg = y_val * (GLUCOSE_MAX - GLUCOSE_MIN) + GLUCOSE_MIN
                 y_pred_mg = np.clip(y_pred_val, 0.0, 1.0) * \
                     (GLUCOSE_MAX - GLUCOSE_MIN) + GLUCOSE_MIN
                 sigma = float(np.sqrt(np.mean((y_pred_mg - y_true_mg) ** 2)))
             else:
-                y_pred_tr = model.predict(X_raw_train, verbose=0).flatten()
                 y_true_mg = y_raw_train * \
                     (GLUCOSE_MAX - GLUCOSE_MIN) + GLUCOSE_MIN
                 y_pred_mg = np.clip(y_pred_tr, 0.0, 1.0) * \
@@ -383,44 +683,59 @@ class PredictionService:
                 sigma = float(np.sqrt(np.mean((y_pred_mg - y_true_mg) ** 2)))
             sigma = max(1.0, sigma)
             print(f"[Prediction] σ (val RMSE) = {sigma:.1f} mg/dL")
-            PredictionService._model_cache[user_id] = {
-                "model": model, "n_readings": n, "sigma": sigma}
+            PredictionService._model_store.put(
+                user_id, model, sigma=sigma, fingerprint=fingerprint, n_readings=n,
+                updates_since_refit=0, training=training)
 
         if seed_override is not None:
             seed_scaled = self._normalise(seed_override)
-            seq = list(seed_scaled[-SEQUENCE_LENGTH:])
+            window = seed_scaled[-SEQUENCE_LENGTH:]
             last_hour_raw = seed_override[-1, 1]
             last_context = seed_scaled[-1, 2:].copy()
         else:
-            seq = list(scaled[-SEQUENCE_LENGTH:])
+            window = scaled[-SEQUENCE_LENGTH:]
             last_hour_raw = feature_matrix[-1, 1]
             last_context = scaled[-1, 2:].copy()
 
-        predicted_norm = 0.0
-        for step in range(hours):
-            inp = np.array(seq[-SEQUENCE_LENGTH:]).reshape(1,
-                                                           SEQUENCE_LENGTH, N_FEATURES)
-            predicted_norm = float(model.predict(inp, verbose=0)[0][0])
-            predicted_norm = float(np.clip(predicted_norm, 0.0, 1.0))
-            next_hour = ((last_hour_raw + step + 1) % 24) / 24.0
-            next_row = np.concatenate(
-                [[predicted_norm, next_hour], last_context])
-            seq.append(next_row)
+        trajectory_norm = model.rollout(
+            window, MAX_HORIZON_HOURS, float(last_hour_raw), last_context)
+        trajectory = np.array(
+            [round(self._denormalise_glucose(v), 1) for v in trajectory_norm])
 
-        return round(self._denormalise_glucose(predicted_norm), 1), sigma
+        PredictionService._trajectory_cache.put(user_id, {
+            "watermark": watermark, "trajectory": trajectory,
+            "sigma": sigma, "training": training,
+        })
+        return trajectory, sigma, training
 
     # ==========================================
     # Historical Pattern Prediction
     # ==========================================
 
-    @staticmethod
-    def _hour_distance(h1: float, h2: float) -> float:
-        d = abs(h1 - h2)
-        return min(d, 24.0 - d)
+    def _pattern_profile(
+        self, user_id: str, columns: dict, now_us: int, days: int
+    ) -> PatternProfile:
+        """
+        Cached hour-of-day profile for this patient, synced with the given
+        readings (only readings newer than the last sync are merged in).
+        """
+        if days > PATTERN_DAYS:
+            profile = PatternProfile(days)
+            profile.sync(columns, now_us)
+            return profile
+
+        profile = PredictionService._pattern_profiles.get(user_id)
+        if profile is None:
+            profile = PatternProfile(PATTERN_DAYS)
+        if profile.sync(columns, now_us):
+            print(f"[Pattern] profile rebuilt for {user_id} ({len(profile)} readings)")
+        PredictionService._pattern_profiles.put(user_id, profile)
+        return profile
 
     def calculate_pattern_prediction(
         self, user_id: str, lang: str = "ar", days: int = PATTERN_DAYS,
         preloaded_readings: list[dict] | None = None,
+        columns: dict | None = None,
     ) -> dict:
         """
         Analyse the last `days` days of readings within a ±PATTERN_HOUR_WINDOW
@@ -428,46 +743,29 @@ class PredictionService:
 
         Uses recency weighting (1 / (days_ago + 1)) for the weighted average.
         p25 / p75 are computed on raw values (simpler, still meaningful).
+        Readings are served from the patient's incrementally maintained
+        PatternProfile (see pattern_profile.py for the tolerance).
 
         Returns a dict matching PatternPrediction fields.
         """
-        all_readings = preloaded_readings if preloaded_readings is not None else self._fetch_readings(
-            user_id)
+        if columns is None:
+            all_readings = preloaded_readings if preloaded_readings is not None else self._fetch_readings(
+                user_id)
+            columns = readings_to_columns(all_readings)
         now = datetime.now(timezone.utc)
+        now_us = to_epoch_us(now)
         current_hour = now.hour + now.minute / 60.0
-        cutoff = now - timedelta(days=days)
 
-        window_readings: list[tuple[dict, datetime]] = []
-        for r in all_readings:
-            ts = r.get("measuredAt")
-            if ts is None:
-                continue
-            if hasattr(ts, "tzinfo") and ts.tzinfo is None:
-                ts = ts.replace(tzinfo=timezone.utc)
-            if ts < cutoff:
-                continue
-            r_hour = ts.hour + ts.minute / 60.0
-            if self._hour_distance(r_hour, current_hour) <= PATTERN_HOUR_WINDOW:
-                window_readings.append((r, ts))
+        profile = self._pattern_profile(user_id, columns, now_us, days)
+        values_arr, days_ago = profile.window(
+            current_hour, PATTERN_HOUR_WINDOW, now_us, days)
 
-        sample_count = len(window_readings)
+        sample_count = len(values_arr)
         if sample_count < PATTERN_MIN_SAMPLES:
             return {"available": False, "sample_count": sample_count}
 
-        raw_values:       list[float] = []
-        weighted_sum:     float = 0.0
-        total_weight:     float = 0.0
-
-        for r, ts in window_readings:
-            days_ago = max(0.0, (now - ts).total_seconds() / 86400)
-            weight = 1.0 / (days_ago + 1.0)
-            value = float(r["value"])
-            raw_values.append(value)
-            weighted_sum += value * weight
-            total_weight += weight
-
-        weighted_avg = weighted_sum / total_weight
-        values_arr = np.array(raw_values)
+        weights = 1.0 / (days_ago + 1.0)
+        weighted_avg = float(np.dot(values_arr, weights) / weights.sum())
         typical_min = int(np.percentile(values_arr, 25))
         typical_max = int(np.percentile(values_arr, 75))
         std = float(np.std(values_arr))
@@ -566,6 +864,15 @@ class PredictionService:
             return "high"
         return None
 
+    def _time_in_range(self, columns: dict, hours: int = 24) -> float | None:
+        """Share of the last `hours` of readings within 70–180 mg/dL."""
+        now_us = to_epoch_us(datetime.now(timezone.utc))
+        recent = columns["has_ts"] & (columns["ts_us"] >= now_us - hours * 3_600_000_000)
+        values = columns["value"][recent]
+        if not len(values):
+            return None
+        return round(float(((values >= 70) & (values <= 180)).mean()), 3)
+
     def _ensemble_adjust(
         self,
         lstm_predicted: float,
@@ -574,6 +881,7 @@ class PredictionService:
         pattern_avg: float | None,
         hours_elapsed: float,
         meal_ctx: dict | None = None,
+        slope_per_interval: float | None = None,
     ) -> float:
         """
         Combine LSTM short-term prediction with:
@@ -586,15 +894,9 @@ class PredictionService:
             return lstm_predicted
 
         # ── 1. Global trend (linear regression over all readings) ──
-        values = [r["value"] for r in raw_readings]
-        n = len(values)
-        x = list(range(n))
-        x_mean = (n - 1) / 2
-        y_mean = sum(values) / n
-        slope_num = sum((x[i] - x_mean) * (values[i] - y_mean)
-                        for i in range(n))
-        slope_den = sum((x[i] - x_mean) ** 2 for i in range(n))
-        slope_per_interval = slope_num / slope_den if slope_den else 0.0
+        if slope_per_interval is None:
+            slope_per_interval = global_slope(
+                np.array([r["value"] for r in raw_readings], dtype=np.float64))
 
         # Convert slope to mg/dL per hour (intervals are ~15 min apart)
         intervals_per_hour = 4
@@ -634,46 +936,18 @@ class PredictionService:
               f"(w_lstm={w_lstm:.2f} w_trend={w_trend:.2f})")
         return result
 
-    def _estimate_last_meal(self, raw_readings: list[dict]) -> dict | None:
+    def _estimate_last_meal(
+        self, raw_readings: list[dict], columns: dict | None = None
+    ) -> dict | None:
         """
         Detect the most recent meal-like glucose spike (implicit meal detection).
         Returns {"hours_ago": float, "confidence": "high"|"medium"} or None.
         """
         if len(raw_readings) < 5:
             return None
-
-        now = datetime.now(timezone.utc)
-
-        for i in range(len(raw_readings) - 3, -1, -1):
-            v0 = raw_readings[i]["value"]
-
-            # 30-min window (2 readings): strong spike → high confidence
-            if i + 2 < len(raw_readings):
-                delta = raw_readings[i + 2]["value"] - v0
-                if delta > 40:
-                    ts = raw_readings[i]["measuredAt"]
-                    if isinstance(ts, str):
-                        ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-                    if ts.tzinfo is None:
-                        ts = ts.replace(tzinfo=timezone.utc)
-                    hours_ago = (now - ts).total_seconds() / 3600.0
-                    if hours_ago <= 24:
-                        return {"hours_ago": round(hours_ago, 1), "confidence": "high"}
-
-            # 60-min window (4 readings): moderate spike → medium confidence
-            if i + 4 < len(raw_readings):
-                delta = raw_readings[i + 4]["value"] - v0
-                if delta > 25:
-                    ts = raw_readings[i]["measuredAt"]
-                    if isinstance(ts, str):
-                        ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-                    if ts.tzinfo is None:
-                        ts = ts.replace(tzinfo=timezone.utc)
-                    hours_ago = (now - ts).total_seconds() / 3600.0
-                    if hours_ago <= 24:
-                        return {"hours_ago": round(hours_ago, 1), "confidence": "medium"}
-
-        return None
+        if columns is None:
+            columns = readings_to_columns(raw_readings)
+        return last_meal_spike(columns, to_epoch_us(datetime.now(timezone.utc)))
 
     # ==========================================
     # Insulin Effect
@@ -948,6 +1222,110 @@ Reply in JSON only: {{"patient": "...", "family": "..."}}"""
             print(f"[Groq pattern advice] {parsed}")
         return parsed
 
+    # ==========================================
+    # Pipeline Helpers
+    # ==========================================
+
+    @staticmethod
+    def _hours_since_last_reading(cleaned_readings: list[dict]) -> float:
+        last_ts = cleaned_readings[-1].get("measuredAt")
+        if last_ts is None:
+            return 0.0
+        if hasattr(last_ts, "tzinfo") and last_ts.tzinfo is None:
+            last_ts = last_ts.replace(tzinfo=timezone.utc)
+        return max(
+            0.0, (datetime.now(timezone.utc) - last_ts).total_seconds() / 3600
+        )
+
+    @staticmethod
+    def _mode_for_elapsed(hours_elapsed: float) -> str:
+        if hours_elapsed > MAX_STALE_HOURS:
+            return "pattern"
+        if hours_elapsed >= 6.0:
+            return "hybrid"
+        return "real_time"
+
+    def _build_lstm_inputs(
+        self,
+        user_id: str,
+        cleaned_readings: list[dict],
+        raw_readings: list[dict],
+        raw_columns: dict | None = None,
+    ) -> dict:
+        """
+        Feature matrix + optional virtual "now" seed row for the LSTM,
+        along with the lifestyle context they were built from.
+        """
+        profile = self._fetch_lifestyle_profile(user_id)
+        log_ctx = self._fetch_daily_log_context(user_id)
+        sleep_bl = profile["sleep_hours_baseline"]
+
+        log_arrays = log_context_arrays(log_ctx)
+        if raw_columns is None:
+            columns = readings_to_columns(cleaned_readings)
+        else:
+            columns = {**raw_columns, "value": np.array(
+                [float(r["value"]) for r in cleaned_readings], dtype=np.float64)}
+        start = self._window_start(len(cleaned_readings))
+        if start:
+            columns = {k: v[start:] for k, v in columns.items()}
+        feature_matrix = build_feature_matrix(columns, log_arrays, sleep_bl)
+
+        raw_last = raw_readings[-1]["value"] if raw_readings else None
+        last_was_outlier = raw_last is not None and raw_last != cleaned_readings[-1]["value"]
+        current = raw_last if raw_last is not None else feature_matrix[-1, 0]
+
+        # Virtual "now" seed row when lifestyle context changed
+        now = datetime.now(timezone.utc)
+        now_ctx = context_features(
+            np.array([to_epoch_us(now)]), np.array([True]), log_arrays, sleep_bl,
+        ).astype(np.float32)
+        c30_now, c2h_now, act_now, sleep_now = now_ctx[0]
+        _, c30_last, c2h_last, act_last, _ = feature_matrix[-1, 1:]
+        seed_matrix = None
+        if c30_now != c30_last or c2h_now != c2h_last or act_now > act_last:
+            now_hour = float(now.hour) + float(now.minute) / 60.0
+            virtual_row = np.array(
+                [[current, now_hour, c30_now, c2h_now, act_now, sleep_now]],
+                dtype=np.float32,
+            )
+            seed_matrix = np.vstack([feature_matrix, virtual_row])
+            print(
+                f"[Prediction] Virtual now-row injected: carbs_30={c30_now:.0f}g, act={act_now:.0f}min")
+
+        return {
+            "profile":          profile,
+            "log_ctx":          log_ctx,
+            "log_arrays":       log_arrays,
+            "feature_matrix":   feature_matrix,
+            "seed_matrix":      seed_matrix,
+            "current":          current,
+            "last_was_outlier": last_was_outlier,
+        }
+
+    def _apply_insulin_effect(
+        self, predicted: float, current: float, insulin_effect: float
+    ) -> float:
+        """Subtract the estimated bolus impact from a prediction."""
+        if insulin_effect <= 0:
+            return predicted
+        # Trend-aware factor: scale insulin effect based on natural glucose direction
+        # before insulin is applied (i.e. the model's "unadjusted" trend).
+        # Falling trend → conservative (sugar already dropping, avoid over-correction)
+        # Rising trend  → assertive  (insulin working against the rise)
+        pre_insulin_trend = self._calculate_trend(current, predicted)
+        if pre_insulin_trend == "falling":
+            trend_factor = 0.85
+        elif pre_insulin_trend == "rising":
+            trend_factor = 1.15
+        else:
+            trend_factor = 1.0
+        adjusted_effect = insulin_effect * trend_factor
+        print(f"[Insulin] trend={pre_insulin_trend} factor={trend_factor} "
+              f"adjusted={adjusted_effect:.1f} mg/dL")
+        return float(
+            np.clip(predicted - adjusted_effect, GLUCOSE_MIN, GLUCOSE_MAX))
+
     # ==========================================
     # Main Predict Method
     # ==========================================
@@ -964,7 +1342,7 @@ Reply in JSON only: {{"patient": "...", "family": "..."}}"""
         4. hours_elapsed < 6               → mode = real_time
         """
         raw_readings = self._fetch_readings(user_id)
-        cleaned_readings = self._remove_outliers(raw_readings)
+        cleaned_readings, raw_columns = self._clean_readings(raw_readings)
 
         # ── Insufficient data ─────────────────────────────────────────────
         if len(cleaned_readings) < MIN_READINGS:
@@ -986,24 +1364,9 @@ Reply in JSON only: {{"patient": "...", "family": "..."}}"""
                 ),
             }
 
-        # ── Calculate hours elapsed since last reading ────────────────────
-        hours_elapsed = 0.0
-        last_ts = cleaned_readings[-1].get("measuredAt")
-        if last_ts is not None:
-            if hasattr(last_ts, "tzinfo") and last_ts.tzinfo is None:
-                last_ts = last_ts.replace(tzinfo=timezone.utc)
-            hours_elapsed = max(
-                0.0, (datetime.now(timezone.utc) -
-                      last_ts).total_seconds() / 3600
-            )
-
-        # ── Determine prediction mode ─────────────────────────────────────
-        if hours_elapsed > MAX_STALE_HOURS:
-            prediction_mode = "pattern"
-        elif hours_elapsed >= 6.0:
-            prediction_mode = "hybrid"
-        else:
-            prediction_mode = "real_time"
+        # ── Hours elapsed since last reading → prediction mode ───────────
+        hours_elapsed = self._hours_since_last_reading(cleaned_readings)
+        prediction_mode = self._mode_for_elapsed(hours_elapsed)
 
         print(
             f"[Prediction] mode={prediction_mode}, elapsed={hours_elapsed:.1f}h")
@@ -1013,7 +1376,7 @@ Reply in JSON only: {{"patient": "...", "family": "..."}}"""
         # ══════════════════════════════════════════════════════════════════
         if prediction_mode == "pattern":
             pattern = self.calculate_pattern_prediction(
-                user_id, lang, preloaded_readings=raw_readings)
+                user_id, lang, preloaded_readings=raw_readings, columns=raw_columns)
             e = self._elapsed_str(hours_elapsed, lang)
 
             stale_msg = {
@@ -1071,11 +1434,11 @@ Reply in JSON only: {{"patient": "...", "family": "..."}}"""
                 ak = f"pattern_{risk}"
                 if self._can_send_alert(user_id, ak):
                     try:
-                        send_stale_pattern_alert(
-                            patient_id=user_id,
+                        notification_outbox.enqueue(
+                            "stale_pattern", user_id,
                             patient_name=patient_name,
                             risk_level=risk,
-                            hours_elapsed=hours_elapsed,
+                            hours_elapsed=float(hours_elapsed),
                             typical_avg=pattern.get("typical_avg"),
                         )
                         self._mark_alert_sent(user_id, ak)
@@ -1104,20 +1467,14 @@ Reply in JSON only: {{"patient": "...", "family": "..."}}"""
         # ══════════════════════════════════════════════════════════════════
         # MODE: REAL_TIME or HYBRID — run LSTM
         # ══════════════════════════════════════════════════════════════════
-        profile = self._fetch_lifestyle_profile(user_id)
-        log_ctx = self._fetch_daily_log_context(user_id)
+        inputs = self._build_lstm_inputs(
+            user_id, cleaned_readings, raw_readings, raw_columns)
+        profile = inputs["profile"]
+        log_ctx = inputs["log_ctx"]
         sleep_bl = profile["sleep_hours_baseline"]
-
-        rows = []
-        for r in cleaned_readings:
-            hour, c30, c2h, activity, sleep = self._context_for_reading(
-                r, log_ctx, sleep_bl)
-            rows.append([r["value"], hour, c30, c2h, activity, sleep])
-        feature_matrix = np.array(rows, dtype=np.float32)
-
-        raw_last = raw_readings[-1]["value"] if raw_readings else None
-        last_was_outlier = raw_last is not None and raw_last != cleaned_readings[-1]["value"]
-        current = raw_last if raw_last is not None else feature_matrix[-1, 0]
+        feature_matrix = inputs["feature_matrix"]
+        last_was_outlier = inputs["last_was_outlier"]
+        current = inputs["current"]
 
         # Stale note for hybrid mode
         stale_note = None
@@ -1129,34 +1486,16 @@ Reply in JSON only: {{"patient": "...", "family": "..."}}"""
                 "he": f"הקריאה האחרונה לפני {e} — הוסף קריאה חדשה לתחזית מעודכנת.",
             }
 
-        # Virtual "now" seed row when lifestyle context changed
-        now = datetime.now(timezone.utc)
-        now_reading = {"measuredAt": now, "value": current}
-        _, c30_now, c2h_now, act_now, sleep_now = self._context_for_reading(
-            now_reading, log_ctx, sleep_bl
-        )
-        _, c30_last, c2h_last, act_last, _ = self._context_for_reading(
-            cleaned_readings[-1], log_ctx, sleep_bl
-        )
-        seed_matrix = None
-        if c30_now != c30_last or c2h_now != c2h_last or act_now > act_last:
-            now_hour = float(now.hour) + float(now.minute) / 60.0
-            virtual_row = np.array(
-                [[current, now_hour, c30_now, c2h_now, act_now, sleep_now]],
-                dtype=np.float32,
-            )
-            seed_matrix = np.vstack([feature_matrix, virtual_row])
-            print(
-                f"[Prediction] Virtual now-row injected: carbs_30={c30_now:.0f}g, act={act_now:.0f}min")
-
-        predicted, sigma = self._predict_lstm(
-            feature_matrix, user_id=user_id, hours=hours, seed_override=seed_matrix
+        predicted, sigma, training = self._predict_lstm(
+            feature_matrix, user_id=user_id, hours=hours,
+            seed_override=inputs["seed_matrix"],
         )
 
         # Ensemble: blend LSTM with global trend + historical pattern
         pattern_data = self.calculate_pattern_prediction(
-            user_id, lang, preloaded_readings=raw_readings)
-        meal_ctx = self._estimate_last_meal(raw_readings)
+            user_id, lang, preloaded_readings=raw_readings, columns=raw_columns)
+        meal_ctx = self._estimate_last_meal(raw_readings, raw_columns)
+        slope = global_slope(raw_columns["value"])
         predicted = self._ensemble_adjust(
             lstm_predicted=predicted,
             current=current,
@@ -1164,29 +1503,14 @@ Reply in JSON only: {{"patient": "...", "family": "..."}}"""
             pattern_avg=pattern_data.get("typical_avg"),
             hours_elapsed=hours_elapsed,
             meal_ctx=meal_ctx,
+            slope_per_interval=slope,
         )
 
         # Insulin effect: subtract estimated bolus impact from prediction
         health_info = health_service.get_health_info(user_id)
         isf = health_info.insulin_sensitivity
         insulin_effect = self._compute_insulin_effect(user_id, isf)
-        if insulin_effect > 0:
-            # Trend-aware factor: scale insulin effect based on natural glucose direction
-            # before insulin is applied (i.e. the model's "unadjusted" trend).
-            # Falling trend → conservative (sugar already dropping, avoid over-correction)
-            # Rising trend  → assertive  (insulin working against the rise)
-            pre_insulin_trend = self._calculate_trend(current, predicted)
-            if pre_insulin_trend == "falling":
-                trend_factor = 0.85
-            elif pre_insulin_trend == "rising":
-                trend_factor = 1.15
-            else:
-                trend_factor = 1.0
-            adjusted_effect = insulin_effect * trend_factor
-            predicted = float(
-                np.clip(predicted - adjusted_effect, GLUCOSE_MIN, GLUCOSE_MAX))
-            print(f"[Insulin] trend={pre_insulin_trend} factor={trend_factor} "
-                  f"adjusted={adjusted_effect:.1f} mg/dL")
+        predicted = self._apply_insulin_effect(predicted, current, insulin_effect)
 
         trend = self._calculate_trend(current, predicted)
         prob_up, prob_down = self._calculate_probability(
@@ -1205,8 +1529,8 @@ Reply in JSON only: {{"patient": "...", "family": "..."}}"""
         )
         pattern_risk_level = pattern_data.get("risk_level")
 
-        _, last_c30, last_c2h, last_activity, last_sleep = self._context_for_reading(
-            cleaned_readings[-1], log_ctx, sleep_bl
+        _, last_c30, last_c2h, last_activity, last_sleep = (
+            float(v) for v in feature_matrix[-1, 1:]
         )
         lifestyle_ctx = {
             "carbs_2h":       last_c30 + last_c2h,
@@ -1242,13 +1566,13 @@ Reply in JSON only: {{"patient": "...", "family": "..."}}"""
         # Family notification (rate-limited)
         if alert_type and self._can_send_alert(user_id, alert_type):
             try:
-                send_prediction_alert(
-                    patient_id=user_id,
+                notification_outbox.enqueue(
+                    "prediction_alert", user_id,
                     patient_name=patient_name,
                     alert_type=alert_type,
-                    current=current,
-                    predicted=predicted,
-                    hours=hours,
+                    current=float(current),
+                    predicted=float(predicted),
+                    hours=int(hours),
                     family_advice=advice.get("family") if advice else None,
                 )
                 self._mark_alert_sent(user_id, alert_type)
@@ -1264,14 +1588,101 @@ Reply in JSON only: {{"patient": "...", "family": "..."}}"""
             "prob_up":                  prob_up,
             "prob_down":                prob_down,
             "advice":                   advice,
-            "readings_used":            len(rows),
+            "readings_used":            len(feature_matrix),
             "prediction_mode":          prediction_mode,
             "pattern_prediction":       None,   # card only shown in pattern mode
             "comparison_to_pattern":    comparison,
             "data_stale":               prediction_mode == "hybrid",
             "hours_since_last_reading": round(hours_elapsed, 1),
             "message":                  stale_note.get(lang, stale_note["en"]) if stale_note else None,
+            "training":                 training,
+            # Internal (not part of PredictionResponse): auto-prediction cadence
+            "risk": {
+                "current":        float(current),
+                "sigma":          round(sigma, 1),
+                "slope_per_hour": round(slope * 4, 1),   # readings are ~15 min apart
+                "time_in_range":  self._time_in_range(raw_columns),
+            },
+        }
+
+
+    # ==========================================
+    # Trajectory (1…24 h)
+    # ==========================================
+
+    def predict_trajectory(self, user_id: str) -> dict:
+        """
+        Whole 1…MAX_HORIZON_HOURS prediction curve from a single LSTM rollout
+        (served from the trajectory cache when the inputs have not changed).
+        Each point gets the same ensemble + insulin adjustment as predict(),
+        but no AI advice and no family alerts are produced here.
+        """
+        raw_readings = self._fetch_readings(user_id)
+        cleaned_readings, raw_columns = self._clean_readings(raw_readings)
+
+        result = {
+            "prediction_mode":          "none",
+            "current_value":            None,
+            "sigma":                    None,
+            "readings_used":            len(cleaned_readings),
+            "data_stale":               False,
+            "hours_since_last_reading": None,
+            "points":                   [],
         }
+        if len(cleaned_readings) < MIN_READINGS:
+            return result
+
+        hours_elapsed = self._hours_since_last_reading(cleaned_readings)
+        prediction_mode = self._mode_for_elapsed(hours_elapsed)
+        result.update({
+            "prediction_mode":          prediction_mode,
+            "data_stale":               prediction_mode != "real_time",
+            "hours_since_last_reading": round(hours_elapsed, 1),
+        })
+        if prediction_mode == "pattern":
+            return result
+
+        inputs = self._build_lstm_inputs(
+            user_id, cleaned_readings, raw_readings, raw_columns)
+        current = inputs["current"]
+        trajectory, sigma, training = self._predict_lstm_trajectory(
+            inputs["feature_matrix"], user_id=user_id,
+            seed_override=inputs["seed_matrix"],
+        )
+
+        pattern_avg = self.calculate_pattern_prediction(
+            user_id, preloaded_readings=raw_readings, columns=raw_columns,
+        ).get("typical_avg")
+        meal_ctx = self._estimate_last_meal(raw_readings, raw_columns)
+        isf = health_service.get_health_info(user_id).insulin_sensitivity
+        insulin_effect = self._compute_insulin_effect(user_id, isf)
+        slope = global_slope(raw_columns["value"])
+
+        points = []
+        for h, lstm_value in enumerate(trajectory, start=1):
+            predicted = self._ensemble_adjust(
+                lstm_predicted=float(lstm_value),
+                current=current,
+                raw_readings=raw_readings,
+                pattern_avg=pattern_avg,
+                hours_elapsed=hours_elapsed,
+                meal_ctx=meal_ctx,
+                slope_per_interval=slope,
+            )
+            predicted = self._apply_insulin_effect(predicted, current, insulin_effect)
+            points.append({
+                "hours":           h,
+                "predicted_value": round(predicted, 1),
+                "trend":           self._calculate_trend(current, predicted),
+            })
+
+        result.update({
+            "current_value": float(current),
+            "sigma":         round(sigma, 1),
+            "points":        points,
+            "training":      training,
+        })
+        return result
 
 
 prediction_service = PredictionService()
@@ -0,0 +1,241 @@
+"""
+Shared Expo push client.
+
+Every push the backend sends (emergency, prediction and pattern alerts,
+glucose reminders) goes through push_client:
+
+  - one pooled keep-alive httpx connection to exp.host
+  - messages split into chunks of EXPO_PUSH_CHUNK_SIZE (Expo's limit per
+    request), chunks posted concurrently
+  - push tickets kept until their receipts are fetched, every
+    EXPO_RECEIPT_INTERVAL_MINUTES by a background thread (start/stop in
+    the app lifespan)
+  - tokens Expo reports as DeviceNotRegistered — in a ticket or a
+    receipt — are removed from the user's profile, so they are not sent
+    to again
+
+Sending is best-effort: failures are logged, never raised to the caller.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from app.config.firebase import db
+from app.services.recipient_cache import recipient_cache
+
+USERS_COLLECTION = "users"
+
+EXPO_PUSH_URL = "https://exp.host/--/api/v2/push/send"
+EXPO_RECEIPTS_URL = "https://exp.host/--/api/v2/push/getReceipts"
+EXPO_PUSH_CHUNK_SIZE = 100       # messages per push request (Expo limit)
+EXPO_RECEIPT_CHUNK_SIZE = 1000   # receipt ids per request (Expo limit)
+EXPO_PUSH_TIMEOUT_SECONDS = float(os.getenv("EXPO_PUSH_TIMEOUT_SECONDS", 5))
+EXPO_PUSH_CONCURRENCY = int(os.getenv("EXPO_PUSH_CONCURRENCY", 4))
+EXPO_RECEIPT_INTERVAL_MINUTES = float(os.getenv("EXPO_RECEIPT_INTERVAL_MINUTES", 15))
+EXPO_RECEIPT_MAX_AGE_HOURS = 24   # Expo keeps receipts for a day
+EXPO_MAX_PENDING_TICKETS = 50_000
+# Ticket errors worth sending again later (the others will not go away)
+RETRYABLE_PUSH_ERRORS = {"TransportError", "MessageRateExceeded"}
+
+
+def is_expo_token(token: str | None) -> bool:
+    return bool(token) and token.startswith("ExponentPushToken[")
+
+
+def is_retryable(ticket: dict) -> bool:
+    return (ticket.get("details") or {}).get("error") in RETRYABLE_PUSH_ERRORS
+
+
+def _chunks(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+# ==========================================
+# Client
+# ==========================================
+
+class ExpoPushClient:
+
+    def __init__(self, concurrency: int = EXPO_PUSH_CONCURRENCY):
+        self._http: httpx.Client | None = None
+        self._http_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="expo-push")
+        self._tickets: dict[str, tuple[str, float]] = {}   # ticket id → (token, sent at)
+        self._tickets_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.stats = {"sent": 0, "failed": 0, "pruned": 0}
+
+    def _client(self) -> httpx.Client:
+        with self._http_lock:
+            if self._http is None:
+                self._http = httpx.Client(
+                    timeout=EXPO_PUSH_TIMEOUT_SECONDS,
+                    limits=httpx.Limits(max_keepalive_connections=EXPO_PUSH_CONCURRENCY),
+                    headers={
+                        "Accept":          "application/json",
+                        "Accept-Encoding": "gzip, deflate",
+                    },
+                )
+            return self._http
+
+    def _post(self, url: str, payload) -> dict:
+        response = self._client().post(url, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    # ── Send ──────────────────────────────────────────────────────────
+
+    def _send_chunk(self, chunk: list[dict]) -> list[dict]:
+        try:
+            tickets = list(self._post(EXPO_PUSH_URL, chunk).get("data") or [])
+        except Exception as e:
+            with self._tickets_lock:
+                self.stats["failed"] += len(chunk)
+            print(f"⚠️ Push failed: {e}")
+            return [
+                {"status": "error", "message": str(e), "details": {"error": "TransportError"}}
+                for _ in chunk
+            ]
+
+        # Messages Expo returned no ticket for are unknown: treat them as not sent
+        missing = len(chunk) - len(tickets)
+        if missing > 0:
+            print(f"⚠️ Push: {missing} of {len(chunk)} messages got no ticket")
+            tickets += [
+                {"status": "error", "message": "no ticket returned", "details": {"error": "TransportError"}}
+                for _ in range(missing)
+            ]
+        tickets = tickets[:len(chunk)]
+
+        now = time.time()
+        failed = []
+        with self._tickets_lock:
+            for message, ticket in zip(chunk, tickets):
+                if ticket.get("status") == "ok" and ticket.get("id"):
+                    self.stats["sent"] += 1
+                    self._tickets[ticket["id"]] = (message["to"], now)
+                else:
+                    self.stats["failed"] += 1
+                    failed.append((message["to"], ticket))
+        for token, ticket in failed:
+            self._handle_error(token, ticket)
+        return tickets
+
+    def send(self, messages: list[dict], label: str = "") -> list[dict]:
+        """
+        Send Expo push messages ({"to", "title", "body", ...}).
+        Returns one push ticket per message with a valid token, in order;
+        a chunk that could not be posted, and any message Expo returned no
+        ticket for, gets a TransportError ticket.
+        """
+        messages = [m for m in messages if is_expo_token(m.get("to"))]
+        if not messages:
+            return []
+        chunks = _chunks(messages, EXPO_PUSH_CHUNK_SIZE)
+        if len(chunks) == 1:
+            results = [self._send_chunk(chunks[0])]
+        else:
+            results = list(self._pool.map(self._send_chunk, chunks))
+        tickets = [ticket for chunk_tickets in results for ticket in chunk_tickets]
+        if label and any(t.get("status") == "ok" for t in tickets):
+            print(f"✅ Push sent: {label}")
+        self._trim_tickets()
+        return tickets
+
+    def _trim_tickets(self) -> None:
+        with self._tickets_lock:
+            overflow = len(self._tickets) - EXPO_MAX_PENDING_TICKETS
+            if overflow > 0:
+                for ticket_id in list(self._tickets)[:overflow]:   # oldest first
+                    del self._tickets[ticket_id]
+
+    # ── Receipts ──────────────────────────────────────────────────────
+
+    def check_receipts(self, min_age_seconds: float | None = None) -> dict:
+        """
+        Fetch the receipts of tickets at least `min_age_seconds` old and
+        prune the tokens they report as unregistered.
+        """
+        if min_age_seconds is None:
+            min_age_seconds = EXPO_RECEIPT_INTERVAL_MINUTES * 60
+        now = time.time()
+        with self._tickets_lock:
+            due = {
+                ticket_id: token
+                for ticket_id, (token, sent_at) in self._tickets.items()
+                if now - sent_at >= min_age_seconds
+            }
+        summary = {"checked": 0, "ok": 0, "errors": 0}
+        for ids in _chunks(list(due), EXPO_RECEIPT_CHUNK_SIZE):
+            try:
+                receipts = self._post(EXPO_RECEIPTS_URL, {"ids": ids}).get("data") or {}
+            except Exception as e:
+                print(f"⚠️ [Push] receipts failed: {e}")
+                continue
+            with self._tickets_lock:
+                for ticket_id in ids:
+                    sent_at = self._tickets.get(ticket_id, (None, now))[1]
+                    # Not ready yet: try again next round, until Expo drops it
+                    if ticket_id in receipts or now - sent_at > EXPO_RECEIPT_MAX_AGE_HOURS * 3600:
+                        self._tickets.pop(ticket_id, None)
+            for ticket_id, receipt in receipts.items():
+                summary["checked"] += 1
+                if receipt.get("status") == "ok":
+                    summary["ok"] += 1
+                else:
+                    summary["errors"] += 1
+                    self._handle_error(due.get(ticket_id), receipt)
+        if summary["checked"]:
+            print(f"[Push] receipts: {summary}")
+        return summary
+
+    def _handle_error(self, token: str | None, ticket: dict) -> None:
+        error = (ticket.get("details") or {}).get("error")
+        print(f"⚠️ [Push] {token}: {error or ticket.get('message')}")
+        if error == "DeviceNotRegistered" and token:
+            self.prune_token(token)
+
+    def prune_token(self, token: str) -> None:
+        """Remove an unregistered push token from every profile that holds it."""
+        try:
+            users = db.collection(USERS_COLLECTION).where("pushToken", "==", token).stream()
+            for user_doc in users:
+                user_doc.reference.update({"pushToken": ""})
+                recipient_cache.invalidate_user(user_doc.id)
+                with self._tickets_lock:
+                    self.stats["pruned"] += 1
+                print(f"[Push] pruned invalid token of user {user_doc.id}")
+        except Exception as e:
+            print(f"⚠️ [Push] could not prune token: {e}")
+
+    # ── Lifecycle ─────────────────────────────────────────────────────
+
+    def _loop(self) -> None:
+        while not self._stop.wait(EXPO_RECEIPT_INTERVAL_MINUTES * 60):
+            try:
+                self.check_receipts()
+            except Exception as e:
+                print(f"⚠️ [Push] receipt check failed: {e}")
+
+    def start(self) -> None:
+        self._stop.clear()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="expo-receipts", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+        with self._http_lock:
+            if self._http is not None:
+                self._http.close()
+                self._http = None
+
+
+push_client = ExpoPushClient()
@@ -0,0 +1,101 @@
+"""
+Per-patient alert recipient cache.
+
+Every alert fans out to the patient and their linked family members and
+needs each one's push token, language and name.  That graph only changes
+when someone links or unlinks (join_with_code, remove_family_member,
+remove_patient_link) or edits their token or profile (PUT
+/users/me/push-token, PUT /users/me) — those paths invalidate it, so alert
+fan-out normally does no Firestore reads.
+
+Invalidation is per process; entries also expire after
+RECIPIENT_CACHE_TTL_SECONDS, which bounds how stale another process's
+view can be.
+"""
+
+import os
+import threading
+import time
+
+from app.config.firebase import db
+
+USERS_COLLECTION = "users"
+FAMILY_LINKS_COLLECTION = "family_patient_links"
+
+RECIPIENT_CACHE_TTL_SECONDS = float(os.getenv("RECIPIENT_CACHE_TTL_SECONDS", 300))
+RECIPIENT_FIELDS = ("pushToken", "language", "firstName", "lastName", "email")
+
+
+def _recipient(data: dict) -> dict:
+    return {field: data[field] for field in RECIPIENT_FIELDS if field in data}
+
+
+class RecipientCache:
+
+    def __init__(self, ttl_seconds: float = RECIPIENT_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[str, tuple[float, dict]] = {}   # patient → (loaded at, graph)
+        self._patients_of: dict[str, set[str]] = {}         # user → patients whose graph holds them
+        self._lock = threading.Lock()
+        self._generation = 0   # bumped by every invalidation
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, patient_id: str) -> dict:
+        """One link query + one get_all for the patient and every family member."""
+        links = db.collection(FAMILY_LINKS_COLLECTION)\
+            .where("patient_id", "==", patient_id)\
+            .stream()
+        family_ids = list(dict.fromkeys(
+            fid for fid in (doc.to_dict().get("family_member_id") for doc in links) if fid
+        ))
+        refs = [db.collection(USERS_COLLECTION).document(uid) for uid in [patient_id, *family_ids]]
+        users = {doc.id: _recipient(doc.to_dict()) for doc in db.get_all(refs) if doc.exists}
+        return {
+            "patient": users.get(patient_id),
+            "family":  [(fid, users[fid]) for fid in family_ids if fid in users],
+        }
+
+    def get(self, patient_id: str) -> dict:
+        """
+        {"patient": profile or None, "family": [(user id, profile), ...]}
+        with profiles limited to RECIPIENT_FIELDS.  Treat as read-only.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is not None and now - entry[0] < self.ttl_seconds:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+        graph = self._load(patient_id)
+        with self._lock:
+            if generation != self._generation:
+                return graph   # invalidated while loading: don't cache what may be stale
+            self._entries[patient_id] = (now, graph)
+            for user_id in [patient_id, *(fid for fid, _ in graph["family"])]:
+                self._patients_of.setdefault(user_id, set()).add(patient_id)
+        return graph
+
+    def invalidate(self, patient_id: str) -> None:
+        """The patient's links changed."""
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(patient_id, None)
+
+    def invalidate_user(self, user_id: str) -> None:
+        """A user's token or profile changed: drop every graph they appear in."""
+        with self._lock:
+            self._generation += 1
+            for patient_id in self._patients_of.pop(user_id, set()):
+                self._entries.pop(patient_id, None)
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._patients_of.clear()
+
+
+recipient_cache = RecipientCache()
@@ -1,8 +1,8 @@
-import json
-import urllib.request
 from datetime import datetime, timezone, timedelta
 from app.config.firebase import db
 from app.services.notification_service import save_notification
+from app.services.push_service import push_client
+from app.services.shard_service import shard_membership
 
 USERS_COLLECTION = "users"
 GLUCOSE_COLLECTION = "glucose_readings"
@@ -10,37 +10,6 @@ GLUCOSE_COLLECTION = "glucose_readings"
 REMINDER_INTERVAL_HOURS = 4
 
 
-def _send_push(tokens: list[str], title: str, body: str, data: dict) -> None:
-    messages = [
-        {
-            "to": token,
-            "title": title,
-            "body": body,
-            "data": data,
-            "sound": "default",
-            "priority": "normal",
-        }
-        for token in tokens
-    ]
-    try:
-        payload = json.dumps(messages).encode("utf-8")
-        req = urllib.request.Request(
-            "https://exp.host/--/api/v2/push/send",
-            data=payload,
-            headers={
-                "Content-Type": "application/json",
-                "Accept": "application/json",
-                "Accept-Encoding": "gzip, deflate",
-            },
-            method="POST",
-        )
-        response = urllib.request.urlopen(req, timeout=5)
-        result = json.loads(response.read().decode("utf-8"))
-        print(f"[Push] Expo API response: {json.dumps(result, ensure_ascii=False)}")
-    except Exception as e:
-        print(f"⚠️ Reminder push failed: {e}")
-
-
 def send_glucose_reminders() -> None:
     """
     Runs every REMINDER_INTERVAL_HOURS hours.
@@ -68,6 +37,10 @@ def send_glucose_reminders() -> None:
 
         user_id = user_doc.id
 
+        # Other nodes handle the patients they own
+        if not shard_membership.owns(user_id):
+            continue
+
         # Skip default reminder if user has custom reminders enabled
         reminder_settings = udata.get("reminderSettings", {})
         custom_reminders = reminder_settings.get("reminders", [])
@@ -111,7 +84,14 @@ def send_glucose_reminders() -> None:
                 f"منذ أكثر من {REMINDER_INTERVAL_HOURS} ساعات. يرجى القياس الآن."
             )
 
-        _send_push([token], title, body, {"type": "glucose_reminder"})
+        push_client.send([{
+            "to": token,
+            "title": title,
+            "body": body,
+            "data": {"type": "glucose_reminder"},
+            "sound": "default",
+            "priority": "normal",
+        }])
         save_notification(
             user_id, "glucose_reminder", title, body,
             notif_key="glucose_reminder",
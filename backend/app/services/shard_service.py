@@ -0,0 +1,140 @@
+"""
+Hash-partitioned batch jobs across worker nodes.
+
+Every API process (each uvicorn worker on each host) registers itself in
+a membership lease table — one document per member, renewed by a
+heartbeat every SHARD_LEASE_SECONDS / 3.  Members whose lease lapsed are
+considered gone.  Patients are assigned to the live members by
+rendezvous hashing of (member id, user id): each member only runs the
+batch jobs (auto-prediction, reminders) of the patients it owns, so
+batch throughput grows with the number of members.
+
+When a member joins or leaves, every node sees the new member list on
+its next heartbeat and rebalances; rendezvous hashing only moves the
+patients of the member that left, or the ~1/n share the new member
+takes over.  Opt-in with BATCH_SCHEDULING=sharded.  Until start() is
+called (leader mode, tests) a process owns every patient.
+"""
+
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable
+
+from firebase_admin import firestore
+from app.config.firebase import db
+
+MEMBERS_COLLECTION = "scheduler_members"
+
+# leader (default): one elected process runs every batch job (leader_service)
+# sharded (opt-in): every process runs the jobs of the patients it owns
+BATCH_SCHEDULING = os.getenv("BATCH_SCHEDULING", "leader")
+SHARD_LEASE_SECONDS = float(os.getenv("SHARD_LEASE_SECONDS", 30))
+SHARD_MEMBER_GC_LEASES = 10   # delete member docs expired for this many leases
+
+
+def _weight(member_id: str, user_id: str) -> int:
+    digest = hashlib.blake2b(f"{member_id}|{user_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def owner_of(user_id: str, members: list[str]) -> str | None:
+    """Rendezvous hashing: the member with the highest weight for this user."""
+    if not members:
+        return None
+    return max(members, key=lambda m: _weight(m, user_id))
+
+
+# ==========================================
+# Membership
+# ==========================================
+
+class ShardMembership:
+    """This process's entry in the membership table and its view of the live members."""
+
+    def __init__(self, lease_seconds: float = SHARD_LEASE_SECONDS):
+        self.lease_seconds = lease_seconds
+        self.member_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.members: list[str] = []
+        self._active = False
+        self._valid_until = 0.0   # monotonic end of our last renewed lease
+        self._listeners: list[Callable[[], None]] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def on_rebalance(self, listener: Callable[[], None]) -> None:
+        """Call `listener` whenever the member list changes."""
+        self._listeners.append(listener)
+
+    def owns(self, user_id: str) -> bool:
+        if not self._active:
+            return True
+        if time.monotonic() > self._valid_until:
+            return False   # our lease may have lapsed: others have taken over
+        return owner_of(user_id, self.members) == self.member_id
+
+    def heartbeat(self) -> list[str]:
+        """Renew our lease, read the live members, rebalance on change."""
+        now = time.time()
+        members_ref = db.collection(MEMBERS_COLLECTION)
+        members_ref.document(self.member_id).set({
+            "host":         socket.gethostname(),
+            "expiresEpoch": now + self.lease_seconds,
+            "renewedAt":    firestore.SERVER_TIMESTAMP,
+        })
+        self._valid_until = time.monotonic() + self.lease_seconds
+
+        live = []
+        for doc in members_ref.stream():
+            expires = doc.to_dict().get("expiresEpoch", 0)
+            if expires > now:
+                live.append(doc.id)
+            elif expires < now - SHARD_MEMBER_GC_LEASES * self.lease_seconds:
+                doc.reference.delete()
+        if self.member_id not in live:
+            live.append(self.member_id)
+        live.sort()
+
+        if live != self.members:
+            print(f"[Shards] {self.member_id}: {len(live)} member(s) — rebalancing")
+            self.members = live
+            for listener in self._listeners:
+                try:
+                    listener()
+                except Exception as e:
+                    print(f"⚠️ [Shards] rebalance listener failed: {e}")
+        return live
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"⚠️ [Shards] heartbeat failed: {e}")
+
+    def start(self) -> None:
+        self._active = True
+        try:
+            self.heartbeat()
+        except Exception as e:
+            print(f"⚠️ [Shards] heartbeat failed: {e}")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="shard-membership", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Leave the table, so the other members take over our patients right away."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.lease_seconds)
+        self._active = False
+        try:
+            db.collection(MEMBERS_COLLECTION).document(self.member_id).delete()
+        except Exception as e:
+            print(f"⚠️ [Shards] leave failed: {e}")
+
+
+shard_membership = ShardMembership()
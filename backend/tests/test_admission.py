@@ -0,0 +1,132 @@
+"""
+Tests for admission control on the expensive endpoints and for access to
+the /metrics endpoints.
+The gate is exercised directly and through a minimal FastAPI app, so no
+Firestore access is needed.
+"""
+
+from unittest.mock import patch
+
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.middleware import admission, dependencies
+from app.middleware.admission import AdmissionGate, admit
+from app.middleware.dependencies import require_metrics_token
+from tests.conftest import auth_headers
+
+
+# ==========================================
+# Gate
+# ==========================================
+
+class TestAdmissionGate:
+
+    def test_token_bucket_allows_burst_then_429(self):
+        gate = AdmissionGate("test", max_in_flight=10, rate_per_minute=60, burst=2)
+        for _ in range(2):
+            gate.enter("user_a")
+            gate.leave(0.1)
+        with pytest.raises(HTTPException) as exc:
+            gate.enter("user_a")
+        assert exc.value.status_code == 429
+        assert exc.value.headers["Retry-After"] == "1"
+        # Buckets are per user
+        gate.enter("user_b")
+        assert gate.rejected["rate_limited"] == 1
+
+    def test_in_flight_cap_fails_fast_with_503(self):
+        gate = AdmissionGate("test", max_in_flight=1, rate_per_minute=60, burst=5)
+        gate.enter("user_a")
+        with pytest.raises(HTTPException) as exc:
+            gate.enter("user_b")
+        assert exc.value.status_code == 503
+        assert int(exc.value.headers["Retry-After"]) >= 1
+        gate.leave(0.5)
+        gate.enter("user_b")   # slot freed
+        assert gate.metrics()["in_flight"] == 1
+        assert gate.rejected["overloaded"] == 1
+
+    def test_shed_request_does_not_spend_a_token(self):
+        gate = AdmissionGate("test", max_in_flight=1, rate_per_minute=1, burst=1)
+        gate.enter("user_a")
+        with pytest.raises(HTTPException):
+            gate.enter("user_b")   # 503, token returned
+        gate.leave(0.1)
+        gate.enter("user_b")
+
+
+# ==========================================
+# Dependency
+# ==========================================
+
+class TestAdmitDependency:
+
+    def test_slot_is_released_after_request_and_on_error(self):
+        gate = AdmissionGate("test", max_in_flight=1, rate_per_minute=600, burst=10)
+        seen = []
+        with patch.dict(admission.gates, {"test": gate}):
+            app = FastAPI()
+
+            @app.get("/ok", dependencies=[Depends(admit("test"))])
+            def ok():
+                seen.append(gate.in_flight)
+                return {"ok": True}
+
+            @app.get("/fail", dependencies=[Depends(admit("test"))])
+            def fail():
+                raise HTTPException(status_code=502, detail="upstream")
+
+            client = TestClient(app)
+            headers = auth_headers("patient_001", "patient")
+            assert client.get("/ok", headers=headers).status_code == 200
+            assert client.get("/fail", headers=headers).status_code == 502
+            assert client.get("/ok", headers=headers).status_code == 200
+        assert seen == [1, 1]
+        assert gate.in_flight == 0
+
+    def test_overloaded_route_answers_503_with_retry_after(self):
+        gate = AdmissionGate("test", max_in_flight=1, rate_per_minute=600, burst=10)
+        gate.enter("someone_else")   # the only slot is taken
+        with patch.dict(admission.gates, {"test": gate}):
+            app = FastAPI()
+
+            @app.get("/predict", dependencies=[Depends(admit("test"))])
+            def predict():
+                return {"ok": True}
+
+            response = TestClient(app).get(
+                "/predict", headers=auth_headers("patient_001", "patient"))
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+
+# ==========================================
+# Metrics Access
+# ==========================================
+
+class TestMetricsAccess:
+
+    def _client(self) -> TestClient:
+        app = FastAPI()
+
+        @app.get("/metrics/admission", dependencies=[Depends(require_metrics_token)])
+        def metrics():
+            return {group: gate.metrics() for group, gate in admission.gates.items()}
+
+        return TestClient(app)
+
+    def test_metrics_are_off_without_a_configured_token(self):
+        with patch.object(dependencies, "METRICS_TOKEN", ""):
+            response = self._client().get("/metrics/admission", headers={"X-Metrics-Token": ""})
+        assert response.status_code == 404
+
+    def test_metrics_require_the_token(self):
+        with patch.object(dependencies, "METRICS_TOKEN", "s3cret"):
+            client = self._client()
+            assert client.get("/metrics/admission").status_code == 403
+            assert client.get("/metrics/admission", headers=auth_headers("patient_001", "patient")).status_code == 403
+            response = client.get("/metrics/admission", headers={"X-Metrics-Token": "s3cret"})
+        assert response.status_code == 200
+        assert "predict" in response.json()
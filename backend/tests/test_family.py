@@ -303,9 +303,10 @@ class TestFamilyMemberManagement:
         mock_collection.where.return_value.stream.return_value = iter([link_doc])
 
         user_doc = MagicMock()
+        user_doc.id = FAMILY_ID
         user_doc.exists = True
         user_doc.to_dict.return_value = {"firstName": "Ma", "lastName": "Ma"}
-        mock_db.collection.return_value.document.return_value.get.return_value = user_doc
+        mock_db.get_all.return_value = [user_doc]
 
         res = client.get(
             "/family/my-members",
@@ -315,6 +316,7 @@ class TestFamilyMemberManagement:
         members = res.json()
         assert len(members) == 1
         assert members[0]["link_id"] == LINK_ID
+        assert members[0]["family_member_name"] == "Ma Ma"
 
     @patch("app.services.family_service.db")
     def test_patient_removes_family_member(self, mock_db, client):
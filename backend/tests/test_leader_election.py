@@ -0,0 +1,124 @@
+"""
+Tests for batch-job leader election and sharding.
+File-lock mode runs against a temporary lock file; the Firestore lease
+rule is tested as a pure function and the shard membership table is
+mocked, so no Firestore access is needed.
+"""
+
+import time
+from collections import Counter
+from unittest.mock import MagicMock, patch
+
+from app.services.leader_service import LeaderElector, lease_available
+from app.services.shard_service import ShardMembership, owner_of
+
+
+# ==========================================
+# Lease Rule
+# ==========================================
+
+class TestLeaseRule:
+
+    def test_free_own_and_expired_leases_can_be_taken(self):
+        assert lease_available(None, "a", now_epoch=100)
+        assert lease_available({"holder": "a", "expiresEpoch": 200}, "a", now_epoch=100)
+        assert lease_available({"holder": "b", "expiresEpoch": 90}, "a", now_epoch=100)
+
+    def test_live_lease_of_another_holder_is_respected(self):
+        assert not lease_available({"holder": "b", "expiresEpoch": 130}, "a", now_epoch=100)
+
+
+# ==========================================
+# File Lock
+# ==========================================
+
+class TestFileLockElection:
+
+    def _elector(self, lock_file, events: list, name: str) -> LeaderElector:
+        return LeaderElector(
+            "batch_jobs",
+            on_elected=lambda: events.append(f"{name}+"),
+            on_demoted=lambda: events.append(f"{name}-"),
+            mode="file", lock_file=str(lock_file),
+        )
+
+    def test_only_one_process_leads_and_failover_on_release(self, tmp_path):
+        """Exactly one elector holds the lock; the other takes over when it is released."""
+        lock_file = tmp_path / "scheduler.lock"
+        events: list = []
+        first = self._elector(lock_file, events, "first")
+        second = self._elector(lock_file, events, "second")
+
+        assert first.heartbeat() is True
+        assert second.heartbeat() is False
+        assert first.heartbeat() is True   # renewal keeps the lock
+
+        first.stop()
+        assert second.heartbeat() is True
+        assert events == ["first+", "first-", "second+"]
+        second.stop()
+
+
+# ==========================================
+# Hash-Partitioned Shards
+# ==========================================
+
+def _members_db(live: dict):
+    """Mock Firestore membership table: {member id: expiresEpoch}."""
+    mock_db = MagicMock()
+    members_ref = mock_db.collection.return_value
+
+    def stream():
+        docs = []
+        for member_id, expires in live.items():
+            doc = MagicMock()
+            doc.id = member_id
+            doc.to_dict.return_value = {"expiresEpoch": expires}
+            docs.append(doc)
+        return docs
+
+    members_ref.stream.side_effect = stream
+    return mock_db
+
+
+class TestShardPartitioning:
+
+    USERS = [f"patient_{i}" for i in range(3000)]
+
+    def test_patients_spread_evenly_over_members(self):
+        members = ["node-a", "node-b", "node-c"]
+        counts = Counter(owner_of(uid, members) for uid in self.USERS)
+        assert set(counts) == set(members)
+        assert all(800 <= n <= 1200 for n in counts.values())
+
+    def test_join_only_moves_patients_to_the_new_member(self):
+        before = {uid: owner_of(uid, ["node-a", "node-b"]) for uid in self.USERS}
+        after = {uid: owner_of(uid, ["node-a", "node-b", "node-c"]) for uid in self.USERS}
+        moved = [uid for uid in self.USERS if before[uid] != after[uid]]
+        assert all(after[uid] == "node-c" for uid in moved)
+        assert 800 <= len(moved) <= 1200
+
+    def test_members_own_disjoint_partitions_and_rebalance_on_leave(self):
+        now = time.time()
+        live = {}
+        a, b = ShardMembership(lease_seconds=30), ShardMembership(lease_seconds=30)
+        live[a.member_id] = live[b.member_id] = now + 30
+        rebalanced = []
+        a.on_rebalance(lambda: rebalanced.append("a"))
+
+        with patch("app.services.shard_service.db", _members_db(live)):
+            a._active = b._active = True
+            a.heartbeat()
+            b.heartbeat()
+            owned_a = {uid for uid in self.USERS if a.owns(uid)}
+            owned_b = {uid for uid in self.USERS if b.owns(uid)}
+            assert owned_a.isdisjoint(owned_b)
+            assert owned_a | owned_b == set(self.USERS)
+
+            live[b.member_id] = now - 1   # b's lease lapsed
+            a.heartbeat()
+        assert rebalanced == ["a", "a"]
+        assert all(a.owns(uid) for uid in self.USERS)
+
+    def test_inactive_membership_owns_everything(self):
+        assert ShardMembership().owns("patient_1")
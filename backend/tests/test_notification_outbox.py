@@ -0,0 +1,386 @@
+"""
+Tests for the durable notification outbox and its dispatcher.
+Firestore and the push client are mocked; the family fan-out builders
+are replaced with fixed deliveries.
+"""
+
+from unittest.mock import MagicMock, patch
+
+from app.services import notification_outbox as outbox
+from app.services.notification_outbox import NotificationOutbox
+
+TOKEN = "ExponentPushToken[family]"
+
+
+def _intent_doc(intent_id: str, **fields):
+    data = {
+        "kind": "emergency", "patientId": "patient_001",
+        "params": {"patient_name": None, "glucose_value": 55},
+        "status": "pending", "attempts": 0, "nextAttemptEpoch": 0, "leaseUntilEpoch": 0,
+        **fields,
+    }
+    doc = MagicMock()
+    doc.to_dict.return_value = data
+    doc.reference.id = intent_id
+    return doc
+
+
+def _outbox_db(docs: list):
+    mock_db = MagicMock()
+    query = mock_db.collection.return_value.where.return_value.where.return_value
+    query.order_by.return_value.limit.return_value.stream.return_value = docs
+    return mock_db
+
+
+class _FakeQuery:
+    """Applies where / order_by / limit to a list of docs, like Firestore would."""
+
+    OPS = {"in": lambda a, b: a in b, "<=": lambda a, b: a <= b}
+
+    def __init__(self, docs: list):
+        self.docs = docs
+
+    def where(self, field, op, value):
+        return _FakeQuery([d for d in self.docs if self.OPS[op](d.to_dict().get(field), value)])
+
+    def order_by(self, field):
+        return _FakeQuery(sorted(self.docs, key=lambda d: d.to_dict().get(field)))
+
+    def limit(self, n):
+        return _FakeQuery(self.docs[:n])
+
+    def stream(self):
+        return iter(self.docs)
+
+
+def _builder(patient_id, patient_name, glucose_value):
+    notification = {"userId": "family_001", "type": "emergency_alert", "glucoseValue": glucose_value}
+    message = {"to": TOKEN, "title": "Low", "body": str(glucose_value)}
+    return [notification], [message]
+
+
+class TestNotificationOutbox:
+
+    def test_enqueue_only_stores_an_intent(self):
+        mock_db = MagicMock()
+        builder = MagicMock()
+        with patch.object(outbox, "db", mock_db), \
+             patch.dict(outbox.OUTBOX_KINDS, {"emergency": (builder, MagicMock())}), \
+             patch.object(outbox.push_client, "send") as send:
+            NotificationOutbox().enqueue("emergency", "patient_001", patient_name=None, glucose_value=55)
+
+        intent = mock_db.collection.return_value.add.call_args[0][0]
+        assert intent["kind"] == "emergency"
+        assert intent["params"] == {"patient_name": None, "glucose_value": 55}
+        assert intent["status"] == "pending"
+        builder.assert_not_called()
+        send.assert_not_called()
+
+    def test_enqueue_failure_delivers_inline(self):
+        mock_db = MagicMock()
+        mock_db.collection.return_value.add.side_effect = RuntimeError("unavailable")
+        direct = MagicMock()
+        with patch.object(outbox, "db", mock_db), \
+             patch.dict(outbox.OUTBOX_KINDS, {"emergency": (_builder, direct)}):
+            NotificationOutbox().enqueue("emergency", "patient_001", patient_name=None, glucose_value=55)
+        direct.assert_called_once_with(patient_id="patient_001", patient_name=None, glucose_value=55)
+
+    def test_dispatch_batches_writes_and_pushes(self):
+        docs = [_intent_doc("i1"), _intent_doc("i2", params={"patient_name": "A", "glucose_value": 320})]
+        mock_db = _outbox_db(docs)
+        with patch.object(outbox, "db", mock_db), \
+             patch("app.services.notification_service.db", mock_db), \
+             patch.dict(outbox.OUTBOX_KINDS, {"emergency": (_builder, MagicMock())}), \
+             patch.object(outbox.push_client, "send",
+                          return_value=[{"status": "ok", "id": "t1"}, {"status": "ok", "id": "t2"}]) as send:
+            summary = NotificationOutbox().dispatch_once(now=1000.0)
+
+        assert summary["claimed"] == 2 and summary["delivered"] == 2
+        send.assert_called_once()   # one send for the whole batch
+        assert [m["body"] for m in send.call_args[0][0]] == ["55", "320"]
+        batch = mock_db.batch.return_value
+        assert batch.set.call_count == 2       # both notifications, one WriteBatch
+        assert batch.delete.call_count == 2    # delivered intents removed
+
+    def test_retryable_push_failure_backs_off_without_storing_twice(self):
+        docs = [_intent_doc("i1")]
+        mock_db = _outbox_db(docs)
+        failure = {"status": "error", "details": {"error": "TransportError"}}
+        with patch.object(outbox, "db", mock_db), \
+             patch("app.services.notification_service.db", mock_db), \
+             patch.dict(outbox.OUTBOX_KINDS, {"emergency": (_builder, MagicMock())}), \
+             patch.object(outbox.push_client, "send", return_value=[failure]):
+            summary = NotificationOutbox().dispatch_once(now=1000.0)
+
+        assert summary["retried"] == 1 and summary["delivered"] == 0
+        batch = mock_db.batch.return_value
+        updates = [c[0][1] for c in batch.update.call_args_list if c[0][0] is docs[0].reference]
+        assert updates[0]["claimedBy"]   # lease
+        assert updates[1] == {"status": "pushing", "messages": [_builder("p", None, 55)[1][0]]}
+        retry = updates[-1]
+        assert retry["attempts"] == 1
+        assert retry["nextAttemptEpoch"] == 1000.0 + outbox.backoff_seconds(1)
+        assert retry["messages"][0]["to"] == TOKEN
+        batch.delete.assert_not_called()
+
+        # Next round: only the push is repeated, nothing is built or stored
+        docs[0].to_dict.return_value.update(status="pushing", messages=retry["messages"], attempts=1)
+        mock_db.batch.reset_mock()
+        builder = MagicMock()
+        with patch.object(outbox, "db", mock_db), \
+             patch.dict(outbox.OUTBOX_KINDS, {"emergency": (builder, MagicMock())}), \
+             patch.object(outbox.push_client, "send", return_value=[{"status": "ok", "id": "t"}]):
+            summary = NotificationOutbox().dispatch_once(now=2000.0)
+        builder.assert_not_called()
+        assert summary["delivered"] == 1
+        mock_db.batch.return_value.set.assert_not_called()
+
+    def test_gives_up_after_max_attempts(self):
+        docs = [_intent_doc("i1", attempts=outbox.OUTBOX_MAX_ATTEMPTS - 1)]
+        mock_db = _outbox_db(docs)
+        broken = MagicMock(side_effect=RuntimeError("users unavailable"))
+        with patch.object(outbox, "db", mock_db), \
+             patch.dict(outbox.OUTBOX_KINDS, {"emergency": (broken, MagicMock())}):
+            summary = NotificationOutbox().dispatch_once(now=1000.0)
+        assert summary["failed"] == 1
+        update = docs[0].reference.update.call_args_list[-1][0][0]
+        assert update["status"] == "failed"
+
+    def test_leased_and_backed_off_intents_are_not_due(self):
+        docs = [
+            _intent_doc("leased", leaseUntilEpoch=1050),
+            _intent_doc("later", nextAttemptEpoch=1100),
+        ]
+        with patch.object(outbox, "db", _outbox_db(docs)):
+            summary = NotificationOutbox().dispatch_once(now=1000.0)
+        assert summary["claimed"] == 0
+
+    def test_due_intent_behind_many_waiting_ones_is_picked_up(self):
+        """Held / backing-off / leased intents never fill the page ahead of a due one."""
+        waiting = [_intent_doc(f"w{n}", nextAttemptEpoch=1300 + n) for n in range(3 * outbox.OUTBOX_BATCH_SIZE)]
+        waiting += [_intent_doc(f"l{n}", nextAttemptEpoch=1060, leaseUntilEpoch=1060) for n in range(5)]
+        due = _intent_doc("due", nextAttemptEpoch=900)
+        mock_db = MagicMock()
+        mock_db.collection.return_value = _FakeQuery(waiting + [due])
+        with patch.object(outbox, "db", mock_db), \
+             patch.object(NotificationOutbox, "_claim", side_effect=lambda docs, now: []) as claim:
+            NotificationOutbox().dispatch_once(now=1000.0)
+        assert claim.call_args[0][0] == [due]
+
+    def test_claim_moves_the_intent_out_of_the_due_query(self):
+        mock_db = MagicMock()
+        doc = _intent_doc("i1")
+        with patch.object(outbox, "db", mock_db):
+            NotificationOutbox()._claim([doc], now=1000.0)
+        lease = mock_db.batch.return_value.update.call_args[0][1]
+        assert lease["nextAttemptEpoch"] == lease["leaseUntilEpoch"] == 1000.0 + outbox.OUTBOX_LEASE_SECONDS
+
+    def test_idle_dispatcher_only_polls_every_poll_interval(self):
+        assert NotificationOutbox().next_wakeup(1000.0) == 1000.0 + outbox.OUTBOX_POLL_SECONDS
+        assert outbox.OUTBOX_POLL_SECONDS >= 30   # each poll is a billed read, per process
+
+    def test_wakes_at_the_retry_it_scheduled(self):
+        docs = [_intent_doc("i1")]
+        broken = MagicMock(side_effect=RuntimeError("users unavailable"))
+        box = NotificationOutbox()
+        with patch.object(outbox, "db", _outbox_db(docs)), \
+             patch.dict(outbox.OUTBOX_KINDS, {"emergency": (broken, MagicMock())}):
+            box.dispatch_once(now=1000.0)
+        assert box.next_wakeup(1000.0) == 1000.0 + outbox.backoff_seconds(1)
+
+    def test_backoff_doubles_and_is_capped(self):
+        assert outbox.backoff_seconds(2) == 2 * outbox.backoff_seconds(1)
+        assert outbox.backoff_seconds(30) == outbox.OUTBOX_BACKOFF_MAX_SECONDS
+
+
+class TestAlertCoalescing:
+
+    KEY = "patient_001:prediction_high"
+
+    def _burst(self, values: list[int]) -> list:
+        return [
+            _intent_doc(f"i{n}", kind="prediction_alert",
+                        params={"patient_name": "Ahmad", "alert_type": "high",
+                                "current": 200.0, "predicted": float(value), "hours": 1},
+                        alertClass="prediction_high", coalesceKey=self.KEY, createdEpoch=900 + n)
+            for n, value in enumerate(values)
+        ]
+
+    def test_only_advisory_alerts_get_a_window_key(self):
+        """Emergency readings and low predictions are never held."""
+        mock_db = MagicMock()
+        with patch.object(outbox, "db", mock_db):
+            box = NotificationOutbox()
+            box.enqueue("emergency", "patient_001", patient_name=None, glucose_value=260)
+            box.enqueue("emergency", "patient_001", patient_name=None, glucose_value=55)
+            box.enqueue("prediction_alert", "patient_001", patient_name="A", alert_type="low",
+                        current=90.0, predicted=60.0, hours=1)
+            box.enqueue("stale_pattern", "patient_001", patient_name="A",
+                        risk_level="high", hours_elapsed=5.0)
+            box.enqueue("prediction_alert", "patient_001", patient_name="A", alert_type="high",
+                        current=200.0, predicted=260.0, hours=1)
+        intents = [c[0][0] for c in mock_db.collection.return_value.add.call_args_list]
+        assert [i.get("coalesceKey") for i in intents] == [None, None, None, None, self.KEY]
+
+    def test_burst_is_merged_into_one_digest(self):
+        docs = self._burst([250, 240, 260])
+        docs.reverse()   # stream order is not creation order
+        mock_db = _outbox_db(docs)
+        mock_db.get_all.return_value = []   # no window open yet
+        digest = MagicMock(return_value=_builder("patient_001", "Ahmad", 260))
+        with patch.object(outbox, "db", mock_db), \
+             patch("app.services.notification_service.db", mock_db), \
+             patch.object(outbox, "digest_deliveries", digest), \
+             patch.object(outbox.push_client, "send", return_value=[{"status": "ok", "id": "t"}]) as send:
+            summary = NotificationOutbox().dispatch_once(now=1000.0)
+
+        digest.assert_called_once_with("patient_001", "Ahmad", "prediction_high", count=3, latest_value=260)
+        assert len(send.call_args[0][0]) == 1   # one push instead of three
+        assert summary["merged"] == 2 and summary["delivered"] == 1
+        batch = mock_db.batch.return_value
+        assert batch.delete.call_count == 3     # merged intents dropped with the store, then the digest's
+        window = [c[0][1] for c in batch.set.call_args_list if "openUntilEpoch" in c[0][1]]
+        assert window == [{"patientId": "patient_001",
+                           "openUntilEpoch": 1000.0 + outbox.NOTIFICATION_COALESCE_WINDOW_SECONDS}]
+
+    def test_alerts_inside_an_open_window_are_held_until_it_closes(self):
+        docs = self._burst([255])
+        mock_db = _outbox_db(docs)
+        window = MagicMock(id=self.KEY, exists=True)
+        window.to_dict.return_value = {"openUntilEpoch": 1200.0}
+        mock_db.get_all.return_value = [window]
+        builder = MagicMock()
+        with patch.object(outbox, "db", mock_db), \
+             patch.dict(outbox.OUTBOX_KINDS, {"prediction_alert": (builder, MagicMock())}), \
+             patch.object(outbox.push_client, "send") as send:
+            box = NotificationOutbox()
+            summary = box.dispatch_once(now=1000.0)
+
+        assert summary["held"] == 1 and summary["delivered"] == 0
+        with patch.object(outbox, "OUTBOX_POLL_SECONDS", 600):
+            assert box.next_wakeup(1000.0) == 1200.0   # dispatched again when the window closes
+        builder.assert_not_called()
+        send.assert_not_called()
+        mock_db.batch.return_value.update.assert_any_call(
+            docs[0].reference, {"nextAttemptEpoch": 1200.0, "leaseUntilEpoch": 0})
+
+    def test_emergency_alerts_are_pushed_even_while_a_window_is_open(self):
+        docs = [_intent_doc("low1"), _intent_doc("low2", params={"patient_name": None, "glucose_value": 52})]
+        mock_db = _outbox_db(docs)
+        with patch.object(outbox, "db", mock_db), \
+             patch("app.services.notification_service.db", mock_db), \
+             patch.dict(outbox.OUTBOX_KINDS, {"emergency": (_builder, MagicMock())}), \
+             patch.object(outbox.push_client, "send",
+                          return_value=[{"status": "ok", "id": "t1"}, {"status": "ok", "id": "t2"}]) as send:
+            summary = NotificationOutbox().dispatch_once(now=1000.0)
+
+        assert summary["held"] == 0 and summary["delivered"] == 2
+        assert [m["body"] for m in send.call_args[0][0]] == ["55", "52"]
+        mock_db.get_all.assert_not_called()   # no window lookup at all
+
+    def test_digest_text_names_count_and_latest_value(self):
+        from app.services import family_service
+        graph = {
+            "patient": None,
+            "family": [("family_001", {"pushToken": TOKEN, "language": "en"})],
+        }
+        with patch.object(family_service.recipient_cache, "get", return_value=graph):
+            notifications, messages = family_service.digest_deliveries(
+                "patient_001", "Ahmad", "prediction_high", count=3, latest_value=260)
+
+        assert messages[0]["body"] == "3 high glucose predictions for Ahmad, latest 260 mg/dL."
+        assert notifications[0]["notifKey"] == "prediction_high_digest"
+        assert notifications[0]["notifParams"] == {"name": "Ahmad", "count": 3, "value": 260}
+
+    def test_digest_titles_are_consistent_across_languages(self):
+        """Every language uses the same placeholders in title and body."""
+        import string
+        from app.services.family_service import DIGEST_TEXTS
+
+        def fields(text):
+            return {name for _, name, _, _ in string.Formatter().parse(text) if name}
+
+        for texts in DIGEST_TEXTS.values():
+            assert set(texts) == {"en", "he", "ar"}
+            for part in (0, 1):
+                assert len({frozenset(fields(t[part])) for t in texts.values()}) == 1
+
+    def test_queued_emergency_with_an_old_window_key_is_not_held(self):
+        docs = [_intent_doc("old", alertClass="glucose_low", coalesceKey="patient_001:glucose_low")]
+        mock_db = _outbox_db(docs)
+        with patch.object(outbox, "db", mock_db), \
+             patch("app.services.notification_service.db", mock_db), \
+             patch.dict(outbox.OUTBOX_KINDS, {"emergency": (_builder, MagicMock())}), \
+             patch.object(outbox.push_client, "send", return_value=[{"status": "ok", "id": "t"}]):
+            summary = NotificationOutbox().dispatch_once(now=1000.0)
+        assert summary["delivered"] == 1 and summary["held"] == 0
+
+
+class TestImportedEmergencyDigest:
+    """A LibreView sync with several dangerous readings alerts each recipient once."""
+
+    READINGS = [(260, 3), (55, 1), (190, 2), (120, 4)]   # (value, hour), not in time order
+
+    def _sync(self):
+        from datetime import datetime, timezone
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from app.routes import libreview
+        from tests.conftest import auth_headers
+
+        readings = [{"value": v, "measuredAt": datetime(2026, 3, 1, h, tzinfo=timezone.utc)}
+                    for v, h in self.READINGS]
+        app = FastAPI()
+        app.include_router(libreview.router)
+        with patch.object(libreview.libreview_service, "sync", return_value=readings), \
+             patch.object(libreview.glucose_service, "create_reading_from_import",
+                          side_effect=lambda user_id, value, measured_at: {"id": f"r{value}", "value": value}), \
+             patch.object(libreview.alert_service, "evaluate_and_store",
+                          side_effect=lambda user_id, reading_id, value: None if 70 <= value <= 180 else {"id": "a"}), \
+             patch.object(libreview.notification_outbox, "enqueue") as enqueue:
+            response = TestClient(app).post(
+                "/libreview/sync", json={"email": "p@example.com", "password": "secret"},
+                headers=auth_headers("patient_001", "patient"))
+        assert response.status_code == 200
+        return enqueue
+
+    def test_sync_queues_one_intent_for_all_dangerous_readings(self):
+        enqueue = self._sync()
+        enqueue.assert_called_once_with(
+            "emergency_digest", "patient_001", patient_name=None, glucose_values=[55, 190, 260])
+
+    def test_digest_is_one_push_per_recipient_lowest_value_first(self):
+        from app.services import family_service
+        params = self._sync().call_args[1]
+        graph = {
+            "patient": {"firstName": "Ahmad", "pushToken": "ExponentPushToken[patient]", "language": "en"},
+            "family": [("family_001", {"pushToken": TOKEN, "language": "en"}),
+                       ("family_002", {"pushToken": "ExponentPushToken[family2]", "language": "ar"})],
+        }
+        docs = [_intent_doc("sync", kind="emergency_digest", params=params)]
+        mock_db = _outbox_db(docs)
+        with patch.object(outbox, "db", mock_db), \
+             patch("app.services.notification_service.db", mock_db), \
+             patch.object(family_service.recipient_cache, "get", return_value=graph), \
+             patch.object(outbox.push_client, "send",
+                          side_effect=lambda messages: [{"status": "ok", "id": "t"}] * len(messages)) as send:
+            summary = NotificationOutbox().dispatch_once(now=1000.0)
+
+        messages = send.call_args[0][0]
+        assert sorted(m["to"] for m in messages) == sorted(
+            ["ExponentPushToken[patient]", TOKEN, "ExponentPushToken[family2]"])
+        assert messages[1]["body"] == (
+            "3 dangerous glucose readings for Ahmad, lowest 55 mg/dL. Please check immediately.")
+        assert summary["delivered"] == 1 and summary["held"] == 0
+        assert mock_db.batch.return_value.set.call_count == 3   # one stored notification each
+
+    def test_high_only_digest_reports_the_latest_value(self):
+        from app.services import family_service
+        graph = {"patient": None, "family": [("family_001", {"pushToken": TOKEN, "language": "en"})]}
+        with patch.object(family_service.recipient_cache, "get", return_value=graph):
+            notifications, messages = family_service.emergency_digest_deliveries(
+                "patient_001", "Ahmad", [250, 300, 260])
+        assert messages[0]["body"] == (
+            "3 high glucose readings for Ahmad, latest 260 mg/dL. Please check immediately.")
+        assert notifications[0]["type"] == "emergency_alert"
+        assert notifications[0]["notifKey"] == "emergency_high_digest"
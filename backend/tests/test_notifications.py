@@ -6,6 +6,10 @@ when a patient logs a dangerous glucose reading.
 
 from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.recipient_cache import recipient_cache
 from tests.conftest import auth_headers
 
 
@@ -26,6 +30,7 @@ def make_link_doc():
 def make_patient_doc_no_token():
     """Patient doc with no push token — so patient self-notification is skipped."""
     doc = MagicMock()
+    doc.id = PATIENT_ID
     doc.exists = True
     doc.to_dict.return_value = {
         "firstName": "Deema",
@@ -39,12 +44,14 @@ def make_patient_doc_no_token():
 def make_patient_doc_not_exists():
     """Patient doc that doesn't exist — skips patient notification entirely."""
     doc = MagicMock()
+    doc.id = PATIENT_ID
     doc.exists = False
     return doc
 
 
 def make_family_user_doc(token=EXPO_TOKEN):
     doc = MagicMock()
+    doc.id = FAMILY_ID
     doc.exists = True
     doc.to_dict.return_value = {
         "firstName": "Ma",
@@ -59,20 +66,25 @@ def make_family_user_doc(token=EXPO_TOKEN):
 # Emergency Notification Tests
 # ==========================================
 
+@pytest.fixture(autouse=True)
+def _fresh_recipients():
+    recipient_cache.clear()
+    yield
+    recipient_cache.clear()
+
+
 class TestEmergencyNotifications:
 
-    @patch("app.services.family_service.urllib.request.urlopen")
-    @patch("app.services.family_service.db")
-    def test_low_glucose_triggers_notification(self, mock_db, mock_urlopen):
+    @patch("app.services.push_service.push_client._post")
+    @patch("app.services.recipient_cache.db")
+    def test_low_glucose_triggers_notification(self, mock_db, mock_post):
         """Glucose < 70 triggers emergency push notification to family members."""
         link_doc = make_link_doc()
         patient_doc = make_patient_doc_no_token()
         family_user = make_family_user_doc()
 
-        # Patient doc (no token) → family doc (has token)
-        mock_db.collection.return_value.document.return_value.get.side_effect = [
-            patient_doc, family_user
-        ]
+        # Patient doc (no token) + family doc (has token), one get_all
+        mock_db.get_all.return_value = [patient_doc, family_user]
         mock_db.collection.return_value.where.return_value.stream.return_value = iter([link_doc])
 
         from app.services.family_service import send_emergency_notification
@@ -82,24 +94,21 @@ class TestEmergencyNotifications:
             glucose_value=55,
         )
 
-        mock_urlopen.assert_called_once()
-        import json
-        body = json.loads(mock_urlopen.call_args[0][0].data.decode())
+        mock_post.assert_called_once()
+        body = mock_post.call_args[0][1]
         assert body[0]["to"] == EXPO_TOKEN
         assert "LOW" in body[0]["body"]
         assert "55" in body[0]["body"]
 
-    @patch("app.services.family_service.urllib.request.urlopen")
-    @patch("app.services.family_service.db")
-    def test_high_glucose_triggers_notification(self, mock_db, mock_urlopen):
+    @patch("app.services.push_service.push_client._post")
+    @patch("app.services.recipient_cache.db")
+    def test_high_glucose_triggers_notification(self, mock_db, mock_post):
         """Glucose > 300 triggers emergency push notification."""
         link_doc = make_link_doc()
         patient_doc = make_patient_doc_no_token()
         family_user = make_family_user_doc()
 
-        mock_db.collection.return_value.document.return_value.get.side_effect = [
-            patient_doc, family_user
-        ]
+        mock_db.get_all.return_value = [patient_doc, family_user]
         mock_db.collection.return_value.where.return_value.stream.return_value = iter([link_doc])
 
         from app.services.family_service import send_emergency_notification
@@ -109,18 +118,17 @@ class TestEmergencyNotifications:
             glucose_value=350,
         )
 
-        mock_urlopen.assert_called_once()
-        import json
-        body = json.loads(mock_urlopen.call_args[0][0].data.decode())
+        mock_post.assert_called_once()
+        body = mock_post.call_args[0][1]
         assert "HIGH" in body[0]["body"]
         assert "350" in body[0]["body"]
 
-    @patch("app.services.family_service.urllib.request.urlopen")
-    @patch("app.services.family_service.db")
-    def test_no_notification_for_normal_glucose(self, mock_db, mock_urlopen):
+    @patch("app.services.push_service.push_client._post")
+    @patch("app.services.recipient_cache.db")
+    def test_no_notification_for_normal_glucose(self, mock_db, mock_post):
         """Normal glucose (70-300): patient has no token, no family → no notification."""
         patient_doc = make_patient_doc_no_token()
-        mock_db.collection.return_value.document.return_value.get.return_value = patient_doc
+        mock_db.get_all.return_value = [patient_doc]
         mock_db.collection.return_value.where.return_value.stream.return_value = iter([])
 
         from app.services.family_service import send_emergency_notification
@@ -130,14 +138,14 @@ class TestEmergencyNotifications:
             glucose_value=120,
         )
 
-        mock_urlopen.assert_not_called()
+        mock_post.assert_not_called()
 
-    @patch("app.services.family_service.urllib.request.urlopen")
-    @patch("app.services.family_service.db")
-    def test_no_notification_when_no_family_members(self, mock_db, mock_urlopen):
+    @patch("app.services.push_service.push_client._post")
+    @patch("app.services.recipient_cache.db")
+    def test_no_notification_when_no_family_members(self, mock_db, mock_post):
         """No push notification sent when patient has no token and no family members."""
         patient_doc = make_patient_doc_no_token()
-        mock_db.collection.return_value.document.return_value.get.return_value = patient_doc
+        mock_db.get_all.return_value = [patient_doc]
         mock_db.collection.return_value.where.return_value.stream.return_value = iter([])
 
         from app.services.family_service import send_emergency_notification
@@ -147,14 +155,15 @@ class TestEmergencyNotifications:
             glucose_value=55,
         )
 
-        mock_urlopen.assert_not_called()
+        mock_post.assert_not_called()
 
-    @patch("app.services.family_service.urllib.request.urlopen")
-    @patch("app.services.family_service.db")
-    def test_no_notification_when_no_push_token(self, mock_db, mock_urlopen):
+    @patch("app.services.push_service.push_client._post")
+    @patch("app.services.recipient_cache.db")
+    def test_no_notification_when_no_push_token(self, mock_db, mock_post):
         """No push notification sent when family member has no registered push token."""
         link_doc = make_link_doc()
         family_user_no_token = MagicMock()
+        family_user_no_token.id = FAMILY_ID
         family_user_no_token.exists = True
         family_user_no_token.to_dict.return_value = {
             "firstName": "Ma",
@@ -163,7 +172,7 @@ class TestEmergencyNotifications:
         }
 
         mock_db.collection.return_value.where.return_value.stream.return_value = iter([link_doc])
-        mock_db.collection.return_value.document.return_value.get.return_value = family_user_no_token
+        mock_db.get_all.return_value = [family_user_no_token]
 
         from app.services.family_service import send_emergency_notification
         send_emergency_notification(
@@ -172,20 +181,20 @@ class TestEmergencyNotifications:
             glucose_value=55,
         )
 
-        mock_urlopen.assert_not_called()
+        mock_post.assert_not_called()
 
-    @patch("app.services.family_service.urllib.request.urlopen")
-    @patch("app.services.family_service.db")
-    def test_notification_failure_does_not_crash(self, mock_db, mock_urlopen):
+    @patch("app.services.push_service.push_client._post")
+    @patch("app.services.recipient_cache.db")
+    def test_notification_failure_does_not_crash(self, mock_db, mock_post):
         """If Expo Push API fails, no exception is raised (silent failure)."""
-        import urllib.error
-        mock_urlopen.side_effect = urllib.error.URLError("Connection refused")
+        import httpx
+        mock_post.side_effect = httpx.ConnectError("Connection refused")
 
         link_doc = make_link_doc()
         family_user = make_family_user_doc()
 
         mock_db.collection.return_value.where.return_value.stream.return_value = iter([link_doc])
-        mock_db.collection.return_value.document.return_value.get.return_value = family_user
+        mock_db.get_all.return_value = [family_user]
 
         from app.services.family_service import send_emergency_notification
 
@@ -198,3 +207,79 @@ class TestEmergencyNotifications:
             )
         except Exception as e:
             assert False, f"send_emergency_notification raised an exception: {e}"
+
+    @patch("app.services.push_service.push_client._post")
+    @patch("app.services.notification_service.db")
+    @patch("app.services.recipient_cache.db")
+    def test_fan_out_round_trips_do_not_grow_with_family_size(self, mock_db, mock_notif_db, mock_post):
+        """One link query, one get_all and one batch write — however big the family."""
+        links, family = [], []
+        for i in range(5):
+            link = MagicMock()
+            link.to_dict.return_value = {"family_member_id": f"family_{i}", "patient_id": PATIENT_ID}
+            links.append(link)
+            member = make_family_user_doc(f"ExponentPushToken[member_{i}]")
+            member.id = f"family_{i}"
+            family.append(member)
+        mock_db.collection.return_value.where.return_value.stream.return_value = iter(links)
+        mock_db.get_all.return_value = [make_patient_doc_no_token(), *family]
+        mock_post.return_value = {"data": [{"status": "ok", "id": f"t{i}"} for i in range(5)]}
+
+        from app.services.family_service import send_emergency_notification
+        send_emergency_notification(patient_id=PATIENT_ID, patient_name="Deema Nimer", glucose_value=55)
+
+        mock_db.get_all.assert_called_once()
+        assert len(mock_db.get_all.call_args[0][0]) == 6   # patient + 5 members
+        mock_db.collection.return_value.document.return_value.get.assert_not_called()
+        batch = mock_notif_db.batch.return_value
+        assert batch.set.call_count == 5
+        batch.commit.assert_called_once()
+        mock_notif_db.collection.return_value.add.assert_not_called()
+        mock_post.assert_called_once()
+
+
+# ==========================================
+# Recipient Cache
+# ==========================================
+
+class TestRecipientCache:
+
+    def _db(self, token=EXPO_TOKEN):
+        mock_db = MagicMock()
+        mock_db.collection.return_value.where.return_value.stream.side_effect = \
+            lambda: iter([make_link_doc()])
+        mock_db.get_all.side_effect = lambda refs: [
+            make_patient_doc_no_token(), make_family_user_doc(token)]
+        return mock_db
+
+    @patch("app.services.push_service.push_client._post")
+    def test_repeated_alerts_do_no_reads(self, mock_post):
+        mock_db = self._db()
+        mock_post.return_value = {"data": [{"status": "ok", "id": "t"}]}
+        from app.services.family_service import emergency_deliveries
+        with patch("app.services.recipient_cache.db", mock_db):
+            for value in (55, 50, 45):
+                _, messages = emergency_deliveries(PATIENT_ID, "Deema Nimer", value)
+                assert messages[0]["to"] == EXPO_TOKEN
+        mock_db.get_all.assert_called_once()
+        assert recipient_cache.hits == 2
+
+    def test_token_update_and_unlink_invalidate(self):
+        mock_db = self._db()
+        with patch("app.services.recipient_cache.db", mock_db):
+            recipient_cache.get(PATIENT_ID)
+            recipient_cache.invalidate_user(FAMILY_ID)   # PUT /users/me/push-token
+            recipient_cache.get(PATIENT_ID)
+            recipient_cache.invalidate(PATIENT_ID)       # remove_family_member
+            recipient_cache.get(PATIENT_ID)
+            recipient_cache.get(PATIENT_ID)
+        assert mock_db.get_all.call_count == 3
+
+    def test_entries_expire_after_ttl(self):
+        from app.services.recipient_cache import RecipientCache
+        cache = RecipientCache(ttl_seconds=0)
+        mock_db = self._db()
+        with patch("app.services.recipient_cache.db", mock_db):
+            cache.get(PATIENT_ID)
+            cache.get(PATIENT_ID)
+        assert mock_db.get_all.call_count == 2
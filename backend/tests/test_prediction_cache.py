@@ -0,0 +1,91 @@
+"""
+Tests for the prediction result cache and its input watermark.
+Firestore writes of the watermark are patched out.
+"""
+
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from app.services import input_watermark_service as watermarks
+from app.services.prediction_cache import PredictionResultCache
+
+RESULT = {"predicted_value": 142.0, "hours": 1, "trend": "stable", "alert_type": None}
+
+
+def _bump(user_id: str) -> None:
+    with patch.object(watermarks, "db", MagicMock()):
+        watermarks.bump_input_watermark(user_id)
+
+
+class TestPredictionResultCache:
+
+    def test_hit_until_new_data_arrives(self):
+        cache = PredictionResultCache(ttl_seconds=60)
+        cache.put("p1", 1, "en", watermarks.current_watermark("p1"), RESULT)
+
+        hit = cache.get("p1", 1, "en")
+        assert hit == {**RESULT, "cached": True}
+        assert cache.get("p1", 2, "en") is None   # other horizon
+        assert cache.get("p1", 1, "ar") is None   # other language
+
+        _bump("p1")   # e.g. GlucoseService.create_reading
+        assert cache.get("p1", 1, "en") is None
+
+    def test_write_during_computation_invalidates_result(self):
+        """The watermark is taken before computing, so a concurrent write wins."""
+        cache = PredictionResultCache(ttl_seconds=60)
+        before = watermarks.current_watermark("p2")
+        _bump("p2")
+        cache.put("p2", 1, "en", before, RESULT)
+        assert cache.get("p2", 1, "en") is None
+
+    def test_remote_write_seen_through_listener_invalidates(self):
+        cache = PredictionResultCache(ttl_seconds=60)
+        cache.put("p3", 1, "en", watermarks.current_watermark("p3"), RESULT)
+        change = SimpleNamespace(
+            type=SimpleNamespace(name="MODIFIED"),
+            document=SimpleNamespace(id="p3", to_dict=lambda: {"version": 7}),
+        )
+        watermarks._on_snapshot([], [change], None)
+        assert cache.get("p3", 1, "en") is None
+
+    def test_entries_expire_after_ttl(self):
+        cache = PredictionResultCache(ttl_seconds=0.05)
+        cache.put("p4", 1, "en", watermarks.current_watermark("p4"), RESULT)
+        time.sleep(0.1)
+        assert cache.get("p4", 1, "en") is None
+
+    def test_hit_is_sub_millisecond(self):
+        cache = PredictionResultCache(ttl_seconds=60)
+        cache.put("p5", 1, "en", watermarks.current_watermark("p5"), RESULT)
+        start = time.perf_counter()
+        for _ in range(1000):
+            cache.get("p5", 1, "en")
+        assert (time.perf_counter() - start) / 1000 < 1e-3
+
+
+class TestProfileWritesBumpWatermark:
+    """Profile fields read by predict() must invalidate cached predictions too."""
+
+    def test_health_info_update_invalidates(self):
+        from app.models.health import HealthInfoUpdate
+        from app.services import health_service
+
+        cache = PredictionResultCache(ttl_seconds=60)
+        cache.put("p6", 1, "en", watermarks.current_watermark("p6"), RESULT)
+        with patch.object(health_service, "firestore"), patch.object(watermarks, "db", MagicMock()):
+            health_service.HealthService().update_health_info(
+                "p6", HealthInfoUpdate(conditions=["hypertension"], insulin_sensitivity=45))
+        assert cache.get("p6", 1, "en") is None
+
+    def test_lifestyle_update_invalidates(self):
+        import asyncio
+        from app.routes import user_routes
+
+        cache = PredictionResultCache(ttl_seconds=60)
+        cache.put("p7", 1, "en", watermarks.current_watermark("p7"), RESULT)
+        with patch.object(user_routes, "db", MagicMock()), patch.object(watermarks, "db", MagicMock()):
+            asyncio.run(user_routes.update_lifestyle_info(
+                {"sleepHours": 6, "activityLevel": "high"}, current_user={"sub": "p7"}))
+        assert cache.get("p7", 1, "en") is None
@@ -0,0 +1,207 @@
+"""
+Tests for the pure-NumPy LSTM engine used by the prediction service.
+No Firestore access is needed; the Keras comparison is skipped when
+TensorFlow is not installed.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+from app.services.lstm_engine import (
+    NumpyLSTM, adaptive_batch_size, augmented_batches, fit_head, head_forward, load_keras_weights, random_weights,
+    rollout_with_predict,
+)
+from app.services.model_store import ModelStore
+
+BASE_MODEL_PATH = Path(__file__).parent.parent / "models" / "base_model.keras"
+
+
+def make_head(seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return (
+        rng.normal(0, 0.2, (64, 16)).astype(np.float32),
+        np.zeros(16, dtype=np.float32),
+        rng.normal(0, 0.2, (16, 1)).astype(np.float32),
+        np.zeros(1, dtype=np.float32),
+    )
+
+
+# ==========================================
+# Head-only Fine-tuning
+# ==========================================
+
+class TestHeadFinetune:
+
+    def test_fit_head_reduces_weighted_error(self):
+        """Fitting the Dense head on cached embeddings lowers the training MSE."""
+        rng = np.random.default_rng(1)
+        emb = rng.normal(0, 1, (200, 64)).astype(np.float32)
+        y = (0.3 + 0.05 * emb[:, 0] - 0.03 * emb[:, 1]).astype(np.float32)
+        w = np.ones(200, dtype=np.float32)
+        start = make_head()
+
+        before = np.mean((head_forward(emb, *start) - y) ** 2)
+        fitted = fit_head(emb, y, w, start, epochs=15, lr=5e-4)
+        after = np.mean((head_forward(emb, *fitted) - y) ** 2)
+
+        assert after < before
+        assert all(p.dtype == np.float32 for p in fitted)
+
+    def test_fit_head_does_not_mutate_start_weights(self):
+        """The base-model head passed in is left untouched."""
+        rng = np.random.default_rng(2)
+        emb = rng.normal(0, 1, (40, 64)).astype(np.float32)
+        y = rng.uniform(0.1, 0.5, 40).astype(np.float32)
+        start = make_head()
+        snapshot = [p.copy() for p in start]
+
+        fit_head(emb, y, np.ones(40, dtype=np.float32), start, epochs=3, lr=5e-4)
+
+        for p, s in zip(start, snapshot):
+            np.testing.assert_array_equal(p, s)
+
+    def test_early_stopping_and_time_budget(self):
+        """Noisy targets stop before max epochs; a zero budget stops after one epoch."""
+        rng = np.random.default_rng(8)
+        emb = rng.normal(0, 1, (120, 64)).astype(np.float32)
+        y = rng.uniform(0.1, 0.5, 120).astype(np.float32)
+        w = np.ones(100, dtype=np.float32)
+
+        _, stats = fit_head(
+            emb[:100], y[:100], w, make_head(), epochs=200, lr=5e-3,
+            val=(emb[100:], y[100:]), patience=2, return_stats=True)
+        assert stats["stopped_early"] and stats["epochs"] < 200
+
+        _, stats = fit_head(
+            emb[:100], y[:100], w, make_head(), epochs=50, lr=5e-4,
+            time_budget=0.0, return_stats=True)
+        assert stats["epochs"] == 1 and stats["stopped_early"]
+
+    def test_adaptive_batch_size_scales_with_dataset(self):
+        assert adaptive_batch_size(25, 8, 256, 100) == 8
+        assert adaptive_batch_size(3200, 8, 256, 100) == 32
+        assert adaptive_batch_size(10**6, 8, 256, 100) == 256
+
+    def test_augmented_batches_cover_every_copy_once_per_epoch(self):
+        """One epoch = each window `copies` times, exactly one clean copy each."""
+        X = np.arange(10 * 12 * 6, dtype=np.float32).reshape(10, 12, 6)
+        y = np.arange(10, dtype=np.float32)
+        batches = augmented_batches(X, y, np.ones(10, np.float32), copies=3, batch_size=8)
+
+        seen_clean, seen_total = np.zeros(10, int), np.zeros(10, int)
+        for _ in range(4):   # ceil(30 / 8) batches per epoch
+            xb, yb, _ = next(batches)
+            rows = yb.astype(int)
+            clean = np.all(xb == X[rows], axis=(1, 2))
+            np.add.at(seen_total, rows, 1)
+            np.add.at(seen_clean, rows[clean], 1)
+
+        assert seen_total.tolist() == [3] * 10
+        assert seen_clean.tolist() == [1] * 10
+
+    def test_fit_head_empty_dataset_returns_start(self):
+        """No training windows → the starting head is returned unchanged."""
+        start = make_head()
+        fitted = fit_head(
+            np.zeros((0, 64), np.float32), np.zeros(0, np.float32),
+            np.zeros(0, np.float32), start, epochs=5, lr=5e-4,
+        )
+        for p, s in zip(fitted, start):
+            np.testing.assert_array_equal(p, s)
+
+
+# ==========================================
+# NumPy Inference Backend
+# ==========================================
+
+class TestNumpyBackend:
+
+    def test_load_base_weights_without_tensorflow(self):
+        """base_model.keras is read via h5py into Keras-ordered arrays."""
+        weights = load_keras_weights(BASE_MODEL_PATH)
+        shapes = [w.shape for w in weights]
+        assert shapes == [(6, 256), (64, 256), (256,), (64, 16), (16,), (16, 1), (1,)]
+
+    def test_predict_shape_and_embed_shape(self):
+        """Batch of windows → one prediction and one 64-dim embedding each."""
+        engine = NumpyLSTM(random_weights())
+        X = np.random.default_rng(3).uniform(0, 1, (7, 12, 6)).astype(np.float32)
+        assert engine.embed(X).shape == (7, 64)
+        assert engine.predict(X).shape == (7,)
+
+    def test_single_pass_rollout_matches_step_by_step(self):
+        """The projected-input rollout equals re-predicting each step from scratch."""
+        engine = NumpyLSTM(load_keras_weights(BASE_MODEL_PATH))
+        rng = np.random.default_rng(6)
+        window = rng.uniform(0, 1, (12, 6)).astype(np.float32)
+        context = window[-1, 2:].copy()
+
+        fast = engine.rollout(window, 24, 13.5, context)
+        slow = rollout_with_predict(engine.predict, window, 24, 13.5, context)
+
+        assert fast.shape == (24,)
+        np.testing.assert_allclose(fast, slow, atol=1e-5)
+
+    def test_matches_keras_within_tolerance(self):
+        """NumPy recurrence reproduces tf.keras output for the base model."""
+        pytest.importorskip("tensorflow")
+        from app.services.lstm_engine import max_abs_diff_vs_keras
+
+        weights = load_keras_weights(BASE_MODEL_PATH)
+        X = np.random.default_rng(4).uniform(0, 1, (32, 12, 6)).astype(np.float32)
+        assert max_abs_diff_vs_keras(weights, X) < 1e-4
+
+
+# ==========================================
+# Model Store
+# ==========================================
+
+class TestModelStore:
+
+    def test_persisted_model_is_rehydrated_after_restart(self, tmp_path):
+        """A new store instance (restart / fork) lazily loads weights from disk."""
+        engine = NumpyLSTM(random_weights(seed=5))
+        ModelStore(tmp_path, 10 * 1024 * 1024).put(
+            "patient_a", engine, sigma=12.5, fingerprint="abc", n_readings=40)
+
+        entry = ModelStore(tmp_path, 10 * 1024 * 1024).get("patient_a")
+
+        assert entry["sigma"] == 12.5
+        assert entry["fingerprint"] == "abc"
+        assert entry["n_readings"] == 40
+        for a, b in zip(entry["model"].get_weights(), engine.get_weights()):
+            np.testing.assert_array_equal(a, b)
+
+    def test_memory_is_bounded_by_byte_budget(self, tmp_path):
+        """Least recently used models are evicted once the budget is exceeded."""
+        engine = NumpyLSTM(random_weights())
+        store = ModelStore(tmp_path, max_bytes=int(engine.nbytes * 2.5))
+
+        for uid in ("p1", "p2", "p3"):
+            store.put(uid, NumpyLSTM(random_weights()), 1.0, uid, 10)
+
+        assert store.memory_bytes <= int(engine.nbytes * 2.5)
+        assert store._memory.get("p1") is None
+        # Evicted from memory, still available from disk
+        assert store.get("p1")["fingerprint"] == "p1"
+
+    def test_concurrent_writers_never_publish_a_partial_file(self, tmp_path):
+        """Each put writes its own temp file, so racing writers can't corrupt the .npz."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        def write(seed):
+            ModelStore(tmp_path, 10 * 1024 * 1024).put(
+                "patient_a", NumpyLSTM(random_weights(seed=seed)), 1.0, f"fp{seed}", 10)
+
+        with ThreadPoolExecutor(4) as pool:
+            list(pool.map(write, range(8)))
+
+        entry = ModelStore(tmp_path, 10 * 1024 * 1024).get("patient_a")
+        seed = int(entry["fingerprint"][2:])
+        for a, b in zip(entry["model"].get_weights(), random_weights(seed=seed)):
+            np.testing.assert_array_equal(a, b)
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["patient_a.npz"]   # no temp files left
+
+    def test_unknown_patient_returns_none(self, tmp_path):
+        assert ModelStore(tmp_path, 1024).get("nobody") is None
@@ -0,0 +1,341 @@
+"""
+Tests for the prediction executor (patient → worker routing).
+Runs in inline mode with the job function patched, so no worker
+processes or Firestore access are needed.
+"""
+
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from app.services.prediction_executor import PredictionExecutor
+
+
+def fake_run(method: str, kwargs: dict):
+    return {"method": method, "thread": threading.current_thread().name, **kwargs}
+
+
+# ==========================================
+# Routing
+# ==========================================
+
+class TestPredictionExecutor:
+
+    def test_same_patient_always_uses_same_worker(self):
+        """A patient's jobs land on one worker, so its caches stay warm."""
+        executor = PredictionExecutor(workers=4, mode="inline")
+        with patch("app.services.prediction_executor._run", fake_run):
+            threads = {
+                executor.submit("predict", "patient_a", hours=h).result()["thread"]
+                for h in (1, 2, 3)
+            }
+        executor.shutdown()
+        assert len(threads) == 1
+
+    def test_run_awaits_result_with_arguments(self):
+        executor = PredictionExecutor(workers=2, mode="inline")
+        with patch("app.services.prediction_executor._run", fake_run):
+            result = asyncio.run(executor.run("predict_trajectory", "patient_b"))
+        executor.shutdown()
+        assert result["method"] == "predict_trajectory"
+        assert result["user_id"] == "patient_b"
+
+
+# ==========================================
+# Single-Flight Coalescing
+# ==========================================
+
+class TestSingleFlight:
+
+    def _blocking_run(self, release: threading.Event, calls: list):
+        def run(method, kwargs):
+            calls.append(kwargs["user_id"])
+            release.wait(5)
+            return {"user_id": kwargs["user_id"], "call": len(calls)}
+        return run
+
+    def test_identical_concurrent_jobs_share_one_computation(self):
+        """Patient + family + scheduler asking at once → one prediction."""
+        release, calls = threading.Event(), []
+        executor = PredictionExecutor(workers=2, mode="inline")
+        with patch("app.services.prediction_executor._run", self._blocking_run(release, calls)):
+            futures = [executor.submit("predict", "patient_a", hours=1, lang="en") for _ in range(3)]
+            other = executor.submit("predict", "patient_a", hours=2, lang="en")
+            release.set()
+            results = [f.result(timeout=5) for f in futures]
+            other.result(timeout=5)
+            # Finished jobs are not reused: a later call computes again
+            executor.submit("predict", "patient_a", hours=1, lang="en").result(timeout=5)
+        executor.shutdown()
+
+        assert calls == ["patient_a"] * 3   # 1 shared + hours=2 + later call
+        assert results[0] == results[1] == results[2]
+        assert executor.coalesced == 2
+
+    def test_cancelling_one_caller_does_not_cancel_the_shared_job(self):
+        release, calls = threading.Event(), []
+        executor = PredictionExecutor(workers=1, mode="inline")
+        with patch("app.services.prediction_executor._run", self._blocking_run(release, calls)):
+            busy = executor.submit("predict", "patient_x")   # occupies the only worker
+            first = executor.submit("predict", "patient_b")
+            second = executor.submit("predict", "patient_b")
+            assert first.cancel()
+            release.set()
+            assert second.result(timeout=5)["user_id"] == "patient_b"
+            busy.result(timeout=5)
+        executor.shutdown()
+        assert first.cancelled()
+        assert calls == ["patient_x", "patient_b"]
+
+
+# ==========================================
+# Priority Lanes
+# ==========================================
+
+class TestPriorityLanes:
+
+    def _recording_run(self, release: threading.Event, calls: list):
+        def run(method, kwargs):
+            calls.append(kwargs["user_id"])
+            release.wait(5)
+            return kwargs["user_id"]
+        return run
+
+    def test_interactive_jobs_overtake_queued_batch_jobs(self):
+        release, calls = threading.Event(), []
+        executor = PredictionExecutor(workers=1, mode="inline")
+        with patch("app.services.prediction_executor._run", self._recording_run(release, calls)):
+            batch = [executor.submit("predict", f"batch_{i}", lane="batch") for i in range(3)]
+            interactive = executor.submit("predict", "app_user")
+            assert executor.metrics()["lanes"]["batch"]["queued"] == 2
+            assert executor.metrics()["lanes"]["interactive"]["queued"] == 1
+            release.set()
+            for future in [*batch, interactive]:
+                future.result(timeout=5)
+        executor.shutdown()
+        # batch_0 was already running; the interactive job goes next
+        assert calls == ["batch_0", "app_user", "batch_1", "batch_2"]
+
+    def test_interactive_caller_promotes_queued_batch_job(self):
+        release, calls = threading.Event(), []
+        executor = PredictionExecutor(workers=1, mode="inline")
+        with patch("app.services.prediction_executor._run", self._recording_run(release, calls)):
+            busy = executor.submit("predict", "busy", lane="batch")
+            queued = [executor.submit("predict", f"batch_{i}", lane="batch") for i in range(2)]
+            joined = executor.submit("predict", "batch_1")   # same job, from the app
+            release.set()
+            for future in [busy, *queued, joined]:
+                future.result(timeout=5)
+        executor.shutdown()
+        assert calls == ["busy", "batch_1", "batch_0"]
+        assert executor.coalesced == 1
+
+    def test_batch_capacity_yields_to_interactive_load(self):
+        release, calls = threading.Event(), []
+        executor = PredictionExecutor(workers=4, mode="inline")
+        assert executor.batch_capacity(8) == 4
+        assert executor.batch_capacity(2) == 2
+        with patch("app.services.prediction_executor._run", self._recording_run(release, calls)):
+            users = [f"user_{i}" for i in range(40)]
+            shards = {executor._shard(uid): uid for uid in users}
+            futures = [executor.submit("predict", uid) for uid in list(shards.values())[:3]]
+            assert executor.batch_capacity(8) == 1
+            release.set()
+            for future in futures:
+                future.result(timeout=5)
+        executor.shutdown()
+        assert executor.batch_capacity(8) == 4
+
+    def test_wait_metrics_and_slo_breaches(self):
+        release, calls = threading.Event(), []
+        executor = PredictionExecutor(workers=1, mode="inline")
+        with patch("app.services.prediction_executor._run", self._recording_run(release, calls)), \
+             patch("app.services.prediction_executor.PREDICTION_INTERACTIVE_SLO_SECONDS", 0.05):
+            first = executor.submit("predict", "a")
+            second = executor.submit("predict", "b")
+            time.sleep(0.1)
+            release.set()
+            first.result(timeout=5)
+            second.result(timeout=5)
+            # The second request waited behind the first: over the SLO
+            assert executor.batch_capacity(1) == 0
+        executor.shutdown()
+
+        metrics = executor.metrics()
+        lane = metrics["lanes"]["interactive"]
+        assert lane["submitted"] == 2 and lane["queued"] == 0 and lane["running"] == 0
+        assert lane["wait_max_s"] >= 0.1
+        assert metrics["slo_breaches"] == 1
+        assert metrics["lanes"]["batch"]["wait_p95_s"] is None
+
+
+# ==========================================
+# Auto-Prediction Run
+# ==========================================
+
+def _patient_docs(n: int):
+    docs = []
+    for i in range(n):
+        doc = MagicMock()
+        doc.id = f"patient_{i}"
+        doc.exists = True
+        doc.to_dict.return_value = {
+            "role": "patient", "firstName": "P", "lastName": str(i), "language": "en",
+        }
+        docs.append(doc)
+    return docs
+
+
+def _watermarks(n: int) -> dict:
+    """patient_0 has only stale readings, everyone else has new inputs."""
+    now = time.time()
+    marks = {
+        f"patient_{i}": {"version": 3, "predictedVersion": 2, "lastReadingEpoch": now - 600}
+        for i in range(n)
+    }
+    marks["patient_0"]["lastReadingEpoch"] = now - 7 * 3600
+    return marks
+
+
+class TestAutoPredictionScheduler:
+
+    def _tick(self, n_patients: int, job, marks: dict | None = None, scheduler=None,
+              now: float | None = None, **config):
+        from app.services import auto_prediction_service as auto
+
+        config.setdefault("AUTO_PREDICTION_CONCURRENCY", 4)
+        marks = marks if marks is not None else _watermarks(n_patients)
+        docs = {doc.id: doc for doc in _patient_docs(n_patients)}
+        mock_db = MagicMock()
+        mock_db.collection.return_value.document.side_effect = lambda uid: uid
+        mock_db.get_all.side_effect = lambda refs: [docs[uid] for uid in refs]
+        executor = PredictionExecutor(workers=4, mode="inline")
+        self.recorded = {}
+        self.scheduler = scheduler or auto.AutoPredictionScheduler()
+        with patch.object(auto, "db", mock_db), \
+             patch.object(auto, "prediction_executor", executor), \
+             patch.object(auto, "load_watermarks", return_value=marks), \
+             patch.object(auto, "record_prediction",
+                          lambda uid, version, at: self.recorded.update({uid: version})), \
+             patch("app.services.prediction_executor._run", job), \
+             patch.multiple(auto, **config):
+            summary = self.scheduler.tick(now)
+        executor.shutdown()
+        return summary
+
+    def test_concurrency_is_bounded_and_summary_counts(self):
+        """Never more than AUTO_PREDICTION_CONCURRENCY jobs in flight."""
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def job(method, kwargs):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.02)
+            with lock:
+                state["running"] -= 1
+            if kwargs["user_id"] == "patient_3":
+                raise RuntimeError("boom")
+
+        summary = self._tick(8, job, AUTO_PREDICTION_CONCURRENCY=2)
+        assert state["peak"] <= 2
+        assert summary["due"] == 8
+        assert summary["skipped_unchanged"] == 1
+        assert summary["submitted"] == 7
+        assert summary["succeeded"] == 6
+        assert summary["failed"] == 1
+        assert summary["patient_max_s"] >= summary["patient_avg_s"] > 0
+
+    def test_slow_patient_times_out(self):
+        def job(method, kwargs):
+            time.sleep(0.5 if kwargs["user_id"] == "patient_1" else 0.01)
+
+        summary = self._tick(
+            3, job, AUTO_PREDICTION_PATIENT_TIMEOUT_SECONDS=0.1,
+        )
+        assert summary["timed_out"] == 1
+        assert summary["succeeded"] == 1
+
+    def test_batch_deadline_stops_submitting(self):
+        def job(method, kwargs):
+            time.sleep(0.2)
+
+        summary = self._tick(
+            6, job, AUTO_PREDICTION_CONCURRENCY=1,
+            AUTO_PREDICTION_RUN_DEADLINE_MINUTES=0.05 / 60,
+        )
+        assert summary["submitted"] == 1
+        assert summary["skipped_deadline"] == 5
+        # Abandoned patients stay due for the next tick
+        assert all(self.scheduler._due[f"patient_{i}"] <= time.time() for i in range(1, 6))
+
+    def test_only_changed_or_expired_patients_run(self):
+        """Unchanged patients with a fresh result are not re-predicted."""
+        now = time.time()
+        marks = {
+            "patient_0": {"version": 5, "predictedVersion": 5, "predictedEpoch": now - 60,
+                          "lastReadingEpoch": now - 60},      # up to date
+            "patient_1": {"version": 6, "predictedVersion": 5, "predictedEpoch": now - 60,
+                          "lastReadingEpoch": now - 60},      # new inputs
+            "patient_2": {"version": 5, "predictedVersion": 5, "predictedEpoch": now - 4 * 3600,
+                          "lastReadingEpoch": now - 3600},    # result expired
+        }
+        ran = []
+        summary = self._tick(3, lambda method, kwargs: ran.append(kwargs["user_id"]), marks)
+        assert sorted(ran) == ["patient_1", "patient_2"]
+        assert (summary["changed"], summary["expired"], summary["skipped_unchanged"]) == (1, 1, 1)
+        assert self.recorded == {"patient_1": 6, "patient_2": 5}
+
+    def test_cadence_follows_risk_of_last_prediction(self):
+        """An alerting patient is due again within minutes, a stable one in hours."""
+        from app.services.auto_prediction_service import AUTO_PREDICTION_CADENCE_MINUTES
+
+        def job(method, kwargs):
+            if kwargs["user_id"] == "patient_1":
+                return {"predicted_value": 62.0, "alert_type": "low",
+                        "risk": {"sigma": 12.0, "slope_per_hour": -25.0, "time_in_range": 0.8}}
+            return {"predicted_value": 120.0, "alert_type": None,
+                    "risk": {"sigma": 10.0, "slope_per_hour": 2.0, "time_in_range": 0.95}}
+
+        now = time.time()
+        self._tick(3, job, now=now)
+        due = self.scheduler._due
+        urgent = AUTO_PREDICTION_CADENCE_MINUTES["urgent"] * 60
+        stable = AUTO_PREDICTION_CADENCE_MINUTES["stable"] * 60
+        assert now + urgent - 5 <= due["patient_1"] <= time.time() + urgent
+        assert now + stable - 5 <= due["patient_2"] <= time.time() + stable
+
+        # Nobody is due again yet: the next tick does no work
+        assert self._tick(3, job, scheduler=self.scheduler, now=now + 60) is None
+
+    def test_risk_tiers(self):
+        from app.services.auto_prediction_service import risk_tier
+
+        def result(predicted, sigma=10.0, slope=0.0, tir=0.9, alert=None):
+            return {"predicted_value": predicted, "alert_type": alert,
+                    "risk": {"sigma": sigma, "slope_per_hour": slope, "time_in_range": tir}}
+
+        assert risk_tier(result(190.0, alert="high")) == "urgent"
+        assert risk_tier(result(85.0, sigma=20.0)) == "elevated"
+        assert risk_tier(result(130.0, slope=45.0)) == "elevated"
+        assert risk_tier(result(130.0, tir=0.5)) == "moderate"
+        assert risk_tier(result(130.0)) == "stable"
+        assert risk_tier({"predicted_value": None}) == "stable"
+
+    def test_only_patients_owned_by_this_node_run(self):
+        from app.services import auto_prediction_service as auto
+
+        ran = []
+        with patch.object(auto.shard_membership, "owns", lambda uid: uid != "patient_2"):
+            self._tick(4, lambda method, kwargs: ran.append(kwargs["user_id"]))
+        assert sorted(ran) == ["patient_1", "patient_3"]
+        assert "patient_2" not in self.scheduler._due
+
+    def test_skips_while_previous_batch_in_progress(self):
+        from app.services.auto_prediction_service import AutoPredictionScheduler
+
+        scheduler = AutoPredictionScheduler()
+        with scheduler._lock:
+            assert scheduler.tick() is None
@@ -0,0 +1,286 @@
+"""
+Tests for the columnar preprocessing used by the prediction service.
+Pure NumPy — no Firestore access is needed.  The reference functions
+below are the original per-reading loops; the columnar versions must
+reproduce them on the LibreLink CSV fixtures in the repository root.
+"""
+
+import csv
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pytest
+from app.services.pattern_profile import PatternProfile
+from app.services.prediction_features import (
+    build_feature_matrix, context_features, global_slope, last_meal_spike,
+    log_context_arrays, outlier_sources, readings_to_columns, to_epoch_us,
+)
+
+T0 = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+CSV_FIXTURES = sorted((Path(__file__).parent.parent.parent).glob("test_glucose_*_trend*.csv"))
+CGM_MAX_CHANGE, MANUAL_MAX_CHANGE = 50, 80
+
+
+def load_librelink_csv(path: Path, source: str | None = None) -> list[dict]:
+    """Parse a LibreLink export the same way POST /glucose/import-csv does."""
+    readings = []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in list(csv.reader(f))[2:]:
+            if len(row) < 5 or row[3].strip() not in ("0", "1"):
+                continue
+            record_type = int(row[3])
+            raw_value = row[4] if record_type == 0 else row[5]
+            if not raw_value.strip():
+                continue
+            measured_at = datetime.strptime(row[2].strip(), "%d-%m-%Y %H:%M").replace(
+                tzinfo=timezone(timedelta(hours=3))).astimezone(timezone.utc)
+            readings.append({
+                "value": int(round(float(raw_value))),
+                "measuredAt": measured_at,
+                "source": source or ("csv_cgm" if record_type == 0 else "csv_scan"),
+            })
+    return readings
+
+
+def fixture_variants(path: Path) -> list[list[dict]]:
+    """The fixture as-is, as CGM data, and with injected spikes / drops."""
+    base = load_librelink_csv(path)
+    spiky = [dict(r) for r in base]
+    for i in range(3, len(spiky), 5):
+        spiky[i]["value"] += 120 if i % 2 else -90
+    gap = [dict(r) for r in base]
+    for r in gap[len(gap) // 2:]:
+        r["measuredAt"] += timedelta(hours=3)
+    gap[len(gap) // 2]["value"] += 150
+    return [base, load_librelink_csv(path, source="csv_cgm"), spiky, gap]
+
+
+def reference_remove_outliers(readings):
+    cleaned = [readings[0]]
+    for current in readings[1:]:
+        prev = cleaned[-1]
+        is_cgm = current.get("source") in ("libreview", "csv_cgm")
+        base_max = CGM_MAX_CHANGE if is_cgm else MANUAL_MAX_CHANGE
+        prev_ts, curr_ts = prev.get("measuredAt"), current.get("measuredAt")
+        if prev_ts and curr_ts:
+            hours_gap = abs((curr_ts - prev_ts).total_seconds()) / 3600
+            max_change = base_max * max(1.0, hours_gap / 0.5)
+        else:
+            max_change = base_max
+        if abs(current["value"] - prev["value"]) > max_change:
+            cleaned.append({**current, "value": prev["value"]})
+        else:
+            cleaned.append(current)
+    return cleaned
+
+
+def reference_slope(values):
+    n = len(values)
+    x_mean, y_mean = (n - 1) / 2, sum(values) / n
+    num = sum((i - x_mean) * (values[i] - y_mean) for i in range(n))
+    den = sum((i - x_mean) ** 2 for i in range(n))
+    return num / den if den else 0.0
+
+
+def reference_last_meal(readings, now):
+    for i in range(len(readings) - 3, -1, -1):
+        v0 = readings[i]["value"]
+        for step, threshold, confidence in ((2, 40, "high"), (4, 25, "medium")):
+            if i + step < len(readings) and readings[i + step]["value"] - v0 > threshold:
+                hours_ago = (now - readings[i]["measuredAt"]).total_seconds() / 3600.0
+                if hours_ago <= 24:
+                    return {"hours_ago": round(hours_ago, 1), "confidence": confidence}
+    return None
+
+
+def reference_pattern_window(readings, now, current_hour, days=30, half_width=1.5):
+    """(values, weighted_avg) exactly as the original pattern scan selected them."""
+    values, weighted_sum, total_weight = [], 0.0, 0.0
+    for r in readings:
+        ts = r["measuredAt"]
+        if ts < now - timedelta(days=days):
+            continue
+        d = abs(ts.hour + ts.minute / 60.0 - current_hour)
+        if min(d, 24.0 - d) <= half_width:
+            weight = 1.0 / (max(0.0, (now - ts).total_seconds() / 86400) + 1.0)
+            values.append(float(r["value"]))
+            weighted_sum += r["value"] * weight
+            total_weight += weight
+    return values, (weighted_sum / total_weight if total_weight else None)
+
+
+def reference_context(ts, log_ctx, sleep_baseline):
+    """Per-reading loop the vectorized builder replaces."""
+    if ts is None:
+        return 12.0, 0.0, 0.0, 0.0, sleep_baseline
+    start_2h, start_30m = ts - timedelta(hours=2), ts - timedelta(minutes=30)
+    c30 = sum(m["carbs"] for m in log_ctx["meals"] if start_30m <= m["ts"] <= ts)
+    c2h = sum(m["carbs"] for m in log_ctx["meals"] if start_2h <= m["ts"] < start_30m)
+    act = sum(a["minutes"] for a in log_ctx["activities"] if start_2h <= a["ts"] <= ts)
+    past_sleep = [s for s in log_ctx["sleep_logs"] if s["ts"] <= ts]
+    sleep = past_sleep[-1]["hours"] if past_sleep else sleep_baseline
+    return ts.hour + ts.minute / 60.0, c30, c2h, act, sleep
+
+
+# ==========================================
+# Context Features
+# ==========================================
+
+class TestContextFeatures:
+
+    def test_window_boundaries_match_reference(self):
+        """Events exactly on the 30 min / 2 h edges land in the same window as before."""
+        log_ctx = {
+            "meals": [
+                {"ts": T0 - timedelta(minutes=30), "carbs": 10.0},   # 30-min window (inclusive)
+                {"ts": T0 - timedelta(hours=2), "carbs": 20.0},      # 2-h window (inclusive start)
+                {"ts": T0, "carbs": 5.0},                            # 30-min window (inclusive end)
+                {"ts": T0 + timedelta(minutes=1), "carbs": 99.0},    # future → ignored
+            ],
+            "activities": [{"ts": T0 - timedelta(hours=2), "minutes": 30.0}],
+            "sleep_logs": [{"ts": T0 - timedelta(hours=5), "hours": 6.5}],
+        }
+        ctx = context_features(
+            np.array([to_epoch_us(T0)]), np.array([True]),
+            log_context_arrays(log_ctx), sleep_baseline=7.0,
+        )
+        np.testing.assert_array_equal(ctx[0], [15.0, 20.0, 30.0, 6.5])
+
+    def test_matrix_matches_per_reading_loop(self):
+        """Randomized readings/logs give exactly the per-reading loop's matrix."""
+        rng = np.random.default_rng(7)
+        readings = [
+            {"measuredAt": T0 + timedelta(minutes=15 * i + int(rng.integers(0, 4))),
+             "value": int(rng.integers(60, 300))}
+            for i in range(400)
+        ]
+        readings[10]["measuredAt"] = None
+
+        def events(key):
+            return [{"ts": T0 + timedelta(minutes=15 * int(rng.integers(0, 420))),
+                     key: float(rng.integers(1, 90))} for _ in range(60)]
+
+        log_ctx = {"meals": events("carbs"), "activities": events("minutes"),
+                   "sleep_logs": sorted(events("hours"), key=lambda s: s["ts"])}
+
+        expected = np.array(
+            [[r["value"], *reference_context(r["measuredAt"], log_ctx, 7.5)] for r in readings],
+            dtype=np.float32,
+        )
+        got = build_feature_matrix(
+            readings_to_columns(readings), log_context_arrays(log_ctx), 7.5)
+
+        assert got.shape == (400, 6)
+        np.testing.assert_array_equal(got, expected)
+
+    def test_no_logs_uses_sleep_baseline(self):
+        """Empty daily logs → zero carbs/activity and the profile sleep baseline."""
+        readings = [{"measuredAt": T0, "value": 120}]
+        empty = {"meals": [], "activities": [], "sleep_logs": []}
+        got = build_feature_matrix(readings_to_columns(readings), log_context_arrays(empty), 8.0)
+        np.testing.assert_array_equal(got[0], [120.0, 12.0, 0.0, 0.0, 0.0, 8.0])
+
+
+# ==========================================
+# Outliers, Trend, Meal Detection (CSV fixtures)
+# ==========================================
+
+@pytest.fixture(params=CSV_FIXTURES, ids=lambda p: p.stem)
+def fixture_path(request):
+    return request.param
+
+
+class TestColumnarPreprocessing:
+
+    def test_fixtures_present(self):
+        assert len(CSV_FIXTURES) == 2
+
+    def test_outlier_cleaning_matches_loop(self, fixture_path):
+        """Same cleaned values as the sequential loop, incl. gap-scaled limits."""
+        for readings in fixture_variants(fixture_path):
+            sources = outlier_sources(
+                readings_to_columns(readings), CGM_MAX_CHANGE, MANUAL_MAX_CHANGE)
+            got = [readings[j]["value"] for j in sources]
+            assert got == [r["value"] for r in reference_remove_outliers(readings)]
+
+    def test_global_slope_matches_loop(self, fixture_path):
+        """Equal up to float summation order (pairwise vs. sequential)."""
+        for readings in fixture_variants(fixture_path):
+            values = [r["value"] for r in readings]
+            got = global_slope(readings_to_columns(readings)["value"])
+            assert got == pytest.approx(reference_slope(values), rel=1e-12, abs=1e-12)
+
+    def test_meal_detection_matches_loop(self, fixture_path):
+        """Most recent spike, confidence and hours_ago agree at several "now" points."""
+        for readings in fixture_variants(fixture_path):
+            columns = readings_to_columns(readings)
+            last = readings[-1]["measuredAt"]
+            for now in (last, last + timedelta(hours=5), last + timedelta(hours=23)):
+                assert last_meal_spike(columns, to_epoch_us(now)) == \
+                    reference_last_meal(readings, now)
+
+    def test_meal_detection_ignores_spikes_older_than_24h(self):
+        """The rise starts at the 2nd reading (T0 + 15 min); >24 h later it is ignored."""
+        readings = [{"measuredAt": T0 + timedelta(minutes=15 * i), "value": v}
+                    for i, v in enumerate([100, 100, 150, 150, 150, 150])]
+        columns = readings_to_columns(readings)
+        assert last_meal_spike(columns, to_epoch_us(T0 + timedelta(hours=2, minutes=15))) == \
+            {"hours_ago": 2.0, "confidence": "high"}
+        assert last_meal_spike(columns, to_epoch_us(T0 + timedelta(hours=30))) is None
+
+
+# ==========================================
+# Pattern Profile
+# ==========================================
+
+def random_history(n_days: int = 40, seed: int = 3) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    start = T0 - timedelta(days=n_days)
+    readings = []
+    for i in range(n_days * 96):
+        ts = start + timedelta(minutes=15 * i + int(rng.integers(0, 15)),
+                               seconds=int(rng.integers(0, 60)))
+        readings.append({"measuredAt": ts, "value": int(rng.integers(50, 320))})
+    return readings
+
+
+class TestPatternProfile:
+
+    def test_window_matches_original_scan(self):
+        """Same samples (incl. around midnight) and the same weighted mean."""
+        readings = random_history()
+        profile = PatternProfile(30)
+        now_us = to_epoch_us(T0)
+        profile.sync(readings_to_columns(readings), now_us)
+
+        for current_hour in (0.0, 0.75, 7.25, 12.0, 23.5, 23.9833):
+            values, days_ago = profile.window(current_hour, 1.5, now_us, 30)
+            ref_values, ref_avg = reference_pattern_window(readings, T0, current_hour)
+            assert sorted(values.tolist()) == sorted(ref_values)
+            weights = 1.0 / (days_ago + 1.0)
+            assert np.dot(values, weights) / weights.sum() == pytest.approx(ref_avg, rel=1e-12)
+
+    def test_incremental_sync_equals_rebuild(self):
+        """Merging new readings + expiring old ones gives the from-scratch profile."""
+        readings = random_history()
+        profile = PatternProfile(30)
+        profile.sync(readings_to_columns(readings[:2000]), to_epoch_us(T0 - timedelta(days=19)))
+        rebuilt = profile.sync(readings_to_columns(readings), to_epoch_us(T0))
+
+        fresh = PatternProfile(30)
+        fresh.sync(readings_to_columns(readings), to_epoch_us(T0))
+        assert not rebuilt
+        for hour in (3.0, 18.5):
+            got = profile.window(hour, 1.5, to_epoch_us(T0), 30)
+            want = fresh.window(hour, 1.5, to_epoch_us(T0), 30)
+            assert sorted(got[0].tolist()) == sorted(want[0].tolist())
+
+    def test_deleted_reading_triggers_rebuild(self):
+        readings = random_history()
+        profile = PatternProfile(30)
+        profile.sync(readings_to_columns(readings), to_epoch_us(T0))
+        del readings[-100]
+        assert profile.sync(readings_to_columns(readings), to_epoch_us(T0))
+        assert len(profile) == sum(
+            r["measuredAt"] >= T0 - timedelta(days=30) for r in readings)
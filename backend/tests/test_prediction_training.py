@@ -0,0 +1,220 @@
+"""
+Tests for how the prediction service obtains and reuses a patient's model
+(full refit, incremental warm-start, stored model), the trajectory cache,
+and the /glucose/predict/trajectory route.
+The model store lives in a temp directory and the base weights are random,
+so no Firestore access or base_model.keras is needed; the route is mounted
+on a minimal app with the prediction executor mocked.
+"""
+
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.models.prediction import TrajectoryResponse
+from app.routes import prediction as prediction_routes
+from app.services import prediction_service as ps
+from app.services.lstm_engine import NumpyLSTM, random_weights
+from app.services.model_store import ByteLRU, ModelStore
+from app.services.prediction_service import PredictionService
+from tests.conftest import auth_headers
+
+USER = "patient_001"
+
+
+def feature_matrix(n: int, seed: int = 0) -> np.ndarray:
+    """Hourly readings (glucose, hour, carbs 30m, carbs 2h, activity, sleep)."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n)
+    glucose = 140 + 40 * np.sin(t / 8) + rng.normal(0, 5, n)
+    zeros = np.zeros(n)
+    return np.stack(
+        [glucose, (t % 24).astype(float), zeros, zeros, zeros, np.full(n, 7.0)], axis=1,
+    ).astype(np.float32)
+
+
+@pytest.fixture
+def service(tmp_path):
+    """PredictionService with fresh, isolated model / embedding / trajectory caches."""
+    with patch.object(PredictionService, "_model_store", ModelStore(tmp_path, 64 * 1024 * 1024)), \
+         patch.object(PredictionService, "_embedding_cache", ByteLRU(
+             64 * 1024 * 1024, size_fn=lambda e: e["scaled"].nbytes + e["emb"].nbytes)), \
+         patch.object(PredictionService, "_trajectory_cache", ByteLRU(
+             1024 * 1024, size_fn=lambda e: e["trajectory"].nbytes + 128)), \
+         patch.object(PredictionService, "_base_weights", random_weights(seed=1)), \
+         patch.object(ps, "firestore"):
+        yield PredictionService()
+
+
+# ==========================================
+# Incremental (warm-start) Fine-tuning
+# ==========================================
+
+class TestIncrementalUpdate:
+
+    def test_new_readings_on_a_stored_model_warm_start(self, service):
+        """A few appended readings update the stored model instead of refitting."""
+        history = feature_matrix(230)
+        _, _, first = service._predict_lstm_trajectory(history[:200], USER)
+        assert first["source"] == "full_refit"
+
+        with patch.object(service, "_finetune_head", wraps=service._finetune_head) as refit:
+            _, _, training = service._predict_lstm_trajectory(history[:210], USER)
+
+        assert training["source"] == "incremental"
+        refit.assert_not_called()
+        entry = PredictionService._model_store.get(USER)
+        assert entry["n_readings"] == 210
+        assert entry["updates_since_refit"] == 1
+
+    def test_changed_history_forces_full_refit(self, service):
+        """Old rows that no longer match the stored fingerprint cannot be warm-started."""
+        history = feature_matrix(230)
+        service._predict_lstm_trajectory(history[:200], USER)
+
+        edited = history[:210].copy()
+        edited[50, 0] += 30.0   # e.g. a reading was corrected or deleted
+        _, _, training = service._predict_lstm_trajectory(edited, USER)
+        assert training["source"] == "full_refit"
+
+    def test_too_many_new_rows_forces_full_refit(self, service):
+        history = feature_matrix(200 + ps.INCREMENTAL_MAX_NEW_ROWS + 1)
+        service._predict_lstm_trajectory(history[:200], USER)
+        _, _, training = service._predict_lstm_trajectory(history, USER)
+        assert training["source"] == "full_refit"
+
+    def test_every_nth_update_is_a_full_refit(self, service):
+        """FULL_REFIT_EVERY caps drift: the next update after the cap refits from base."""
+        history = feature_matrix(230)
+        with patch.object(ps, "FULL_REFIT_EVERY", 2):
+            sources = [
+                service._predict_lstm_trajectory(history[:n], USER)[2]["source"]
+                for n in (200, 205, 210, 215, 220)
+            ]
+        assert sources == ["full_refit", "incremental", "incremental", "full_refit", "incremental"]
+        assert PredictionService._model_store.get(USER)["updates_since_refit"] == 1
+
+    def test_incremental_output_shape_and_sigma(self, service):
+        """Warm-started model gives a full trajectory; sigma blends old and new error."""
+        history = feature_matrix(230)
+        service._predict_lstm_trajectory(history[:200], USER)
+        previous = PredictionService._model_store.get(USER)
+        old_sigma, old_model = previous["sigma"], previous["model"]
+
+        scaled = PredictionService._normalise(history[:210])
+        X = np.array([scaled[i: i + ps.SEQUENCE_LENGTH] for i in range(210 - ps.SEQUENCE_LENGTH)])
+        y = scaled[ps.SEQUENCE_LENGTH:, 0]
+        first_new = 200 - ps.SEQUENCE_LENGTH
+        new_rmse = float(np.sqrt(np.mean(
+            ((np.clip(old_model.predict(X[first_new:]), 0.0, 1.0) - y[first_new:])
+             * (ps.GLUCOSE_MAX - ps.GLUCOSE_MIN)) ** 2)))
+
+        trajectory, sigma, training = service._predict_lstm_trajectory(history[:210], USER)
+
+        assert training["source"] == "incremental"
+        assert trajectory.shape == (ps.MAX_HORIZON_HOURS,)
+        assert np.all((trajectory >= ps.GLUCOSE_MIN) & (trajectory <= ps.GLUCOSE_MAX))
+        assert sigma >= 1.0
+        assert min(old_sigma, new_rmse) - 1e-6 <= sigma <= max(old_sigma, new_rmse) + 1e-6
+
+    def test_can_update_incrementally_rules(self, service):
+        history = feature_matrix(230)
+        service._predict_lstm_trajectory(history[:200], USER)
+        entry = PredictionService._model_store.get(USER)
+        scaled = PredictionService._normalise(history[:210])
+
+        assert PredictionService._can_update_incrementally(entry, scaled)
+        assert not PredictionService._can_update_incrementally(None, scaled)
+        assert not PredictionService._can_update_incrementally(entry, scaled[:200])   # nothing new
+        assert not PredictionService._can_update_incrementally(
+            {**entry, "updates_since_refit": ps.FULL_REFIT_EVERY}, scaled)
+        assert not PredictionService._can_update_incrementally(
+            {**entry, "fingerprint": "other"}, scaled)
+
+
+# ==========================================
+# Trajectory Cache
+# ==========================================
+
+class TestTrajectoryCache:
+
+    def test_same_inputs_and_seed_hit_the_cache(self, service):
+        history = feature_matrix(200)
+        seed = history[-ps.SEQUENCE_LENGTH:].copy()
+        first, sigma, _ = service._predict_lstm_trajectory(history, USER, seed_override=seed)
+
+        with patch.object(NumpyLSTM, "rollout") as rollout:
+            again, again_sigma, training = service._predict_lstm_trajectory(
+                history.copy(), USER, seed_override=seed.copy())
+
+        rollout.assert_not_called()
+        assert training["source"] == "cache"
+        np.testing.assert_array_equal(again, first)
+        assert again_sigma == sigma
+
+    def test_changed_seed_misses_the_cache(self, service):
+        history = feature_matrix(200)
+        seed = history[-ps.SEQUENCE_LENGTH:].copy()
+        service._predict_lstm_trajectory(history, USER, seed_override=seed)
+
+        seed[-1, 0] += 40.0   # e.g. a newer manual reading
+        _, _, training = service._predict_lstm_trajectory(history, USER, seed_override=seed)
+        assert training["source"] == "stored"   # model reused, trajectory recomputed
+
+    def test_changed_features_miss_the_cache(self, service):
+        history = feature_matrix(205)
+        service._predict_lstm_trajectory(history[:200], USER)
+        _, _, training = service._predict_lstm_trajectory(history, USER)
+        assert training["source"] != "cache"
+
+
+# ==========================================
+# GET /glucose/predict/trajectory
+# ==========================================
+
+TRAJECTORY = {
+    "prediction_mode": "real_time", "current_value": 150.0, "sigma": 18.5,
+    "readings_used": 120, "data_stale": False, "hours_since_last_reading": 0.3,
+    "points": [{"hours": h, "predicted_value": 150.0 + h, "trend": "rising"}
+               for h in range(1, ps.MAX_HORIZON_HOURS + 1)],
+    "training": {"source": "cache", "mode": "head"},
+}
+
+
+class TestTrajectoryRoute:
+
+    def _client(self) -> TestClient:
+        app = FastAPI()
+        app.include_router(prediction_routes.router)
+        return TestClient(app)
+
+    def test_patient_gets_the_full_curve(self):
+        run = AsyncMock(return_value=TRAJECTORY)
+        with patch.object(prediction_routes.prediction_executor, "run", run):
+            response = self._client().get(
+                "/glucose/predict/trajectory", headers=auth_headers(USER, "patient"))
+
+        assert response.status_code == 200
+        run.assert_awaited_once_with("predict_trajectory", user_id=USER)
+        body = response.json()
+        assert set(body) == set(TrajectoryResponse.model_fields)
+        assert [p["hours"] for p in body["points"]] == list(range(1, ps.MAX_HORIZON_HOURS + 1))
+        assert body["sigma"] == 18.5 and body["training"]["source"] == "cache"
+
+    def test_not_enough_data_returns_empty_points(self):
+        empty = {"prediction_mode": "none", "readings_used": 3, "points": []}
+        with patch.object(prediction_routes.prediction_executor, "run", AsyncMock(return_value=empty)):
+            body = self._client().get(
+                "/glucose/predict/trajectory", headers=auth_headers(USER, "patient")).json()
+        assert body["points"] == [] and body["current_value"] is None
+
+    def test_family_member_is_rejected(self):
+        run = AsyncMock()
+        with patch.object(prediction_routes.prediction_executor, "run", run):
+            response = self._client().get(
+                "/glucose/predict/trajectory", headers=auth_headers("family_001", "family_member"))
+        assert response.status_code == 403
+        run.assert_not_called()
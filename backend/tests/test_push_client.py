@@ -0,0 +1,117 @@
+"""
+Tests for the shared Expo push client.
+The HTTP transport (_post) and the users collection are mocked, so no
+network or Firestore access is needed.
+"""
+
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from app.services.push_service import (
+    EXPO_PUSH_URL, EXPO_RECEIPTS_URL, ExpoPushClient, is_retryable,
+)
+
+
+def _messages(n: int) -> list[dict]:
+    return [{"to": f"ExponentPushToken[t{i}]", "title": "T", "body": "B"} for i in range(n)]
+
+
+def _ok_tickets(chunk: list[dict]) -> dict:
+    return {"data": [{"status": "ok", "id": f"ticket-{m['to']}"} for m in chunk]}
+
+
+class TestExpoPushClient:
+
+    def test_messages_are_chunked_and_sent_concurrently(self):
+        client = ExpoPushClient(concurrency=3)
+        sizes, threads = [], set()
+
+        def post(url, payload):
+            sizes.append(len(payload))
+            threads.add(threading.current_thread().name)
+            time.sleep(0.05)
+            return _ok_tickets(payload)
+
+        with patch.object(client, "_post", side_effect=post):
+            tickets = client.send(_messages(250))
+        assert sorted(sizes) == [50, 100, 100]
+        assert len(threads) == 3
+        assert len(tickets) == 250
+        assert client.stats["sent"] == 250
+
+    def test_invalid_tokens_are_skipped_before_sending(self):
+        client = ExpoPushClient()
+        with patch.object(client, "_post") as post:
+            assert client.send([{"to": ""}, {"to": "not-a-token"}]) == []
+        post.assert_not_called()
+
+    def test_unregistered_device_in_ticket_prunes_token(self):
+        client = ExpoPushClient()
+        user_doc = MagicMock()
+        mock_db = MagicMock()
+        mock_db.collection.return_value.where.return_value.stream.return_value = [user_doc]
+        response = {"data": [
+            {"status": "ok", "id": "ticket-1"},
+            {"status": "error", "message": "not registered",
+             "details": {"error": "DeviceNotRegistered"}},
+        ]}
+        with patch.object(client, "_post", return_value=response), \
+             patch("app.services.push_service.db", mock_db):
+            client.send(_messages(2))
+
+        mock_db.collection.return_value.where.assert_called_once_with(
+            "pushToken", "==", "ExponentPushToken[t1]")
+        user_doc.reference.update.assert_called_once_with({"pushToken": ""})
+        assert client.stats == {"sent": 1, "failed": 1, "pruned": 1}
+
+    def test_receipts_are_fetched_and_errors_prune_tokens(self):
+        client = ExpoPushClient()
+        mock_db = MagicMock()
+        mock_db.collection.return_value.where.return_value.stream.return_value = [MagicMock()]
+
+        def post(url, payload):
+            if url == EXPO_PUSH_URL:
+                return _ok_tickets(payload)
+            assert url == EXPO_RECEIPTS_URL
+            return {"data": {
+                "ticket-ExponentPushToken[t0]": {"status": "ok"},
+                "ticket-ExponentPushToken[t1]": {
+                    "status": "error", "details": {"error": "DeviceNotRegistered"}},
+                # t2: receipt not ready yet
+            }}
+
+        with patch.object(client, "_post", side_effect=post), \
+             patch("app.services.push_service.db", mock_db):
+            client.send(_messages(3))
+            summary = client.check_receipts(min_age_seconds=0)
+
+        assert summary == {"checked": 2, "ok": 1, "errors": 1}
+        assert list(client._tickets) == ["ticket-ExponentPushToken[t2]"]   # retried next round
+        assert client.stats["pruned"] == 1
+
+    def test_transport_failure_is_not_raised(self):
+        client = ExpoPushClient()
+        with patch.object(client, "_post", side_effect=OSError("connection refused")):
+            tickets = client.send(_messages(2))
+        assert [t["details"]["error"] for t in tickets] == ["TransportError"] * 2
+        assert all(is_retryable(t) for t in tickets)
+        assert client.stats["failed"] == 2
+
+    def test_missing_tickets_are_filled_with_transport_errors(self):
+        """Fewer tickets than messages: one ticket per message still, in order."""
+        client = ExpoPushClient(concurrency=2)
+
+        def post(url, payload):
+            if payload[0]["to"] == "ExponentPushToken[t0]":
+                return {"data": _ok_tickets(payload)["data"][:98]}   # 2 tickets short
+            return {}                                                 # no "data" at all
+
+        with patch.object(client, "_post", side_effect=post):
+            tickets = client.send(_messages(150))
+
+        assert len(tickets) == 150
+        assert [t["status"] for t in tickets[:98]] == ["ok"] * 98
+        assert tickets[97]["id"] == "ticket-ExponentPushToken[t97]"
+        assert all(is_retryable(t) for t in tickets[98:])
+        assert client.stats == {"sent": 98, "failed": 52, "pruned": 0}
@@ -550,6 +550,15 @@ const resources = {
       notif_prediction_low_rising_family_body: "{{name}}'s glucose is {{current}} mg/dL and may rise to {{predicted}} mg/dL in {{hours}}h.",
       notif_prediction_sensor_family_title: "⚠️ Sensor Error",
       notif_prediction_sensor_family_body: "A suspicious reading was detected for {{name}}.",
+      // Alert digests (coalesced advisory bursts, imported emergency readings)
+      notif_prediction_high_digest_title: "⬆️ {{count}} High Glucose Predictions",
+      notif_prediction_high_digest_body: "{{count}} high glucose predictions for {{name}}, latest {{value}} mg/dL.",
+      notif_prediction_sensor_digest_title: "⚠️ {{count}} Sensor Warnings",
+      notif_prediction_sensor_digest_body: "{{count}} suspicious readings were detected for {{name}}.",
+      notif_emergency_high_digest_title: "⚠️ {{count}} High Glucose Readings",
+      notif_emergency_high_digest_body: "{{count}} high glucose readings for {{name}}, latest {{value}} mg/dL. Please check immediately.",
+      notif_emergency_low_digest_title: "⚠️ {{count}} Dangerous Glucose Readings",
+      notif_emergency_low_digest_body: "{{count}} dangerous glucose readings for {{name}}, lowest {{value}} mg/dL. Please check immediately.",
 
       // Delete
       deleteReading: "Delete Reading",
@@ -1201,6 +1210,15 @@ const resources = {
       notif_prediction_low_rising_family_body: "سكر {{name}} الحالي {{current}} mg/dL ومتوقع يرتفع ل {{predicted}} mg/dL خلال {{hours}} ساعة.",
       notif_prediction_sensor_family_title: "⚠️ خطأ في المستشعر",
       notif_prediction_sensor_family_body: "تم رصد قراءة مشبوهة للمريض {{name}}.",
+      // Alert digests (coalesced advisory bursts, imported emergency readings)
+      notif_prediction_high_digest_title: "⬆️ {{count}} توقعات ارتفاع السكر",
+      notif_prediction_high_digest_body: "{{count}} توقعات ارتفاع السكر للمريض {{name}}، آخرها {{value}} mg/dL.",
+      notif_prediction_sensor_digest_title: "⚠️ {{count}} تحذيرات المستشعر",
+      notif_prediction_sensor_digest_body: "تم رصد {{count}} قراءات مشبوهة للمريض {{name}}.",
+      notif_emergency_high_digest_title: "⚠️ {{count}} قراءات سكر مرتفع",
+      notif_emergency_high_digest_body: "{{count}} قراءات سكر مرتفع للمريض {{name}}، آخرها {{value}} mg/dL. يرجى اتخاذ الإجراء اللازم فوراً.",
+      notif_emergency_low_digest_title: "⚠️ {{count}} قراءات سكر خطيرة",
+      notif_emergency_low_digest_body: "{{count}} قراءات سكر خطيرة للمريض {{name}}، أدناها {{value}} mg/dL. يرجى اتخاذ الإجراء اللازم فوراً.",
 
       // Delete
       deleteReading: "حذف القراءة",
@@ -1852,6 +1870,15 @@ const resources = {
       notif_prediction_low_rising_family_body: "הסוכר של {{name}} הוא {{current}} mg/dL ועשוי לעלות ל‑{{predicted}} mg/dL תוך {{hours}}ש'.",
       notif_prediction_sensor_family_title: "⚠️ שגיאת חיישן",
       notif_prediction_sensor_family_body: "זוהתה קריאה חשודה עבור {{name}}.",
+      // Alert digests (coalesced advisory bursts, imported emergency readings)
+      notif_prediction_high_digest_title: "⬆️ {{count}} תחזיות סוכר גבוה",
+      notif_prediction_high_digest_body: "{{count}} תחזיות סוכר גבוה עבור {{name}}, האחרונה {{value}} mg/dL.",
+      notif_prediction_sensor_digest_title: "⚠️ {{count}} אזהרות חיישן",
+      notif_prediction_sensor_digest_body: "זוהו {{count}} קריאות חשודות עבור {{name}}.",
+      notif_emergency_high_digest_title: "⚠️ {{count}} קריאות סוכר גבוה",
+      notif_emergency_high_digest_body: "{{count}} קריאות סוכר גבוה עבור {{name}}, האחרונה {{value}} mg/dL. אנא בדוק מיד.",
+      notif_emergency_low_digest_title: "⚠️ {{count}} קריאות סוכר מסוכנות",
+      notif_emergency_low_digest_body: "{{count}} קריאות סוכר מסוכנות עבור {{name}}, הנמוכה {{value}} mg/dL. אנא בדוק מיד.",
 
       // Delete
       deleteReading: "מחק קריאה",